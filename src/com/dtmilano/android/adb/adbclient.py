@@ -20,12 +20,19 @@ limitations under the License.
 
 from __future__ import print_function
 
+import codecs
+import collections
+import select
+import shlex
 import subprocess
 import threading
 import unicodedata
+import uuid
+import zlib
 from typing import Optional
 
 from com.dtmilano.android.adb.dumpsys import Dumpsys
+from com.dtmilano.android.adb.sync import SyncConnection
 
 __version__ = '25.0.0'
 
@@ -50,7 +57,7 @@ import re
 import os
 import platform
 
-from com.dtmilano.android.window import Window
+from com.dtmilano.android.window import Window, parseWindows
 from com.dtmilano.android.common import _nd, _nh, _ns, obtainPxPy, obtainVxVy, \
     obtainVwVh, profileStart, profileEnd
 from com.dtmilano.android.adb.androidkeymap import KEY_MAP
@@ -62,8 +69,10 @@ DEBUG_LOG = DEBUG and False
 DEBUG_WINDOWS = DEBUG and False
 DEBUG_COORDS = DEBUG and False
 DEBUG_IMAGE_ROTATION = DEBUG and False
+DEBUG_POOL = DEBUG and False
 
 PIL_AVAILABLE = False
+NUMPY_AVAILABLE = False
 PROFILE = False
 
 try:
@@ -85,12 +94,36 @@ DOWN_AND_UP = 2
 
 TIMEOUT = 15
 
+TRANSPORT_POOL_SIZE = 2
+''' Number of idle transport sockets kept by each AdbClient, 0 disables the pool '''
+TRANSPORT_POOL_MAX_BACKOFF = 5
+
+SHELL_V2_STDIN = 0
+SHELL_V2_STDOUT = 1
+SHELL_V2_STDERR = 2
+SHELL_V2_EXIT = 3
+SHELL_V2_CLOSE_STDIN = 4
+SHELL_V2_WINDOW_SIZE_CHANGE = 5
+''' Shell protocol v2 packet ids '''
+
+SHELL_CHUNK_SIZE = 64 * 1024
+
 WIFI_SERVICE = b'wifi'
 
 # some device properties
 VERSION_SDK_PROPERTY = 'ro.build.version.sdk'
 VERSION_RELEASE_PROPERTY = 'ro.build.version.release'
 
+INSTALL_TMP_DIR = '/data/local/tmp'
+''' Directory where APKs are pushed before installing them '''
+
+PROPERTY_CACHE_TTL = 300
+''' Seconds the device properties obtained by C{getprop} are cached, C{None} caches them until invalidated '''
+
+CACHED_PROPERTY_PREFIXES = ('ro.',)
+''' Properties that cannot change while the device runs, the only ones L{AdbClient.getProperty} obtains from the
+    cache, any other one can be changed by C{setprop} or by a service and is always obtained from the device '''
+
 
 class Device:
     """
@@ -195,7 +228,7 @@ class Timer:
     def cancel(self):
         self.timer.cancel()
 
-    class TimeoutException(Exception):
+    class TimeoutException(socket.timeout):
         pass
 
 
@@ -224,6 +257,330 @@ def connect(hostname, port, timeout=TIMEOUT):
     return s
 
 
+def openTransport(serialno, hostname=HOSTNAME, port=PORT, timeout=TIMEOUT, connect=connect):
+    """
+    Connects to the ADB server and sets the transport to the device.
+
+    :param serialno: the device serial number, it should be already resolved (not a regexp)
+    :param hostname: the ADB server hostname
+    :param port: the ADB server port
+    :param timeout: the timeout in seconds
+    :param connect: the connect function
+    :return: the socket bound to the device transport
+    """
+    s = connect(hostname, port, timeout)
+    try:
+        msg = bytearray('host:transport:%s' % serialno, 'utf-8')
+        s.sendall(b'%04X%s' % (len(msg), msg))
+        recv = s.recv(4)
+        if recv != OKAY:
+            raise RuntimeError("ERROR: setting transport to %s: %s %s" % (serialno, repr(recv), s.recv(1024)))
+    except:
+        s.close()
+        raise
+    return s
+
+
+LOGICAL_DISPLAY_RE = re.compile(
+    r'.*DisplayViewport\{.*valid=true, .*orientation=(?P<orientation>\d+), .*deviceWidth=(?P<width>\d+), '
+    r'deviceHeight=(?P<height>\d+).*')
+''' Matches the default viewport in C{dumpsys display} '''
+PREDICTED_ROTATION_RE = re.compile(r'.*mPredictedRotation=(?P<rotation>\d).*')
+SURFACE_ORIENTATION_RE = re.compile(r'SurfaceOrientation:\s+(?P<orientation>\d)')
+''' Matches the orientation of the touch screen in C{dumpsys input} '''
+
+GETPROP_RE = re.compile(r'^\[(?P<key>[^\]]*)\]: \[(?P<value>.*)\]$', re.MULTILINE | re.DOTALL)
+
+
+def parseGetprop(output):
+    """
+    Parses the output of C{getprop}, lines like C{[key]: [value]}. Values can span several lines.
+
+    :param output: the output
+    :return: the dict of properties
+    """
+    properties = {}
+    entry = None
+    for line in output.splitlines():
+        entry = line if entry is None else entry + '\n' + line
+        m = GETPROP_RE.match(entry)
+        if m:
+            properties[m.group('key')] = m.group('value')
+            entry = None
+        elif not entry.startswith('['):
+            entry = None
+    return properties
+
+
+FRAMEBUFFER_HEADER_SIZE = 1 * 4 + 12 * 4
+''' Size of the version 1 C{framebuffer:} header, version 2 adds the colorspace '''
+
+
+def decodeFramebufferHeader(received):
+    """
+    Decodes the header sent by the C{framebuffer:} service.
+
+    case 1: // version
+              return 12; // bpp, size, width, height, 4*(length, offset)
+    case 2: // version
+              return 13; // bpp, colorSpace, size, width, height, 4*(length, offset)
+
+    :param received: the header, L{FRAMEBUFFER_HEADER_SIZE} bytes or 4 more if version is 2
+    :return: the tuple (version, bpp, size, width, height, mode, argMode, channels) where mode and argMode are the
+             PIL modes for C{Image.frombuffer} and channels the order of the components in memory (i.e. C{RGBA})
+    """
+    if len(received) == FRAMEBUFFER_HEADER_SIZE + 4:
+        (version, bpp, colorspace, size, width, height, roffset, rlen, boffset, blen, goffset, glen, aoffset,
+         alen) = struct.unpack('<' + 'L' * 14, received)
+    else:
+        (version, bpp, size, width, height, roffset, rlen, boffset, blen, goffset, glen, aoffset, alen) = \
+            struct.unpack('<' + 'L' * 13, received)
+    if DEBUG:
+        print("    decodeFramebufferHeader:", (
+            version, bpp, size, width, height, roffset, rlen, boffset, blen, goffset, glen, aoffset, alen),
+              file=sys.stderr)
+    if version not in (1, 2):
+        print("    decodeFramebufferHeader: unknown version", version, file=sys.stderr)
+
+    offsets = {roffset: 'R', goffset: 'G', boffset: 'B'}
+    if bpp == 32:
+        if alen != 0:
+            offsets[aoffset] = 'A'
+        else:
+            warnings.warn('''framebuffer is specified as 32bpp but alpha length is 0''')
+    argMode = channels = ''.join([offsets[o] for o in sorted(offsets)])
+    if DEBUG:
+        print("    decodeFramebufferHeader: argMode=", argMode, file=sys.stderr)
+
+    if argMode == 'BGRA':
+        argMode = 'RGBA'
+    if bpp == 16:
+        mode = 'RGB'
+        argMode += ';16'
+    else:
+        mode = argMode
+    return version, bpp, size, width, height, mode, argMode, channels
+
+
+class TransportPool:
+    """
+    Pool of ADB server sockets already bound to a device transport.
+
+    Every socket in the pool has been connected to the ADB server and has received the C{OKAY} to
+    C{host:transport:<serialno>}, so the next service request (i.e. C{shell:}) can be sent right away.
+    A background thread refills the pool as sockets are checked out.
+    """
+
+    def __init__(self, serialno, hostname=HOSTNAME, port=PORT, timeout=TIMEOUT, connect=connect,
+                 size=TRANSPORT_POOL_SIZE):
+        """
+        Constructor.
+
+        :param serialno: the device serial number, it should be already resolved (not a regexp)
+        :param hostname: the ADB server hostname
+        :param port: the ADB server port
+        :param timeout: the connection timeout
+        :param connect: the connect function
+        :param size: the number of idle sockets kept in the pool
+        """
+        self.serialno = serialno
+        self.hostname = hostname
+        self.port = port
+        self.timeout = timeout
+        self.__connect = connect
+        self.size = size
+        self.hits = 0
+        ''' Number of checkouts served by an idle socket '''
+        self.misses = 0
+        ''' Number of checkouts that had to negotiate the transport synchronously '''
+        self.__idle = collections.deque()
+        self.__condition = threading.Condition()
+        self.__closed = False
+        self.__refiller = threading.Thread(target=self.__refill, name='TransportPool-%s' % serialno)
+        self.__refiller.daemon = True
+        self.__refiller.start()
+
+    def negotiate(self):
+        """
+        Connects to the ADB server and sets the transport to the device.
+
+        :return: the socket bound to the device transport
+        """
+        return openTransport(self.serialno, self.hostname, self.port, self.timeout, self.__connect)
+
+    @staticmethod
+    def isAlive(s):
+        """
+        Checks whether an idle socket is still usable.
+        An idle transport socket should never be readable, if it is the server closed it or sent something
+        unexpected.
+
+        :param s: the socket
+        :return: C{True} if the socket can be used
+        """
+        try:
+            readable, _, _ = select.select([s], [], [], 0)
+        except (ValueError, OSError):
+            return False
+        return not readable
+
+    def checkout(self):
+        """
+        Obtains a socket bound to the device transport.
+        The caller owns the socket and is responsible for closing it.
+
+        :return: the socket
+        """
+        with self.__condition:
+            while self.__idle:
+                s = self.__idle.popleft()
+                if TransportPool.isAlive(s):
+                    self.hits += 1
+                    self.__condition.notify()
+                    return s
+                s.close()
+            self.misses += 1
+            self.__condition.notify()
+        if DEBUG_POOL:
+            print("TransportPool.checkout: miss", file=sys.stderr)
+        return self.negotiate()
+
+    def stats(self):
+        """
+        Gets the pool statistics.
+
+        :return: a dict containing C{hits}, C{misses} and C{idle}
+        """
+        with self.__condition:
+            return {'hits': self.hits, 'misses': self.misses, 'idle': len(self.__idle)}
+
+    def close(self):
+        """
+        Closes all the idle sockets and stops the refill thread.
+        """
+        with self.__condition:
+            self.__closed = True
+            while self.__idle:
+                self.__idle.popleft().close()
+            self.__condition.notify_all()
+
+    def __refill(self):
+        backoff = 0
+        while True:
+            with self.__condition:
+                while not self.__closed and len(self.__idle) >= self.size:
+                    self.__condition.wait()
+                if self.__closed:
+                    return
+            if backoff:
+                time.sleep(backoff)
+            try:
+                s = self.negotiate()
+                backoff = 0
+            except Exception as ex:
+                if DEBUG_POOL:
+                    print("TransportPool.__refill: %s" % ex, file=sys.stderr)
+                backoff = min(2 * backoff or 0.1, TRANSPORT_POOL_MAX_BACKOFF)
+                continue
+            with self.__condition:
+                if self.__closed:
+                    s.close()
+                    return
+                self.__idle.append(s)
+
+
+class DisplayState:
+    """
+    Caches the display properties (width, height, density and orientation) of a device.
+
+    The complete display info (see L{AdbClient.getDisplayInfo}) is obtained only when it is needed for the first time,
+    after L{invalidate}, or when L{refreshOrientation} detects a rotation. The rotation is detected using only the
+    C{SurfaceOrientation} line of C{dumpsys input}, filtered on the device.
+    Listeners are invoked as C{listener(oldInfo, newInfo)} every time the info changes.
+    """
+
+    def __init__(self, adbClient):
+        self.adbClient = adbClient
+        self.info = None
+        ''' The cached display info, C{None} until loaded '''
+        self.__listeners = []
+
+    def addListener(self, listener):
+        self.__listeners.append(listener)
+
+    def removeListener(self, listener):
+        self.__listeners.remove(listener)
+
+    def invalidate(self):
+        """
+        Invalidates the cached info, it will be loaded again when needed.
+        """
+        self.info = None
+
+    def load(self):
+        """
+        Loads the complete display info and notifies the listeners if it changed.
+
+        :return: the info
+        """
+        old = self.info
+        info = dict(self.adbClient.getDisplayInfo())
+        if 'orientation' not in info:
+            orientation = self.probeOrientation()
+            info['orientation'] = orientation if orientation is not None else -1
+        self.info = info
+        if DEBUG:
+            print("DisplayState.load: %s" % info, file=sys.stderr)
+        if info != old:
+            for listener in list(self.__listeners):
+                listener(old, info)
+        return info
+
+    def get(self, prop):
+        """
+        Gets a display property, loading the info if it is not cached.
+        """
+        if self.info is None or prop not in self.info:
+            self.load()
+        return self.info[prop]
+
+    def probeOrientation(self):
+        """
+        Obtains the current orientation of the screen without parsing any other display information.
+
+        :return: the orientation, or C{None} if C{SurfaceOrientation} is not found (i.e. there's no touch screen)
+        """
+        if self.adbClient.getSdkVersion() >= 23:
+            # toybox grep is available, only the matching line is sent back
+            output = self.adbClient.shell('dumpsys input | grep SurfaceOrientation')
+        else:
+            output = self.adbClient.shell('dumpsys input')
+        m = SURFACE_ORIENTATION_RE.search(output)
+        if m:
+            return int(m.group('orientation'))
+        return None
+
+    def refreshOrientation(self):
+        """
+        Detects rotation changes. If the orientation changed, the complete info is loaded again, as the width and
+        height may be swapped too, and the listeners are notified.
+
+        :return: the current orientation
+        """
+        orientation = self.probeOrientation()
+        if orientation is None:
+            return self.get('orientation')
+        if self.info is None or self.info.get('orientation') != orientation:
+            self.load()
+            if self.info['orientation'] != orientation:
+                # prefer the probed orientation, in case the rotation was in progress
+                old = self.info
+                self.info = dict(old, orientation=orientation)
+                for listener in list(self.__listeners):
+                    listener(old, self.info)
+        return orientation
+
+
 class AdbClient:
     """
     Adb client.
@@ -233,7 +590,8 @@ class AdbClient:
     DOWN_AND_UP = DOWN_AND_UP
 
     def __init__(self, serialno=None, hostname=HOSTNAME, port=PORT, settransport=True, reconnect=True,
-                 ignoreversioncheck=False, timeout=TIMEOUT, connect=connect):
+                 ignoreversioncheck=False, timeout=TIMEOUT, connect=connect, poolsize=TRANSPORT_POOL_SIZE,
+                 propertycachettl=PROPERTY_CACHE_TTL):
         """
         Constructor.
         :param serialno:
@@ -252,6 +610,10 @@ class AdbClient:
         :type timeout:
         :param connect:
         :type connect:
+        :param poolsize: the number of pre-negotiated transport sockets to keep, 0 disables the pool
+        :type poolsize: int
+        :param propertycachettl: seconds the device properties are cached, 0 disables the cache
+        :type propertycachettl: float
         """
         self.Log = AdbClient.__Log(self)
 
@@ -262,6 +624,10 @@ class AdbClient:
         self.__connect = connect
         self.timerId = -1
         self.timers = {}
+        ''' The timers set by L{setTimer}, deprecated '''
+        self.poolsize = poolsize
+        self.transportPool = None
+        ''' The L{TransportPool} used to reconnect, created once the transport is set '''
 
         self.reconnect = reconnect
         self.socket = connect(self.hostname, self.port, self.timeout)
@@ -273,8 +639,29 @@ class AdbClient:
         self.build = {}
         ''' Build properties '''
 
-        self.__displayInfo = None
-        ''' Cached display info. Reset it to C{None} to force refetching display info '''
+        self.features = None
+        ''' Features supported by the device and the ADB server, see L{getFeatures} '''
+
+        self.propertyCacheTtl = propertycachettl
+        ''' Seconds the device properties are cached, see L{getProperties} '''
+        self.__properties = None
+        self.__propertiesTime = None
+
+        self.__propertyGetters = {
+            'display.width': self.__getDisplayWidth,
+            'display.height': self.__getDisplayHeight,
+            'display.density': self.__getDisplayDensity,
+            'display.orientation': self.__getDisplayOrientation,
+        }
+        ''' Maps the display properties, which are not device properties, to the methods obtaining their values '''
+
+        self.displayState = DisplayState(self)
+        ''' Cached display info. Invoke C{displayState.invalidate()} to force refetching display info '''
+        self.displayState.addListener(self.__onDisplayChanged)
+
+        self.inputCount = 0
+        ''' The number of input actions (touches, drags, key presses, text, activity starts) sent, the screen may have
+            changed if it is different from a previous value. Input sent by other means, i.e. L{shell}, is not counted '''
 
         self.display = {}
         ''' The map containing the device's physical display properties: width, height and density '''
@@ -282,12 +669,37 @@ class AdbClient:
         self.screenshot_number = 1
         ''' The screenshot number count '''
 
+        self.__frameBuffers = [None, None]
+        ''' Buffers reused by L{takeSnapshotArray}, L{stream_frames} alternates between them '''
+
         self.isTransportSet = False
         if settransport and serialno is not None:
             self.__setTransport(timeout=timeout)
+            self.__createTransportPool()
             self.build[VERSION_SDK_PROPERTY] = int(self.__getProp(VERSION_SDK_PROPERTY))
             self.initDisplayProperties()
 
+    def __deadline(self, timeout=None):
+        """
+        Obtains the deadline of an operation starting now.
+
+        :param timeout: the timeout in seconds, or C{None} to use C{self.timeout}
+        :return: the deadline, relative to C{time.monotonic()}
+        """
+        return time.monotonic() + (self.timeout if timeout is None else timeout)
+
+    @staticmethod
+    def __setRemainingTimeout(sock, deadline, description=None):
+        """
+        Sets the socket timeout to the time remaining until the deadline, so a blocking call cannot exceed it.
+
+        :raise Timer.TimeoutException: if the deadline has already passed
+        """
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise Timer.TimeoutException("Timer %s has expired" % description)
+        sock.settimeout(remaining)
+
     def __timeoutHandler(self, timerId, description=None):
         if DEBUG:
             print("\nTIMEOUT HANDLER", timerId, ':', description, file=sys.stderr)
@@ -298,10 +710,15 @@ class AdbClient:
         """
         Sets a timer.
 
+        Deprecated: the operations of this client no longer use timers, they use socket timeouts computed from a
+        deadline. It will be removed in the next release.
+
         :param description:
         :param timeout: timeout in seconds
         :return: the timerId
         """
+        warnings.warn("AdbClient.setTimer is deprecated and will be removed in the next release", DeprecationWarning,
+                      stacklevel=2)
         self.timerId += 1
         timer = Timer(timeout, self.__timeoutHandler, (self.timerId, description))
         timer.start()
@@ -309,6 +726,13 @@ class AdbClient:
         return self.timerId
 
     def cancelTimer(self, timerId):
+        """
+        Cancels a timer set by L{setTimer}.
+
+        Deprecated, see L{setTimer}.
+        """
+        warnings.warn("AdbClient.cancelTimer is deprecated and will be removed in the next release",
+                      DeprecationWarning, stacklevel=2)
         if DEBUG:
             print("Canceling timer with ID=%s" % timerId, file=sys.stderr)
         if timerId not in self.timers:
@@ -325,6 +749,8 @@ class AdbClient:
             raise ValueError("Transport is already set, serialno cannot be set once this is done.")
         self.serialno = serialno
         self.__setTransport()
+        self.__createTransportPool()
+        self.invalidateProperties()
         self.build[VERSION_SDK_PROPERTY] = int(self.__getProp(VERSION_SDK_PROPERTY))
 
     def setReconnect(self, val):
@@ -335,6 +761,46 @@ class AdbClient:
             print("Closing socket...", self.socket, file=sys.stderr)
         if self.socket:
             self.socket.close()
+        if self.transportPool:
+            self.transportPool.close()
+            self.transportPool = None
+
+    def __createTransportPool(self):
+        if self.poolsize > 0 and self.transportPool is None:
+            self.transportPool = TransportPool(self.serialno, self.hostname, self.port, self.timeout, self.__connect,
+                                               self.poolsize)
+
+    def getTransportPoolStats(self):
+        """
+        Gets the transport pool statistics.
+
+        :return: a dict containing C{hits}, C{misses} and C{idle}, or C{None} if there's no pool
+        """
+        if self.transportPool:
+            return self.transportPool.stats()
+        return None
+
+    def __openTransport(self):
+        """
+        Obtains a new socket with the transport set, to be used by exactly one service.
+        """
+        if self.transportPool:
+            return self.transportPool.checkout()
+        return openTransport(self.serialno, self.hostname, self.port, self.timeout, self.__connect)
+
+    def __reconnectTransport(self):
+        """
+        Replaces the current socket, already used by a service, by a new one with the transport set.
+        """
+        if DEBUG:
+            print("    __reconnectTransport: reconnecting", file=sys.stderr)
+        if self.socket:
+            self.socket.close()
+        if self.transportPool:
+            self.socket = self.transportPool.checkout()
+        else:
+            self.socket = self.__connect(self.hostname, self.port, self.timeout)
+            self.__setTransport()
 
     def __del__(self):
         try:
@@ -342,60 +808,73 @@ class AdbClient:
         except:
             pass
 
-    def __send(self, msg, checkok=True, reconnect=False):
+    def __send(self, msg, checkok=True, reconnect=False, sock=None):
         if DEBUG:
             print("__send(%s, checkok=%s, reconnect=%s)" % (msg, checkok, reconnect), file=sys.stderr)
-        if not re.search('^host:', msg):
-            if not self.isTransportSet:
-                self.__setTransport()
-        else:
-            self.checkConnected()
+        if not sock:
+            if not re.search('^host:', msg):
+                if not self.isTransportSet:
+                    self.__setTransport()
+            else:
+                self.checkConnected()
+            sock = self.socket
 
         b = bytearray(msg, 'utf-8')
-        timerId = self.setTimer(timeout=self.timeout, description="send")
         try:
-            self.socket.send(b'%04X%s' % (len(b), b))
+            self.__setRemainingTimeout(sock, self.__deadline(), "send")
+            sock.sendall(b'%04X%s' % (len(b), b))
+        except socket.timeout:
+            raise Timer.TimeoutException("Timer send has expired")
         except Exception as ex:
             raise RuntimeError("Error sending %d bytes" % len(b), ex)
         finally:
-            self.cancelTimer(timerId)
+            sock.settimeout(self.timeout)
 
         if checkok:
-            self.__checkOk()
+            self.__checkOk(sock)
 
         if reconnect:
-            if DEBUG:
-                print("    __send: reconnecting", file=sys.stderr)
-            self.socket = self.__connect(self.hostname, self.port, self.timeout)
-            self.__setTransport()
+            self.__reconnectTransport()
+
+    def __receive(self, nob=None, sock=None, buffer=None):
+        """
+        Receives C{nob} bytes, or the length prefixed message if C{nob} is not specified.
 
-    def __receive(self, nob=None, sock=None):
+        :param buffer: receive into this writable buffer, of at least C{nob} bytes, instead of a new one
+        :return: the received bytes, or the view of the buffer containing them
+        """
         if DEBUG:
             print("🟨 __receive(nob=%s)" % nob, file=sys.stderr)
         if not sock:
             sock = self.socket
         self.checkConnected(sock)
-        timerId = self.setTimer(timeout=self.timeout, description="recv")
+        deadline = self.__deadline()
         try:
             if nob is None:
+                self.__setRemainingTimeout(sock, deadline, "recv")
                 nob = int(sock.recv(4), 16)
             if DEBUG:
                 print("🟨    __receive: receiving", nob, "bytes", file=sys.stderr)
-            recv = bytearray(nob)
-            mview = memoryview(recv)
+            if buffer is None:
+                recv = bytearray(nob)
+                mview = memoryview(recv)
+            else:
+                recv = mview = memoryview(buffer).cast('B')[:nob]
             nr = 0
             while nr < nob:
+                self.__setRemainingTimeout(sock, deadline, "recv")
                 l = sock.recv_into(mview, len(mview))
                 if DEBUG:
                     print("🟨    __receive: recv_into(mview, %d):" % len(mview), file=sys.stderr)
                     print("🟨    __receive: l=", l, "nr=", nr, file=sys.stderr)
-                    print("🟨    __receive: timer=", self.timers[timerId], file=sys.stderr)
+                if l == 0:
+                    raise RuntimeError("ERROR: connection closed after receiving %d of %d bytes" % (nr, nob))
                 mview = mview[l:]
                 nr += l
-                if self.timers[timerId] == 'EXPIRED':
-                    raise Timer.TimeoutException('%d EXPIRED' % timerId)
+        except socket.timeout:
+            raise Timer.TimeoutException("Timer recv has expired")
         finally:
-            self.cancelTimer(timerId)
+            sock.settimeout(self.timeout)
         if DEBUG:
             print("🟨    __receive: returning len=", len(recv), file=sys.stderr)
             print("🟨    __receive: '%s'" % repr(recv), file=sys.stderr)
@@ -408,26 +887,26 @@ class AdbClient:
             sock = self.socket
         self.checkConnected(sock=sock)
 
-        timerId = self.setTimer(timeout=self.timeout, description="checkOK")
+        deadline = self.__deadline()
         try:
+            self.__setRemainingTimeout(sock, deadline, "checkOK")
             recv = sock.recv(4)
-        finally:
-            self.cancelTimer(timerId)
 
-        if DEBUG:
-            print("    __checkOk: recv(4)=", repr(recv), file=sys.stderr)
+            if DEBUG:
+                print("    __checkOk: recv(4)=", repr(recv), file=sys.stderr)
 
-        timerId = self.setTimer(timeout=self.timeout, description="checkOK")
-        try:
             if recv != OKAY:
+                self.__setRemainingTimeout(sock, deadline, "checkOK")
                 error = sock.recv(1024)
                 if error.startswith(b'0049'):
                     raise RuntimeError(
                         "ERROR: This computer is unauthorized. Please check the confirmation dialog on your device.")
                 else:
                     raise RuntimeError("ERROR: %s %s" % (repr(recv), error))
+        except socket.timeout:
+            raise Timer.TimeoutException("Timer checkOK has expired")
         finally:
-            self.cancelTimer(timerId)
+            sock.settimeout(self.timeout)
         if DEBUG:
             print("    __checkOk: returning True", file=sys.stderr)
         return True
@@ -475,7 +954,7 @@ class AdbClient:
             _s = self.__connect(self.hostname, self.port, timeout=5)
             msg = 'host:track-devices'
             b = bytearray(msg, 'utf-8')
-            timerId = self.setTimer(timeout=timeout, description="setTransport")
+            deadline = self.__deadline(timeout)
             try:
                 _s.send(b'%04X%s' % (len(b), b))
                 self.__checkOk(sock=_s)
@@ -498,16 +977,13 @@ class AdbClient:
                         if found:
                             break
                     except socket.timeout as ex:
-                        # we continue trying until timer times out
+                        # we continue trying until the deadline
                         pass
                     finally:
                         time.sleep(3)
-                    if DEBUG:
-                        print("Checking if timer %d is EXPIRED:" % timerId, self.timers[timerId], file=sys.stderr)
-                    if self.timers[timerId] == "EXPIRED":
+                    if time.monotonic() >= deadline:
                         break
             finally:
-                self.cancelTimer(timerId)
                 _s.close()
                 sys.stderr.write("\n")
                 sys.stderr.flush()
@@ -572,50 +1048,336 @@ class AdbClient:
         self.socket = self.__connect(self.hostname, self.port, self.timeout)
         return devices
 
+    def getFeatures(self):
+        """
+        Gets the features supported by both the device and the ADB server (i.e. C{shell_v2}, C{stat_v2}).
+        The features are obtained once and cached.
+
+        :return: the list of features
+        """
+        if self.features is None:
+            self.__checkTransport()
+            _s = self.__connect(self.hostname, self.port, self.timeout)
+            try:
+                msg = bytearray('host-serial:%s:features' % self.serialno, 'utf-8')
+                _s.sendall(b'%04X%s' % (len(msg), msg))
+                self.__checkOk(sock=_s)
+                self.features = [f for f in self.__receive(sock=_s).decode('utf-8').split(',') if f]
+            except RuntimeError as ex:
+                if DEBUG:
+                    print("getFeatures: %s" % ex, file=sys.stderr)
+                self.features = []
+            finally:
+                _s.close()
+        return self.features
+
+    def shell_v2(self, cmd, timeout=None):
+        """
+        Runs a command using the shell protocol v2, which keeps stdout and stderr apart and reports the exit code.
+        If the device does not support it, the legacy C{shell:} service is used and all the output is reported as
+        stdout with an exit code of C{None}.
+
+        The command runs on its own transport socket, the output is not buffered and it is consumed as the
+        generator is iterated, so long running commands like C{logcat} can be streamed.
+
+        :param cmd: the command
+        :param timeout: the maximum time in seconds waiting for output, C{None} uses C{self.timeout} and C{0} waits
+                        forever
+        :return: a generator of C{(packetId, data)} tuples, where C{packetId} is L{SHELL_V2_STDOUT} or
+                 L{SHELL_V2_STDERR} and C{data} the bytes received, and the last one is L{SHELL_V2_EXIT} and the exit
+                 code
+        """
+        if DEBUG_SHELL:
+            print("shell_v2(cmd=%s)" % cmd, file=sys.stderr)
+        self.__checkTransport()
+        v2 = 'shell_v2' in self.getFeatures()
+        sock = self.__openTransport()
+        try:
+            self.__send(('shell,v2,raw:%s' if v2 else 'shell:%s') % cmd, sock=sock)
+        except:
+            sock.close()
+            raise
+        if timeout is None:
+            timeout = self.timeout
+        sock.settimeout(timeout if timeout else None)
+        return self.__shellPackets(sock, v2)
+
+    @staticmethod
+    def __readPacket(f, size):
+        data = f.read(size)
+        if len(data) < size:
+            raise RuntimeError("ERROR: shell protocol stream closed after %d of %d bytes" % (len(data), size))
+        return data
+
+    def __shellPackets(self, sock, v2):
+        f = None
+        try:
+            if not v2:
+                while True:
+                    chunk = sock.recv(SHELL_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    yield SHELL_V2_STDOUT, chunk
+                yield SHELL_V2_EXIT, None
+                return
+            f = sock.makefile('rb')
+            while True:
+                (packetId, length) = struct.unpack('<BI', self.__readPacket(f, 5))
+                data = self.__readPacket(f, length)
+                if packetId == SHELL_V2_EXIT:
+                    yield SHELL_V2_EXIT, data[0]
+                    return
+                yield packetId, data
+        except socket.timeout:
+            raise Timer.TimeoutException("Timer shell has expired")
+        finally:
+            if f:
+                f.close()
+            sock.close()
+
+    def exec_out(self, cmd, timeout=None):
+        """
+        Runs a command using the C{exec:} service, like C{adb exec-out}. The output, stdout and stderr, is received as
+        raw bytes, with no PTY translation of line endings and no shell protocol packets, so binary output (i.e.
+        C{screencap -p}) is received as is. It is available since API 21.
+
+        The command runs on its own transport socket and the output is consumed as the generator is iterated.
+
+        :param cmd: the command
+        :param timeout: the maximum time in seconds waiting for output, see L{shell_v2}
+        :return: a generator of the bytes received
+        """
+        if DEBUG_SHELL:
+            print("exec_out(cmd=%s)" % cmd, file=sys.stderr)
+        self.__checkTransport()
+        version = self.getSdkVersion()
+        if version < 21:
+            raise RuntimeError("ERROR: exec: not supported for API < 21 (version=%d)" % version)
+        sock = self.__openTransport()
+        try:
+            self.__send('exec:%s' % cmd, sock=sock)
+        except:
+            sock.close()
+            raise
+        if timeout is None:
+            timeout = self.timeout
+        sock.settimeout(timeout if timeout else None)
+        return self.__execChunks(sock)
+
+    @staticmethod
+    def __execChunks(sock):
+        try:
+            while True:
+                chunk = sock.recv(SHELL_CHUNK_SIZE)
+                if not chunk:
+                    return
+                yield chunk
+        except socket.timeout:
+            raise Timer.TimeoutException("Timer exec has expired")
+        finally:
+            sock.close()
+
+    def shell_lines(self, cmd, timeout=None):
+        """
+        Runs a command and iterates over the lines of its output (stdout and stderr) as they are received.
+
+        :param cmd: the command
+        :param timeout: the maximum time in seconds waiting for output, see L{shell_v2}
+        :return: a generator of lines, without line terminators
+        """
+        decoder = codecs.getincrementaldecoder('utf-8')()
+        pending = ''
+        for packetId, data in self.shell_v2(cmd, timeout):
+            if packetId == SHELL_V2_EXIT:
+                break
+            pending += decoder.decode(data)
+            n = pending.rfind('\n')
+            if n >= 0:
+                for line in pending[:n + 1].splitlines():
+                    yield line
+                pending = pending[n + 1:]
+        pending += decoder.decode(b'', final=True)
+        for line in pending.splitlines():
+            yield line
+
+    def shell_batch(self, commands, _convertOutputToString=True):
+        """
+        Runs several commands in one shell session, instead of one session (and round trip) per command.
+        Each command's output (stdout and stderr) is followed by a sentinel and its exit code, which is used to split
+        the output back.
+        If a command ends the shell (i.e. C{exit}) the remaining commands get an exit code of C{None}.
+
+        :param commands: the list of commands
+        :param _convertOutputToString: convert the outputs to C{str}, otherwise they are C{bytes}
+        :return: the list of C{(output, exitCode)} tuples, one per command
+        """
+        if DEBUG_SHELL:
+            print("shell_batch(commands=%s)" % commands, file=sys.stderr)
+        if not commands:
+            return []
+        sentinel = '__AVC_%s__' % uuid.uuid4().hex
+        script = ''.join('{ %s\n} 2>&1\necho "%s$?"\n' % (cmd, sentinel) for cmd in commands)
+        parts = self.shell(script, False).split(sentinel.encode('utf-8'))
+        results = []
+        output = parts[0]
+        for part in parts[1:]:
+            (exitCode, _, rest) = part.partition(b'\n')
+            results.append((output, int(exitCode)))
+            output = rest
+        while len(results) < len(commands):
+            results.append((output, None))
+            output = b''
+        if _convertOutputToString:
+            return [(o.decode('utf-8'), e) for (o, e) in results]
+        return results
+
     def shell(self, _cmd=None, _convertOutputToString=True):
         if DEBUG:
             print("shell(_cmd=%s)" % _cmd, file=sys.stderr)
         self.__checkTransport()
-        #
-        # synchronized
-        #
-        with self.lock:
-            if _cmd:
-                self.__send('shell:%s' % _cmd, checkok=True, reconnect=False)
-                chunks = []
-                while True:
-                    chunk = None
-                    try:
-                        chunk = self.socket.recv(4096)
+        if _cmd:
+            chunks = []
+            packets = self.shell_v2(_cmd)
+            try:
+                for packetId, data in packets:
+                    if packetId != SHELL_V2_EXIT:
+                        chunks.append(data)
                         if DEBUG:
-                            print('🟣 chunk=%s' % chunk)
-                    except Exception as ex:
-                        print("ERROR:", ex, file=sys.stderr)
-                    if not chunk:
-                        break
-                    chunks.append(chunk)
-                if self.reconnect:
-                    if DEBUG:
-                        print("Reconnecting...", file=sys.stderr)
-                    self.close()
-                    self.socket = self.__connect(self.hostname, self.port, self.timeout)
-                    self.__setTransport()
-                if _convertOutputToString:
-                    return b''.join(chunks).decode('utf-8')
-                else:
-                    return b''.join(chunks)
+                            print('🟣 chunk=%s' % data)
+            except Exception as ex:
+                # the output is incomplete, i.e. the deadline expired or the transport failed
+                print("ERROR:", ex, file=sys.stderr)
+                raise
+            finally:
+                packets.close()
+            if _convertOutputToString:
+                return b''.join(chunks).decode('utf-8')
             else:
+                return b''.join(chunks)
+        else:
+            #
+            # synchronized
+            #
+            with self.lock:
                 self.__send('shell:')
                 # sin = self.socket.makefile("rw")
                 # sout = self.socket.makefile("r")
                 # return (sin, sin)
-                return adbClient.socket.makefile("r")
+                return self.socket.makefile("r")
+
+    def openSync(self):
+        """
+        Opens a C{sync:} session on a new transport socket.
+        Use it as a context manager or close it when done.
+
+        :return: the L{SyncConnection}
+        """
+        self.__checkTransport()
+        features = self.getFeatures()
+        sock = self.__openTransport()
+        try:
+            return SyncConnection(sock, features)
+        except:
+            sock.close()
+            raise
+
+    def push(self, local, remote, mode=0o644):
+        """
+        Pushes a local file, or a binary stream, to the device.
+
+        :param local: the local path or a binary stream
+        :param remote: the remote path
+        :param mode: the remote file mode
+        :return: the number of bytes sent
+        """
+        with self.openSync() as sync:
+            if hasattr(local, 'readinto'):
+                return sync.send(local, remote, mode)
+            with open(local, 'rb') as f:
+                return sync.send(f, remote, mode, os.path.getmtime(local))
+
+    def pull(self, remote, local):
+        """
+        Pulls a file from the device to a local file, or a binary stream.
+
+        :param remote: the remote path
+        :param local: the local path or a binary stream
+        :return: the number of bytes received
+        """
+        with self.openSync() as sync:
+            if hasattr(local, 'write'):
+                return sync.recv(remote, local)
+            try:
+                with open(local, 'wb') as f:
+                    return sync.recv(remote, f)
+            except:
+                # do not leave a partial file
+                if os.path.exists(local):
+                    os.remove(local)
+                raise
+
+    def stat(self, remote):
+        """
+        Gets the status (mode, size, mtime and, if the device supports C{stat_v2}, the rest of the fields) of a remote
+        file.
+
+        :param remote: the remote path
+        :return: the L{SyncStat}
+        """
+        with self.openSync() as sync:
+            return sync.stat(remote)
+
+    def listDirectory(self, remote):
+        """
+        Lists a remote directory.
+
+        :param remote: the remote path
+        :return: the list of L{SyncDirEntry}
+        """
+        with self.openSync() as sync:
+            return list(sync.listDirectory(remote))
+
+    def installPackage(self, apk, allowTestApk=False, grantAllPermissions=False):
+        """
+        Installs (or reinstalls) an APK, pushing it to L{INSTALL_TMP_DIR} and running C{pm install}.
+
+        :param apk: the local path of the APK
+        :param allowTestApk: allow test packages (C{-t})
+        :param grantAllPermissions: grant all runtime permissions (C{-g})
+        :return: 0 on success
+        :raise RuntimeError: if the installation fails
+        """
+        remote = '%s/%s' % (INSTALL_TMP_DIR, os.path.basename(apk))
+        self.push(apk, remote)
+        cmd = 'pm install -r'
+        if allowTestApk:
+            cmd += ' -t'
+        if grantAllPermissions:
+            cmd += ' -g'
+        quoted = shlex.quote(remote)
+        ((out, exitCode), _) = self.shell_batch(['%s %s' % (cmd, quoted), 'rm -f %s' % quoted])
+        if exitCode != 0 or 'Success' not in out:
+            raise RuntimeError("ERROR: installing %s: %s" % (apk, out.strip()))
+        return 0
+
+    def uninstallPackage(self, package):
+        """
+        Uninstalls a package.
+
+        :param package: the package name
+        :return: 0 on success
+        :raise RuntimeError: if the package cannot be uninstalled
+        """
+        out = self.shell('pm uninstall %s' % package)
+        if 'Success' not in out:
+            raise RuntimeError("ERROR: uninstalling %s: %s" % (package, out.strip()))
+        return 0
 
     def getRestrictedScreen(self):
         ''' Gets C{mRestrictedScreen} values from dumpsys. This is a method to obtain display dimensions '''
 
         rsRE = re.compile(r'\s*mRestrictedScreen=\((?P<x>\d+),(?P<y>\d+)\) (?P<w>\d+)x(?P<h>\d+)')
-        for line in self.shell('dumpsys window').splitlines():
+        for line in self.shell_lines('dumpsys window'):
             m = rsRE.match(line)
             if m:
                 return m.groups()
@@ -639,32 +1401,30 @@ class AdbClient:
         """
 
         self.__checkTransport()
-        logicalDisplayRE = re.compile(
-            r'.*DisplayViewport\{.*valid=true, .*orientation=(?P<orientation>\d+), .*deviceWidth=(?P<width>\d+), '
-            r'deviceHeight=(?P<height>\d+).*')
-        predictedRotationRE = re.compile(r'.*mPredictedRotation=(?P<rotation>\d).*')
-        for _line in self.shell('dumpsys display').splitlines():
-            m = logicalDisplayRE.search(_line, pos=0)
+        displayInfo = None
+        for _line in self.shell_lines('dumpsys display'):
+            m = LOGICAL_DISPLAY_RE.search(_line, pos=0)
             if m:
-                self.__displayInfo = {}
+                displayInfo = {}
                 for prop in ['width', 'height', 'orientation']:
-                    self.__displayInfo[prop] = int(m.group(prop))
+                    displayInfo[prop] = int(m.group(prop))
                 for prop in ['density']:
                     d = self.__getDisplayDensity(None, strip=True, invokeGetPhysicalDisplayIfNotFound=True)
                     if d:
-                        self.__displayInfo[prop] = d
+                        displayInfo[prop] = d
                     else:
                         # No available density information
-                        self.__displayInfo[prop] = -1.0
+                        displayInfo[prop] = -1.0
 
-        for _line in self.shell('dumpsys window displays').splitlines():
-            m = predictedRotationRE.search(_line, pos=0)
+        if not displayInfo:
+            return None
+
+        for _line in self.shell_lines('dumpsys window displays'):
+            m = PREDICTED_ROTATION_RE.search(_line, pos=0)
             if m:
-                self.__displayInfo['rotation'] = int(m.group('rotation'))
+                displayInfo['rotation'] = int(m.group('rotation'))
 
-        if self.__displayInfo:
-            return self.__displayInfo
-        return None
+        return displayInfo
 
     def getPhysicalDisplayInfo(self):
         ''' Gets C{mPhysicalDisplayInfo} values from dumpsys. This is a method to obtain display dimensions and density'''
@@ -683,7 +1443,7 @@ class AdbClient:
 
         phyDispRE = re.compile(
             r'.*PhysicalDisplayInfo{(?P<width>\d+) x (?P<height>\d+), .*, density (?P<density>[\d.]+).*')
-        for line in self.shell('dumpsys display').splitlines():
+        for line in self.shell_lines('dumpsys display'):
             m = phyDispRE.search(line, 0)
             if m:
                 displayInfo = {}
@@ -698,7 +1458,7 @@ class AdbClient:
         phyDispRE = re.compile(r'\s*mUnrestrictedScreen=\((?P<x>\d+),(?P<y>\d+)\) (?P<width>\d+)x(?P<height>\d+)')
         # This is known to work on older versions (i.e. API 10) where mrestrictedScreen is not available
         dispWHRE = re.compile(r'\s*DisplayWidth=(?P<width>\d+) *DisplayHeight=(?P<height>\d+)')
-        for line in self.shell('dumpsys window').splitlines():
+        for line in self.shell_lines('dumpsys window'):
             m = phyDispRE.search(line, 0)
             if not m:
                 m = dispWHRE.search(line, 0)
@@ -715,45 +1475,61 @@ class AdbClient:
                         displayInfo[prop] = -1.0
                 return displayInfo
 
+    def getProperties(self):
+        """
+        Gets all the device properties with a single C{getprop}.
+        They are cached for L{propertyCacheTtl} seconds or until L{invalidateProperties} is invoked.
+
+        :return: the dict of properties, it should not be modified
+        """
+        self.__checkTransport()
+        if self.__properties is None or (self.propertyCacheTtl is not None and
+                                         time.monotonic() - self.__propertiesTime > self.propertyCacheTtl):
+            if DEBUG:
+                print("getProperties: loading properties", file=sys.stderr)
+            self.__properties = parseGetprop(self.shell('getprop'))
+            self.__propertiesTime = time.monotonic()
+        return self.__properties
+
+    def invalidateProperties(self):
+        """
+        Invalidates the device properties cache, i.e. after changing them using C{setprop}.
+        """
+        self.__properties = None
+
     def __getProp(self, key, strip=True):
         if DEBUG:
             print("__getProp(%s, %s)" % (key, strip), file=sys.stderr)
-        prop = self.shell('getprop %s' % key)
-        if strip:
-            prop = prop.rstrip('\r\n')
+        properties = None
+        if self.propertyCacheTtl != 0 and key.startswith(CACHED_PROPERTY_PREFIXES):
+            properties = self.getProperties()
+        if properties:
+            prop = properties.get(key, '')
+            if not strip:
+                prop += '\n'
+        else:
+            prop = self.shell('getprop %s' % key)
+            if strip:
+                prop = prop.rstrip('\r\n')
         if DEBUG:
             print("    __getProp: returning '%s'" % prop, file=sys.stderr)
         return prop
 
     def __getDisplayWidth(self, key, strip=True):
-        if self.__displayInfo and 'width' in self.__displayInfo:
-            return self.__displayInfo['width']
-        return self.getDisplayInfo()['width']
+        return self.displayState.get('width')
 
     def __getDisplayHeight(self, key, strip=True):
-        if self.__displayInfo and 'height' in self.__displayInfo:
-            return self.__displayInfo['height']
-        return self.getDisplayInfo()['height']
+        return self.displayState.get('height')
 
     def __getDisplayOrientation(self, key, strip=True):
-        if self.__displayInfo and 'orientation' in self.__displayInfo:
-            return self.__displayInfo['orientation']
-        displayInfo = self.getDisplayInfo()
-        if 'orientation' in displayInfo:
-            return displayInfo['orientation']
-        # Fallback method to obtain the orientation
+        # If the display info has no orientation DisplayState falls back to SurfaceOrientation
         # See https://github.com/dtmilano/AndroidViewClient/issues/128
-        surfaceOrientationRE = re.compile(r'SurfaceOrientation:\s+(\d+)')
-        output = self.shell('dumpsys input')
-        m = surfaceOrientationRE.search(output)
-        if m:
-            return int(m.group(1))
-        # We couldn't obtain the orientation
-        return -1
+        return self.displayState.get('orientation')
 
     def __getDisplayDensity(self, key, strip=True, invokeGetPhysicalDisplayIfNotFound=True):
-        if self.__displayInfo and 'density' in self.__displayInfo:  # and self.__displayInfo['density'] != -1: # FIXME: need more testing
-            return self.__displayInfo['density']
+        info = self.displayState.info
+        if info and 'density' in info:  # and info['density'] != -1: # FIXME: need more testing
+            return info['density']
         BASE_DPI = 160.0
         d = self.getProperty('ro.sf.lcd_density', strip)
         if d:
@@ -773,20 +1549,7 @@ class AdbClient:
         ''' Gets the property value for key '''
 
         self.__checkTransport()
-        import collections
-        MAP_PROPS = collections.OrderedDict([
-            (re.compile('display.width'), self.__getDisplayWidth),
-            (re.compile('display.height'), self.__getDisplayHeight),
-            (re.compile('display.density'), self.__getDisplayDensity),
-            (re.compile('display.orientation'), self.__getDisplayOrientation),
-            (re.compile('.*'), self.__getProp),
-        ])
-        '''Maps properties key values (as regexps) to instance methods to obtain its values.'''
-
-        for kre in list(MAP_PROPS.keys()):
-            if kre.match(key):
-                return MAP_PROPS[kre](key=key, strip=strip)
-        raise ValueError("key='%s' does not match any map entry")
+        return self.__propertyGetters.get(key, self.__getProp)(key=key, strip=strip)
 
     def getSdkVersion(self):
         '''
@@ -798,6 +1561,7 @@ class AdbClient:
 
     def press(self, name, eventType=DOWN_AND_UP, repeat=1):
         self.__checkTransport()
+        self.inputCount += 1
 
         cmd = 'input keyevent %s' % name
         for _ in range(1, repeat):
@@ -808,6 +1572,7 @@ class AdbClient:
 
     def longPress(self, name, duration=0.5, dev='/dev/input/event0', scancode=0, repeat=1):
         self.__checkTransport()
+        self.inputCount += 1
         # WORKAROUND:
         # Using 'input keyevent --longpress POWER' does not work correctly in
         # KitKat (API 19), it sends a short instead of a long press.
@@ -859,6 +1624,7 @@ class AdbClient:
         will be resolved and used.
         """
         self.__checkTransport()
+        self.inputCount += 1
         cmd = 'am start'
         if package and not component:
             version = self.getSdkVersion()
@@ -915,70 +1681,28 @@ class AdbClient:
             self.__checkTransport()
 
             self.__send('framebuffer:', checkok=True, reconnect=False)
-            # case 1: // version
-            #           return 12; // bpp, size, width, height, 4*(length, offset)
-            # case 2: // version
-            #           return 13; // bpp, colorSpace, size, width, height, 4*(length, offset)
-            # let's assume version==1 and change later if it's not
-            received = self.__receive(1 * 4 + 12 * 4)
-            (version, bpp, size, width, height, roffset, rlen, boffset, blen, goffset, glen, aoffset, alen) = \
-                struct.unpack('<' + 'L' * 13, received)
-            if version == 2:
+            received = self.__receive(FRAMEBUFFER_HEADER_SIZE)
+            if struct.unpack_from('<L', received)[0] == 2:
                 # receive one more
                 received += self.__receive(4)
-                (version, bpp, colorspace, size, width, height, roffset, rlen, boffset, blen, goffset, glen, aoffset,
-                 alen) = struct.unpack('<' + 'L' * 14, received)
-            if DEBUG:
-                if version == 1:
-                    print("    takeSnapshot:", (
-                        version, bpp, size, width, height, roffset, rlen, boffset, blen, goffset, glen, aoffset, alen),
-                          file=sys.stderr)
-                elif version == 2:
-                    print("    takeSnapshot:", (
-                        version, bpp, colorspace, width, height, roffset, rlen, boffset, blen, goffset, glen, aoffset,
-                        alen), file=sys.stderr)
-                else:
-                    print("    takeSnapshot: unknown version", version, file=sys.stderr)
-
-            offsets = {roffset: 'R', goffset: 'G', boffset: 'B'}
-            if bpp == 32:
-                if alen != 0:
-                    offsets[aoffset] = 'A'
-                else:
-                    warnings.warn('''framebuffer is specified as 32bpp but alpha length is 0''')
-            argMode = ''.join([offsets[o] for o in sorted(offsets)])
-            if DEBUG:
-                if version == 1:
-                    print("    takeSnapshot:", (
-                        version, bpp, size, width, height, roffset, rlen, boffset, blen, goffset, blen, aoffset, alen,
-                        argMode), file=sys.stderr)
-                elif version == 2:
-                    print("    takeSnapshot:", (
-                        version, bpp, colorspace, size, width, height, roffset, rlen, boffset, blen, goffset, blen,
-                        aoffset, alen,
-                        argMode), file=sys.stderr)
-
-            if argMode == 'BGRA':
-                argMode = 'RGBA'
-            if bpp == 16:
-                mode = 'RGB'
-                argMode += ';16'
-            else:
-                mode = argMode
+            (version, bpp, size, width, height, mode, argMode, _) = decodeFramebufferHeader(received)
             self.__send('\0', checkok=False, reconnect=False)
             if DEBUG:
                 print("    takeSnapshot: reading %d bytes" % size, file=sys.stderr)
             received = self.__receive(size)
             if reconnect:
-                self.socket = self.__connect(self.hostname, self.port, self.timeout)
-                self.__setTransport()
+                self.__reconnectTransport()
             if DEBUG:
                 print("    takeSnapshot: Image.frombuffer(%s, %s, %s, %s, %s, %s, %s)" % (
                     mode, (width, height), 'data', 'raw', argMode, 0, 1), file=sys.stderr)
             image = Image.frombuffer(mode, (width, height), received, 'raw', argMode, 0, 1)
         else:
             # ALTERNATIVE_METHOD: screencap
-            received = self.shell('/system/bin/screencap -p', False).replace(b'\r\n', b'\n')
+            if sdk_version >= 21:
+                received = b''.join(self.exec_out('/system/bin/screencap -p'))
+            else:
+                # the legacy shell: service runs on a PTY translating '\n' into '\r\n'
+                received = self.shell('/system/bin/screencap -p', False).replace(b'\r\n', b'\n')
             if not received:
                 raise RuntimeError('"/system/bin/screencap -p" result was empty')
             stream = StringIO.BytesIO(received)
@@ -992,6 +1716,9 @@ class AdbClient:
 
         # Just in case let's get the real image size
         (w, h) = image.size
+        if w == self.display['height'] and h == self.display['width']:
+            # the image looks rotated, the device may have rotated since the orientation was cached
+            self.displayState.refreshOrientation()
         if w == self.display['height'] and h == self.display['width']:
             # FIXME: We are not catching the 180 degrees rotation here
             if 'orientation' in self.display:
@@ -1007,6 +1734,117 @@ class AdbClient:
             return image.crop(box)
         return image
 
+    def __captureFramebuffer(self, buffer=None, slot=0):
+        """
+        Receives a frame from the C{framebuffer:} service, on its own transport socket, into C{buffer} or, if not
+        specified, into the pooled frame buffer C{slot}.
+
+        :return: the tuple (width, height, bpp, channels, view of the buffer containing the frame)
+        """
+        sock = self.__openTransport()
+        try:
+            self.__send('framebuffer:', sock=sock)
+            received = self.__receive(FRAMEBUFFER_HEADER_SIZE, sock=sock)
+            if struct.unpack_from('<L', received)[0] == 2:
+                received += self.__receive(4, sock=sock)
+            (version, bpp, size, width, height, mode, argMode, channels) = decodeFramebufferHeader(received)
+            if buffer is None:
+                if self.__frameBuffers[slot] is None or len(self.__frameBuffers[slot]) < size:
+                    self.__frameBuffers[slot] = bytearray(size)
+                buffer = self.__frameBuffers[slot]
+            elif memoryview(buffer).nbytes < size:
+                raise ValueError("buffer too small for a %dx%d %dbpp frame: %d bytes needed" % (
+                    width, height, bpp, size))
+            self.__send('\0', checkok=False, sock=sock)
+            return width, height, bpp, channels, self.__receive(size, sock=sock, buffer=buffer)
+        finally:
+            sock.close()
+
+    def takeSnapshotArray(self, buffer=None, rotate=True, _slot=0):
+        """
+        Takes a snapshot of the device and returns it as a NumPy array of shape (height, width, channels), or
+        (height, width) of C{uint16} for 16bpp (RGB565) screens.
+
+        Using the C{framebuffer:} service (API < 14 or >= 23) the frame is received into C{buffer}, or into a buffer
+        pooled by this client, and the array is a view of it, so no copy is made. The next capture into the same buffer
+        overwrites it, copy the array if it has to be kept.
+        Channels are in RGBA (or RGB) order, for BGRA framebuffers the view is RGB and the alpha is dropped.
+        Otherwise, C{screencap -p} is used and the decoded image is converted.
+
+        :param buffer: a writable buffer (i.e. C{bytearray} or C{numpy} array) of at least the frame size
+        :param rotate: rotates the array, as a transposed view, when the screen is rotated
+        :return: the array
+        """
+        global NUMPY_AVAILABLE
+        if not NUMPY_AVAILABLE:
+            try:
+                global np
+                import numpy as np
+                NUMPY_AVAILABLE = True
+            except ImportError:
+                raise Exception("You have to install numpy to use takeSnapshotArray()")
+
+        self.__checkTransport()
+        sdk_version = self.getSdkVersion()
+        if sdk_version < 14 or sdk_version >= 23:
+            (width, height, bpp, channels, data) = self.__captureFramebuffer(buffer, _slot)
+            if bpp == 16:
+                array = np.frombuffer(data, dtype='<u2').reshape(height, width)
+            else:
+                array = np.frombuffer(data, dtype=np.uint8).reshape(height, width, bpp // 8)
+                if channels.startswith('BGR'):
+                    array = array[..., 2::-1]
+        else:
+            array = np.asarray(self.takeSnapshot(reconnect=True).convert('RGBA'))
+
+        (h, w) = array.shape[:2]
+        if rotate and w == self.display['height'] and h == self.display['width']:
+            # see takeSnapshot()
+            self.displayState.refreshOrientation()
+        if rotate and w == self.display['height'] and h == self.display['width']:
+            # same rotation as takeSnapshot(), np.rot90() is counterclockwise as Image.rotate()
+            k = (0, 1, 2, -1)[self.display['orientation']] if 'orientation' in self.display else 1
+            array = np.rot90(array, k, axes=(0, 1))
+        return array
+
+    def stream_frames(self, fps=10, region=None, duplicates=False):
+        """
+        Continuously captures the screen, at most C{fps} frames per second, as L{takeSnapshotArray} arrays.
+
+        The transport sockets used by the captures are negotiated in advance by the transport pool, so every frame
+        only pays for the C{framebuffer:} request itself. Two pooled buffers are used alternately: the frame yielded
+        stays valid while the next one is captured, and is overwritten by the one after.
+        Frames identical to the previously yielded one, compared by their CRC-32, are dropped unless C{duplicates}.
+
+        :param fps: the maximum number of frames per second, C{None} or 0 to capture as fast as possible
+        :param region: a tuple (left, top, right, bottom) limiting the frames, and the comparison, to that region
+        :param duplicates: yields the frames even if they are identical to the previous one
+        :return: a generator of tuples (timestamp, array), the timestamp is the C{time.time()} of the capture
+        """
+        interval = 1.0 / fps if fps else 0
+        previous = None
+        n = 0
+        due = time.monotonic()
+        while True:
+            delay = due - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            due = max(due + interval, time.monotonic())
+            timestamp = time.time()
+            array = self.takeSnapshotArray(_slot=n % 2)
+            if region:
+                (left, top, right, bottom) = region
+                array = array[top:bottom, left:right]
+            if not duplicates:
+                crc = zlib.crc32(array if array.flags.c_contiguous else array.copy(order='C'))
+                if crc == previous:
+                    if DEBUG:
+                        print("stream_frames: dropping duplicate frame", file=sys.stderr)
+                    continue
+                previous = crc
+            n += 1
+            yield timestamp, array
+
     def imageToData(self, image, output_type=None):
         """
         Helps in cases where the Views cannot be identified.
@@ -1041,8 +1879,12 @@ class AdbClient:
             print("touch(x=", x, ", y=", y, ", orientation=", orientation, ", eventType=", eventType, ")",
                   file=sys.stderr)
         self.__checkTransport()
+        self.inputCount += 1
         if orientation == -1:
             orientation = self.display['orientation']
+        else:
+            # the point is transformed to the current orientation, the device may have rotated since it was cached
+            self.displayState.refreshOrientation()
         version = self.getSdkVersion()
         if version > 10:
             self.shell(
@@ -1088,8 +1930,12 @@ class AdbClient:
         (x0, y0) = startCoords
         (x1, y1) = endCoords
         self.__checkTransport()
+        self.inputCount += 1
         if orientation == -1:
             orientation = self.display['orientation']
+        else:
+            # the point is transformed to the current orientation, the device may have rotated since it was cached
+            self.displayState.refreshOrientation()
         (x0, y0) = self.__transformPointByOrientation((x0, y0), orientation, self.display['orientation'])
         (x1, y1) = self.__transformPointByOrientation((x1, y1), orientation, self.display['orientation'])
 
@@ -1124,6 +1970,7 @@ class AdbClient:
 
     def type(self, text):
         self.__checkTransport()
+        self.inputCount += 1
         if type(text) is str:
             escaped = text.replace('%s', '\\%s')
             encoded = escaped.replace(' ', '%s')
@@ -1140,6 +1987,7 @@ class AdbClient:
     def wake(self):
         self.__checkTransport()
         if not self.isScreenOn():
+            self.inputCount += 1
             self.shell('input keyevent POWER')
 
     def isLocked(self):
@@ -1191,6 +2039,7 @@ class AdbClient:
         '''
 
         self.__checkTransport()
+        self.inputCount += 1
         self.shell('input keyevent MENU')
         self.shell('input keyevent BACK')
 
@@ -1294,12 +2143,23 @@ class AdbClient:
 
     def initDisplayProperties(self):
         self.__checkTransport()
-        self.__displayInfo = None
+        self.displayState.invalidate()
         self.display['width'] = self.getProperty('display.width')
         self.display['height'] = self.getProperty('display.height')
         self.display['density'] = self.getProperty('display.density')
         self.display['orientation'] = self.getProperty('display.orientation')
 
+    def __onDisplayChanged(self, old, new):
+        """
+        Keeps L{display}, used by the coordinate transformations in L{touch} and L{drag}, in sync with the
+        L{DisplayState}.
+        """
+        if DEBUG_COORDS:
+            print("__onDisplayChanged: %s -> %s" % (old, new), file=sys.stderr)
+        for prop in ['width', 'height', 'density', 'orientation']:
+            if prop in new:
+                self.display[prop] = new[prop]
+
     def log(self, tag, message, priority='D', verbose=False):
         if DEBUG_LOG:
             print("log(tag=%s, message=%s, priority=%s, verbose=%s)" % (tag, message, priority, verbose),
@@ -1333,107 +2193,15 @@ class AdbClient:
             return WifiManager(self)
 
     def getWindows(self):
+        '''
+        Gets the windows from C{dumpsys window windows}.
+
+        @return: the L{Windows} snapshot, mapping the window ids to the L{Window}s
+        '''
         self.__checkTransport()
-        windows = {}
         dww = self.shell('dumpsys window windows')
         if DEBUG_WINDOWS: print(dww, file=sys.stderr)
-        lines = dww.splitlines()
-        widRE = re.compile(r'^ *Window #%s Window\{%s (u\d+ )?%s?.*\}:' %
-                           (_nd('num'), _nh('winId'), _ns('activity', greedy=True)))
-        currentFocusRE = re.compile(r'^  mCurrentFocus=Window\{%s .*' % _nh('winId'))
-        viewVisibilityRE = re.compile(' mViewVisibility=0x%s ' % _nh('visibility'))
-        # This is for 4.0.4 API-15
-        containingFrameRE = re.compile(r'^   *mContainingFrame=\[%s,%s\]\[%s,%s\] mParentFrame=\[%s,%s\]\[%s,%s\]' %
-                                       (_nd('cx'), _nd('cy'), _nd('cw'), _nd('ch'), _nd('px'), _nd('py'), _nd('pw'),
-                                        _nd('ph')))
-        contentFrameRE = re.compile(r'^   *mContentFrame=\[%s,%s\]\[%s,%s\] mVisibleFrame=\[%s,%s\]\[%s,%s\]' %
-                                    (_nd('x'), _nd('y'), _nd('w'), _nd('h'), _nd('vx'), _nd('vy'), _nd('vx1'),
-                                     _nd('vy1')))
-        # This is for 4.1 API-16
-        framesRE = re.compile(r'^   *Frames: containing=\[%s,%s\]\[%s,%s\] parent=\[%s,%s\]\[%s,%s\]' %
-                              (_nd('cx'), _nd('cy'), _nd('cw'), _nd('ch'), _nd('px'), _nd('py'), _nd('pw'), _nd('ph')))
-        contentRE = re.compile(r'^     *content=\[%s,%s\]\[%s,%s\] visible=\[%s,%s\]\[%s,%s\]' %
-                               (_nd('x'), _nd('y'), _nd('w'), _nd('h'), _nd('vx'), _nd('vy'), _nd('vx1'), _nd('vy1')))
-        policyVisibilityRE = re.compile('mPolicyVisibility=%s ' % _ns('policyVisibility', greedy=True))
-
-        currentFocus = None
-
-        for l in range(len(lines)):
-            m = widRE.search(lines[l])
-            if m:
-                num = int(m.group('num'))
-                winId = m.group('winId')
-                activity = m.group('activity')
-                wvx = 0
-                wvy = 0
-                wvw = 0
-                wvh = 0
-                px = 0
-                py = 0
-                visibility = -1
-                policyVisibility = 0x0
-
-                for l2 in range(l + 1, len(lines)):
-                    m = widRE.search(lines[l2])
-                    if m:
-                        l += (l2 - 1)
-                        break
-                    m = viewVisibilityRE.search(lines[l2])
-                    if m:
-                        visibility = int(m.group('visibility'))
-                        if DEBUG_COORDS: print("getWindows: visibility=", visibility, file=sys.stderr)
-                    if self.build[VERSION_SDK_PROPERTY] >= 17:
-                        wvx, wvy = (0, 0)
-                        wvw, wvh = (0, 0)
-                    if self.build[VERSION_SDK_PROPERTY] >= 16:
-                        m = framesRE.search(lines[l2])
-                        if m:
-                            px, py = obtainPxPy(m)
-                            m = contentRE.search(lines[l2 + 1])
-                            if m:
-                                # FIXME: the information provided by 'dumpsys window windows' in 4.2.1 (API 16)
-                                # when there's a system dialog may not be correct and causes the View coordinates
-                                # be offset by this amount, see
-                                # https://github.com/dtmilano/AndroidViewClient/issues/29
-                                wvx, wvy = obtainVxVy(m)
-                                wvw, wvh = obtainVwVh(m)
-                    elif self.build[VERSION_SDK_PROPERTY] == 15:
-                        m = containingFrameRE.search(lines[l2])
-                        if m:
-                            px, py = obtainPxPy(m)
-                            m = contentFrameRE.search(lines[l2 + 1])
-                            if m:
-                                wvx, wvy = obtainVxVy(m)
-                                wvw, wvh = obtainVwVh(m)
-                    elif self.build[VERSION_SDK_PROPERTY] == 10:
-                        m = containingFrameRE.search(lines[l2])
-                        if m:
-                            px, py = obtainPxPy(m)
-                            m = contentFrameRE.search(lines[l2 + 1])
-                            if m:
-                                wvx, wvy = obtainVxVy(m)
-                                wvw, wvh = obtainVwVh(m)
-                    else:
-                        warnings.warn("Unsupported Android version %d" % self.build[VERSION_SDK_PROPERTY])
-
-                    # print >> sys.stderr, "Searching policyVisibility in", lines[l2]
-                    m = policyVisibilityRE.search(lines[l2])
-                    if m:
-                        policyVisibility = 0x0 if m.group('policyVisibility') == 'true' else 0x8
-
-                windows[winId] = Window(num, winId, activity, wvx, wvy, wvw, wvh, px, py, visibility + policyVisibility)
-            else:
-                m = currentFocusRE.search(lines[l])
-                if m:
-                    currentFocus = m.group('winId')
-
-        if currentFocus in windows and windows[currentFocus].visibility == 0:
-            if DEBUG_COORDS:
-                print("getWindows: focus=", currentFocus, file=sys.stderr)
-                print("getWindows:", windows[currentFocus], file=sys.stderr)
-            windows[currentFocus].focused = True
-
-        return windows
+        return parseWindows(dww, self.build[VERSION_SDK_PROPERTY])
 
     def getFocusedWindow(self):
         '''
@@ -1442,10 +2210,7 @@ class AdbClient:
         @return: The focused L{Window}.
         '''
 
-        for window in list(self.getWindows().values()):
-            if window.focused:
-                return window
-        return None
+        return self.getWindows().getFocusedWindow()
 
     def getFocusedWindowName(self):
         '''
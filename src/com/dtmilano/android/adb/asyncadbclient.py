@@ -0,0 +1,414 @@
+# coding=utf-8
+"""
+Copyright (C) 2012-2022  Diego Torres Milano
+Created on Dec 1, 2012
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+@author: Diego Torres Milano
+"""
+
+from __future__ import print_function
+
+import asyncio
+import contextlib
+import io
+import re
+import struct
+import sys
+
+from com.dtmilano.android.adb.adbclient import HOSTNAME, PORT, TIMEOUT, OKAY, VERSION_SDK_PROPERTY, \
+    SHELL_V2_STDOUT, SHELL_V2_STDERR, SHELL_V2_EXIT, FRAMEBUFFER_HEADER_SIZE, LOGICAL_DISPLAY_RE, Device, Timer, \
+    decodeFramebufferHeader
+
+try:
+    from contextlib import aclosing
+except ImportError:
+    # Python < 3.10
+    @contextlib.asynccontextmanager
+    async def aclosing(thing):
+        try:
+            yield thing
+        finally:
+            await thing.aclose()
+
+__version__ = '25.0.0'
+
+DEBUG = False
+
+CONCURRENCY = 8
+''' Default number of simultaneous ADB server connections when driving several devices '''
+
+
+class AsyncAdbClient:
+    """
+    Adb client using asyncio streams.
+
+    It speaks the same wire protocol as L{AdbClient}, but every request uses its own connection to the ADB server so
+    many requests, to the same or different devices, can be in flight from a single thread. When a C{semaphore} is
+    given every connection acquires it, bounding the concurrency of all the clients sharing it.
+    """
+
+    def __init__(self, serialno=None, hostname=HOSTNAME, port=PORT, timeout=TIMEOUT, semaphore=None):
+        """
+        Constructor.
+        Call L{initDevice} (or use L{create}) before sending requests to the device.
+
+        :param serialno: the device serial number
+        :param hostname: the ADB server hostname
+        :param port: the ADB server port
+        :param timeout: the timeout in seconds of every protocol step
+        :param semaphore: an C{asyncio.Semaphore} shared by the clients to bound the simultaneous connections
+        """
+        self.serialno = serialno
+        self.hostname = hostname
+        self.port = port
+        self.timeout = timeout
+        self.semaphore = semaphore
+
+        self.build = {}
+        ''' Build properties '''
+
+        self.features = None
+        ''' Features supported by the device and the ADB server '''
+
+        self.display = {}
+        ''' The map containing the device's display properties: width, height, density and orientation '''
+
+    @staticmethod
+    async def create(serialno, hostname=HOSTNAME, port=PORT, timeout=TIMEOUT, semaphore=None):
+        """
+        Creates the client and initializes the device properties.
+        """
+        client = AsyncAdbClient(serialno, hostname, port, timeout, semaphore)
+        await client.initDevice()
+        return client
+
+    @staticmethod
+    async def createForAllDevices(hostname=HOSTNAME, port=PORT, timeout=TIMEOUT, concurrency=CONCURRENCY):
+        """
+        Creates one client for every online device, all sharing a semaphore that bounds the simultaneous
+        connections to C{concurrency}.
+
+        :return: the list of clients
+        """
+        semaphore = asyncio.Semaphore(concurrency)
+        devices = await AsyncAdbClient(hostname=hostname, port=port, timeout=timeout,
+                                       semaphore=semaphore).getDevices()
+        return await asyncio.gather(
+            *[AsyncAdbClient.create(d.serialno, hostname, port, timeout, semaphore) for d in devices if
+              d.status == 'device'])
+
+    async def initDevice(self):
+        """
+        Obtains the SDK version and the display properties.
+        """
+        self.build[VERSION_SDK_PROPERTY] = int(await self.getProperty(VERSION_SDK_PROPERTY))
+        await self.initDisplayProperties()
+
+    @contextlib.asynccontextmanager
+    async def __connection(self):
+        if self.semaphore:
+            await self.semaphore.acquire()
+        writer = None
+        try:
+            try:
+                reader, writer = await asyncio.wait_for(asyncio.open_connection(self.hostname, self.port),
+                                                        self.timeout)
+            except asyncio.TimeoutError:
+                raise Timer.TimeoutException("Timer connect has expired")
+            except OSError as ex:
+                raise RuntimeError("ERROR: Connecting to %s:%d: %s.\nIs adb running on your computer?" % (
+                    self.hostname, self.port, ex))
+            yield reader, writer
+        finally:
+            if writer:
+                writer.close()
+            if self.semaphore:
+                self.semaphore.release()
+
+    async def __readExactly(self, reader, n, description='recv'):
+        try:
+            return await asyncio.wait_for(reader.readexactly(n), self.timeout)
+        except asyncio.TimeoutError:
+            raise Timer.TimeoutException("Timer %s has expired" % description)
+
+    async def __send(self, reader, writer, msg, checkok=True):
+        if DEBUG:
+            print("AsyncAdbClient.__send(%s, checkok=%s)" % (msg, checkok), file=sys.stderr)
+        b = bytearray(msg, 'utf-8')
+        writer.write(b'%04X%s' % (len(b), b))
+        try:
+            await asyncio.wait_for(writer.drain(), self.timeout)
+        except asyncio.TimeoutError:
+            raise Timer.TimeoutException("Timer send has expired")
+        if checkok:
+            await self.__checkOk(reader)
+
+    async def __checkOk(self, reader):
+        recv = await self.__readExactly(reader, 4, "checkOK")
+        if recv != OKAY:
+            try:
+                error = await asyncio.wait_for(reader.read(1024), self.timeout)
+            except asyncio.TimeoutError:
+                error = b''
+            if error.startswith(b'0049'):
+                raise RuntimeError(
+                    "ERROR: This computer is unauthorized. Please check the confirmation dialog on your device.")
+            raise RuntimeError("ERROR: %s %s" % (repr(recv), error))
+        return True
+
+    async def __receive(self, reader):
+        nob = int(await self.__readExactly(reader, 4), 16)
+        return await self.__readExactly(reader, nob)
+
+    async def __setTransport(self, reader, writer):
+        if not self.serialno:
+            raise ValueError("serialno not set, empty or None")
+        await self.__send(reader, writer, 'host:transport:%s' % self.serialno)
+
+    async def getDevices(self):
+        """
+        Gets the devices connected to the ADB server.
+
+        :return: the list of L{Device}
+        """
+        async with self.__connection() as (reader, writer):
+            await self.__send(reader, writer, 'host:devices-l')
+            return [Device.factory(line) for line in (await self.__receive(reader)).splitlines()]
+
+    async def getFeatures(self):
+        """
+        Gets the features supported by both the device and the ADB server. They are cached.
+        """
+        if self.features is None:
+            async with self.__connection() as (reader, writer):
+                try:
+                    await self.__send(reader, writer, 'host-serial:%s:features' % self.serialno)
+                    self.features = [f for f in (await self.__receive(reader)).decode('utf-8').split(',') if f]
+                except RuntimeError:
+                    self.features = []
+        return self.features
+
+    async def shell_v2(self, cmd):
+        """
+        Runs a command using the shell protocol v2, falling back to the legacy C{shell:} service.
+        See L{AdbClient.shell_v2}.
+
+        The connection, and the C{semaphore} slot, are held until the generator is exhausted or closed. If it may not
+        be consumed to the end (i.e. breaking out of the loop) use it with C{aclosing}, otherwise they are held until
+        it is garbage collected, which may block the other requests sharing the C{semaphore}::
+
+            async with aclosing(client.shell_v2('logcat')) as packets:
+                async for packetId, data in packets:
+                    ...
+
+        :return: an asynchronous generator of C{(packetId, data)} tuples
+        """
+        v2 = 'shell_v2' in await self.getFeatures()
+        async with self.__connection() as (reader, writer):
+            await self.__setTransport(reader, writer)
+            await self.__send(reader, writer, ('shell,v2,raw:%s' if v2 else 'shell:%s') % cmd)
+            if not v2:
+                while True:
+                    try:
+                        chunk = await asyncio.wait_for(reader.read(64 * 1024), self.timeout)
+                    except asyncio.TimeoutError:
+                        raise Timer.TimeoutException("Timer shell has expired")
+                    if not chunk:
+                        break
+                    yield SHELL_V2_STDOUT, chunk
+                yield SHELL_V2_EXIT, None
+                return
+            while True:
+                (packetId, length) = struct.unpack('<BI', await self.__readExactly(reader, 5, "shell"))
+                data = await self.__readExactly(reader, length, "shell")
+                if packetId == SHELL_V2_EXIT:
+                    yield SHELL_V2_EXIT, data[0]
+                    return
+                yield packetId, data
+
+    async def exec_out(self, cmd):
+        """
+        Runs a command using the C{exec:} service, receiving its output as raw bytes.
+        See L{AdbClient.exec_out}.
+
+        As in L{shell_v2}, the connection and the C{semaphore} slot are held until the generator is exhausted or
+        closed, use it with C{aclosing} if it may not be consumed to the end.
+
+        :return: an asynchronous generator of the bytes received
+        """
+        version = self.getSdkVersion()
+        if version < 21:
+            raise RuntimeError("ERROR: exec: not supported for API < 21 (version=%d)" % version)
+        async with self.__connection() as (reader, writer):
+            await self.__setTransport(reader, writer)
+            await self.__send(reader, writer, 'exec:%s' % cmd)
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(reader.read(64 * 1024), self.timeout)
+                except asyncio.TimeoutError:
+                    raise Timer.TimeoutException("Timer exec has expired")
+                if not chunk:
+                    return
+                yield chunk
+
+    async def shell(self, cmd, _convertOutputToString=True):
+        """
+        Runs a command and returns its output, stdout and stderr merged.
+        """
+        chunks = []
+        async with aclosing(self.shell_v2(cmd)) as packets:
+            async for packetId, data in packets:
+                if packetId in (SHELL_V2_STDOUT, SHELL_V2_STDERR):
+                    chunks.append(data)
+        if _convertOutputToString:
+            return b''.join(chunks).decode('utf-8')
+        return b''.join(chunks)
+
+    async def getProperty(self, key, strip=True):
+        """
+        Gets the property value for key. The C{display.width}, C{display.height}, C{display.density} and
+        C{display.orientation} keys are obtained from the display info.
+        """
+        if key.startswith('display.'):
+            if not self.display:
+                await self.initDisplayProperties()
+            return self.display[key[len('display.'):]]
+        prop = await self.shell('getprop %s' % key)
+        if strip:
+            prop = prop.rstrip('\r\n')
+        return prop
+
+    def getSdkVersion(self):
+        """
+        Gets the SDK version, obtained by L{initDevice}.
+        """
+        return self.build[VERSION_SDK_PROPERTY]
+
+    async def getDisplayInfo(self):
+        """
+        Gets the logical display width, height and orientation from C{dumpsys display} and the density from the
+        C{ro.sf.lcd_density} property or C{wm density}.
+        """
+        displayInfo = {}
+        out, density = await asyncio.gather(self.shell('dumpsys display'), self.getProperty('ro.sf.lcd_density'))
+        for line in out.splitlines():
+            m = LOGICAL_DISPLAY_RE.search(line)
+            if m:
+                for prop in ['width', 'height', 'orientation']:
+                    displayInfo[prop] = int(m.group(prop))
+                break
+        else:
+            m = re.search(r'Physical size: (?P<width>\d+)x(?P<height>\d+)', await self.shell('wm size'))
+            if not m:
+                raise RuntimeError("Couldn't find display info in 'dumpsys display' or 'wm size'")
+            displayInfo['width'] = int(m.group('width'))
+            displayInfo['height'] = int(m.group('height'))
+            displayInfo['orientation'] = 0
+        if not density:
+            m = re.search(r'Physical density: (?P<density>\d+)', await self.shell('wm density'))
+            density = m.group('density') if m else None
+        displayInfo['density'] = float(density) / 160.0 if density else -1.0
+        return displayInfo
+
+    async def initDisplayProperties(self):
+        self.display = await self.getDisplayInfo()
+
+    def __transformPointByOrientation(self, initPoint, orientationOrig, orientationDest):
+        (x, y) = initPoint
+        if orientationOrig != orientationDest:
+            if orientationDest == 1:
+                _x = x
+                x = self.display['width'] - y
+                y = _x
+            elif orientationDest == 3:
+                _x = x
+                x = y
+                y = self.display['height'] - _x
+        return x, y
+
+    async def touch(self, x, y, orientation=-1):
+        if orientation == -1:
+            orientation = self.display['orientation']
+        version = self.getSdkVersion()
+        if version <= 10:
+            raise RuntimeError('touch: API <= 10 not supported (version=%d)' % version)
+        await self.shell('input tap %d %d' % self.__transformPointByOrientation((x, y), orientation,
+                                                                                self.display['orientation']))
+
+    async def drag(self, startCoords, endCoords, duration, steps=1, orientation=-1):
+        """
+        Sends drag event in PX (actually it's using C{input swipe} command).
+
+        @param startCoords: starting point in PX
+        @param endCoords: ending point in PX
+        @param duration: duration of the event in ms
+        @param steps: number of steps (currently ignored by C{input swipe})
+        @param orientation: the orientation (-1: undefined)
+        """
+        if orientation == -1:
+            orientation = self.display['orientation']
+        (x0, y0) = self.__transformPointByOrientation(startCoords, orientation, self.display['orientation'])
+        (x1, y1) = self.__transformPointByOrientation(endCoords, orientation, self.display['orientation'])
+        version = self.getSdkVersion()
+        if version <= 15:
+            raise RuntimeError('drag: API <= 15 not supported (version=%d)' % version)
+        elif version <= 17:
+            await self.shell('input swipe %d %d %d %d' % (x0, y0, x1, y1))
+        else:
+            await self.shell('input touchscreen swipe %d %d %d %d %d' % (x0, y0, x1, y1, duration))
+
+    async def takeSnapshot(self, box=None):
+        """
+        Takes a snapshot of the device and return it as a PIL Image.
+        The snapshot is for the entire screen or can be limited to the box if specified.
+
+        :param box: box as a tuple indicating (left, top, right, bottom) to crop the entire screen
+        :returns: the image
+        """
+        try:
+            from PIL import Image
+        except ImportError:
+            raise Exception("You have to install PIL to use takeSnapshot()")
+
+        sdkVersion = self.getSdkVersion()
+        if sdkVersion < 14 or sdkVersion >= 23:
+            async with self.__connection() as (reader, writer):
+                await self.__setTransport(reader, writer)
+                await self.__send(reader, writer, 'framebuffer:')
+                received = await self.__readExactly(reader, FRAMEBUFFER_HEADER_SIZE)
+                if struct.unpack_from('<L', received)[0] == 2:
+                    received += await self.__readExactly(reader, 4)
+                (version, bpp, size, width, height, mode, argMode, _) = decodeFramebufferHeader(received)
+                await self.__send(reader, writer, '\0', checkok=False)
+                received = await self.__readExactly(reader, size)
+            image = Image.frombuffer(mode, (width, height), received, 'raw', argMode, 0, 1)
+        else:
+            if sdkVersion >= 21:
+                async with aclosing(self.exec_out('/system/bin/screencap -p')) as chunks:
+                    received = b''.join([chunk async for chunk in chunks])
+            else:
+                # the legacy shell: service runs on a PTY translating '\n' into '\r\n'
+                received = (await self.shell('/system/bin/screencap -p', False)).replace(b'\r\n', b'\n')
+            if not received:
+                raise RuntimeError('"/system/bin/screencap -p" result was empty')
+            image = Image.open(io.BytesIO(received))
+
+        (w, h) = image.size
+        if self.display and w == self.display['height'] and h == self.display['width']:
+            r = (0, 90, 180, -90)[self.display['orientation']]
+            image = image.rotate(r, expand=True).resize((h, w))
+        if box:
+            return image.crop(box)
+        return image
@@ -62,7 +62,11 @@ class Dumpsys:
             args_str = ''
         if adbclient:
             cmd = 'dumpsys ' + subcommand + (' ' + args_str if args_str else '')
-            self.parse(adbclient.shell(cmd), subcommand, *args)
+            if Dumpsys.isParsedByLine(subcommand, *args):
+                # these outputs can be several MB, parse them as they are received
+                self.parse(adbclient.shell_lines(cmd), subcommand, *args)
+            else:
+                self.parse(adbclient.shell(cmd), subcommand, *args)
         else:
             warn('No adbclient specified')
 
@@ -77,7 +81,25 @@ class Dumpsys:
     def get(self, name):
         return getattr(self, name)
 
+    @staticmethod
+    def isParsedByLine(subcommand, *args):
+        """
+        Whether the output of this subcommand is parsed line by line, and then it's not kept.
+        """
+        if subcommand == Dumpsys.MEMINFO:
+            return True
+        if subcommand == Dumpsys.GFXINFO:
+            return Dumpsys.RESET not in args and Dumpsys.FRAMESTATS in args
+        if subcommand == Dumpsys.PACKAGE:
+            return len(args) > 0 and Dumpsys.isPackageName(args[0])
+        return False
+
     def parse(self, out, subcommand, *args):
+        """
+        Parses the output of dumpsys.
+
+        :param out: the output, as a string or, for the subcommands parsed by line, an iterable of lines
+        """
         if subcommand == Dumpsys.MEMINFO:
             self.parseMeminfo(out)
         elif subcommand == Dumpsys.GFXINFO:
@@ -106,76 +128,77 @@ class Dumpsys:
         return re.search(r'\S+\.\S+.*', name)
 
     def parsePackage(self, out):
-        lines = out.splitlines()
-        for i in range(len(lines)):
-            if re.match(r'\s*Non-Data Actions:', lines[i]):
-                if re.match(r'\s*android.intent.action.MAIN:', lines[i + 1]):
-                    a = lines[i + 2].split()
-                    if len(a) >= 4:
-                        self.package['main-activity'] = a[1]
+        if isinstance(out, str):
+            out = out.splitlines()
+        nonDataActions = False
+        mainAction = False
+        for line in out:
+            if mainAction:
+                a = line.split()
+                if len(a) >= 4:
+                    self.package['main-activity'] = a[1]
+            mainAction = nonDataActions and re.match(r'\s*android.intent.action.MAIN:', line)
+            nonDataActions = re.match(r'\s*Non-Data Actions:', line)
+
+    MEMINFO_RES = [(re.compile(r'Native Heap[ \t]*(\d+)'), 'nativeHeap'),
+                   (re.compile(r'Dalvik Heap[ \t]*(\d+)'), 'dalvikHeap'),
+                   (re.compile(r'Views:[ \t]*(\d+)'), 'views'),
+                   (re.compile(r'Activities:[ \t]*(\d+)'), 'activity'),
+                   (re.compile(r'AppContexts:[ \t]*(\d+)'), 'appContexts'),
+                   (re.compile(r'ViewRootImpl:[ \t]*(\d+)'), 'viewRootImpl'),
+                   (re.compile(r'TOTAL[ \t]*(\d+)'), 'total')]
 
     def parseMeminfo(self, out):
-        m = re.search(r'Native Heap[ \t]*(\d+)', out, re.MULTILINE)
-        if m:
-            self.nativeHeap = int(m.group(1))
-        m = re.search(r'Dalvik Heap[ \t]*(\d+)', out, re.MULTILINE)
-        if m:
-            self.dalvikHeap = int(m.group(1))
-        m = re.search(r'Views:[ \t]*(\d+)', out, re.MULTILINE)
-        if m:
-            self.views = int(m.group(1))
-        m = re.search(r'Activities:[ \t]*(\d+)', out, re.MULTILINE)
-        if m:
-            self.activity = int(m.group(1))
-        m = re.search(r'AppContexts:[ \t]*(\d+)', out, re.MULTILINE)
-        if m:
-            self.appContexts = int(m.group(1))
-        m = re.search(r'ViewRootImpl:[ \t]*(\d+)', out, re.MULTILINE)
-        if m:
-            self.viewRootImpl = int(m.group(1))
-
-        m = re.search(r'TOTAL[ \t]*(\d+)', out, re.MULTILINE)
-        if m:
-            self.total = int(m.group(1))
-        else:
-            raise RuntimeError(f'Cannot find TOTAL in "{out}"')
+        if isinstance(out, str):
+            out = out.splitlines()
+        pending = list(Dumpsys.MEMINFO_RES)
+        for line in out:
+            for e in list(pending):
+                m = e[0].search(line)
+                if m:
+                    # only the first occurrence counts
+                    setattr(self, e[1], int(m.group(1)))
+                    pending.remove(e)
+        if Dumpsys.MEMINFO_RES[-1] in pending:
+            raise RuntimeError('Cannot find TOTAL in dumpsys meminfo output')
 
     def parseGfxinfo(self, out):
         pass
 
     def parseGfxinfoFramestats(self, out):
         pd = '---PROFILEDATA---'
-        l = re.findall(r'%s.*?%s' % (pd, pd), out, re.DOTALL)
-        if l:
-            s = ''
-            for e in l:
-                if not e:
-                    continue
-                sl = e.splitlines()
-                for s in sl:
-                    if s == pd:
-                        continue
-                    pda = s.split(',')
-                    if pda[Dumpsys.FLAGS] == 'Flags':
-                        if pda[Dumpsys.INTENDED_VSYNC] != 'IntendedVsync' and \
-                                pda[Dumpsys.FRAME_COMPLETED] != 'FrameCompleted':
-                            raise RuntimeError('Unsupported gfxinfo version')
-                        continue
-                    if pda[Dumpsys.FLAGS] == '0':
-                        # Only keep lines with Flags=0
-                        # If this is non-zero the row should be ignored, as the frame has been determined as being an
-                        # outlier from normal performance, where it is expected that layout & draw take longer than
-                        # 16ms.
-                        # See https://developer.android.com/training/testing/performance.html#timing-info for details
-                        # on format
-                        if DEBUG:
-                            print('pda={}'.format(pda), file=sys.stderr)
-                        self.gfxProfileData.append(pda[:-1])
-                        # All done! The total time spent working on this frame can be computed by doing
-                        # FRAME_COMPLETED - INTENDED_VSYNC.
-                        self.framestats.append(
-                            (int(pda[Dumpsys.FRAME_COMPLETED]) - int(pda[Dumpsys.INTENDED_VSYNC])) / 10 ** 6)
-        else:
+        if isinstance(out, str):
+            out = out.splitlines()
+        found = False
+        inProfileData = False
+        for s in out:
+            if s == pd:
+                inProfileData = not inProfileData
+                found = True
+                continue
+            if not inProfileData:
+                continue
+            pda = s.split(',')
+            if pda[Dumpsys.FLAGS] == 'Flags':
+                if pda[Dumpsys.INTENDED_VSYNC] != 'IntendedVsync' and \
+                        pda[Dumpsys.FRAME_COMPLETED] != 'FrameCompleted':
+                    raise RuntimeError('Unsupported gfxinfo version')
+                continue
+            if pda[Dumpsys.FLAGS] == '0':
+                # Only keep lines with Flags=0
+                # If this is non-zero the row should be ignored, as the frame has been determined as being an
+                # outlier from normal performance, where it is expected that layout & draw take longer than
+                # 16ms.
+                # See https://developer.android.com/training/testing/performance.html#timing-info for details
+                # on format
+                if DEBUG:
+                    print('pda={}'.format(pda), file=sys.stderr)
+                self.gfxProfileData.append(pda[:-1])
+                # All done! The total time spent working on this frame can be computed by doing
+                # FRAME_COMPLETED - INTENDED_VSYNC.
+                self.framestats.append(
+                    (int(pda[Dumpsys.FRAME_COMPLETED]) - int(pda[Dumpsys.INTENDED_VSYNC])) / 10 ** 6)
+        if not found:
             raise RuntimeError('No profile data found')
 
     @staticmethod
@@ -0,0 +1,236 @@
+# coding=utf-8
+"""
+Copyright (C) 2012-2022  Diego Torres Milano
+Created on Dec 1, 2012
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+@author: Diego Torres Milano
+"""
+
+from __future__ import print_function
+
+import collections
+import socket
+import struct
+import sys
+import time
+
+__version__ = '25.0.0'
+
+DEBUG = False
+
+SYNC_DATA_MAX = 64 * 1024
+''' Maximum size of a DATA packet, it is also the size of the transfer buffer '''
+
+SYNC_PATH_MAX = 1024
+
+STAT_V1 = struct.Struct('<4sIII')
+''' id, mode, size, mtime '''
+STAT_V2 = struct.Struct('<4sIQQIIIIQqqq')
+''' id, error, dev, ino, mode, nlink, uid, gid, size, atime, mtime, ctime '''
+DENT_V1 = struct.Struct('<4sIIII')
+''' id, mode, size, mtime, namelen '''
+DENT_V2 = struct.Struct('<4sIQQIIIIQqqqI')
+''' id, error, dev, ino, mode, nlink, uid, gid, size, atime, mtime, ctime, namelen '''
+HEADER = struct.Struct('<4sI')
+''' id, length '''
+
+SyncStat = collections.namedtuple('SyncStat', ['mode', 'size', 'mtime', 'error', 'dev', 'ino', 'nlink', 'uid', 'gid',
+                                               'atime', 'ctime'])
+SyncStat.__new__.__defaults__ = (0,) * 8
+SyncStat.__doc__ = ''' The result of C{STAT} or C{STA2}, the fields after C{mtime} are only set by C{STA2} '''
+
+SyncDirEntry = collections.namedtuple('SyncDirEntry', ['name', 'stat'])
+
+
+class SyncConnection:
+    """
+    Implements the C{sync:} service over a socket already bound to a device transport.
+
+    Files are transferred in chunks of at most L{SYNC_DATA_MAX} bytes through a single reusable buffer, so the memory
+    used does not depend on the size of the file.
+    """
+
+    def __init__(self, sock, features=()):
+        """
+        Constructor.
+        Sends the C{sync:} request, after this the socket only speaks the sync protocol until L{close}.
+
+        :param sock: the socket, with the transport set
+        :param features: the device features, C{stat_v2} and C{ls_v2} enable the v2 requests
+        """
+        self.socket = sock
+        self.features = features
+        self.__buffer = bytearray(max(SYNC_DATA_MAX, STAT_V2.size, DENT_V2.size))
+        msg = b'sync:'
+        self.socket.sendall(b'%04X%s' % (len(msg), msg))
+        recv = self.__readExactly(4)
+        if recv != b'OKAY':
+            raise RuntimeError("ERROR: sync: %s %s" % (repr(recv), self.socket.recv(1024)))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        """
+        Ends the sync session and closes the socket.
+        """
+        try:
+            self.socket.sendall(HEADER.pack(b'QUIT', 0))
+        except socket.error:
+            pass
+        finally:
+            self.socket.close()
+
+    def __readInto(self, n):
+        """
+        Reads exactly C{n} bytes into the transfer buffer.
+
+        :return: a memoryview of the first C{n} bytes of the buffer, valid until the next read
+        """
+        view = memoryview(self.__buffer)[:n]
+        nr = 0
+        while nr < n:
+            l = self.socket.recv_into(view[nr:], n - nr)
+            if l == 0:
+                raise RuntimeError("ERROR: sync: connection closed after receiving %d of %d bytes" % (nr, n))
+            nr += l
+        return view
+
+    def __readExactly(self, n):
+        return bytes(self.__readInto(n))
+
+    def __request(self, _id, path):
+        path = path.encode('utf-8') if isinstance(path, str) else path
+        if len(path) > SYNC_PATH_MAX:
+            raise ValueError("path too long: %s" % path)
+        if DEBUG:
+            print("SyncConnection: %s %s" % (_id, path), file=sys.stderr)
+        self.socket.sendall(HEADER.pack(_id, len(path)) + path)
+
+    def __fail(self, length, what):
+        raise RuntimeError("ERROR: sync: %s: %s" % (what, self.__readExactly(length).decode('utf-8', 'replace')))
+
+    def stat(self, path):
+        """
+        Gets the status of a remote file, using C{STA2} when the device supports it.
+        With C{STAT} a nonexistent file has all the fields set to 0, with C{STA2} C{error} is set.
+
+        :param path: the remote path
+        :return: the L{SyncStat}
+        """
+        if 'stat_v2' in self.features:
+            return self.__statV2(b'STA2', path)
+        self.__request(b'STAT', path)
+        (_id, mode, size, mtime) = STAT_V1.unpack(self.__readInto(STAT_V1.size))
+        if _id != b'STAT':
+            raise RuntimeError("ERROR: sync: unexpected response to STAT: %s" % _id)
+        return SyncStat(mode, size, mtime)
+
+    def lstat(self, path):
+        """
+        Gets the status of a remote file not following symbolic links, using C{LST2}.
+        Only available on devices supporting C{stat_v2}.
+
+        :param path: the remote path
+        :return: the L{SyncStat}
+        """
+        if 'stat_v2' not in self.features:
+            raise RuntimeError("ERROR: sync: LST2 requires the stat_v2 feature")
+        return self.__statV2(b'LST2', path)
+
+    def __statV2(self, _id, path):
+        self.__request(_id, path)
+        (rid, error, dev, ino, mode, nlink, uid, gid, size, atime, mtime, ctime) = \
+            STAT_V2.unpack(self.__readInto(STAT_V2.size))
+        if rid != _id:
+            raise RuntimeError("ERROR: sync: unexpected response to %s: %s" % (_id, rid))
+        return SyncStat(mode, size, mtime, error, dev, ino, nlink, uid, gid, atime, ctime)
+
+    def listDirectory(self, path):
+        """
+        Lists a remote directory, using C{LIS2} when the device supports C{ls_v2}.
+        The whole listing has to be consumed before sending another request.
+
+        :param path: the remote path
+        :return: a generator of L{SyncDirEntry}
+        """
+        v2 = 'ls_v2' in self.features
+        dent = DENT_V2 if v2 else DENT_V1
+        self.__request(b'LIS2' if v2 else b'LIST', path)
+        while True:
+            fields = dent.unpack(self.__readInto(dent.size))
+            if fields[0] == b'DONE':
+                return
+            if fields[0] not in (b'DENT', b'DNT2'):
+                raise RuntimeError("ERROR: sync: unexpected response to LIST: %s" % fields[0])
+            name = self.__readExactly(fields[-1]).decode('utf-8', 'surrogateescape')
+            if v2:
+                (_, error, dev, ino, mode, nlink, uid, gid, size, atime, mtime, ctime, _) = fields
+                yield SyncDirEntry(name, SyncStat(mode, size, mtime, error, dev, ino, nlink, uid, gid, atime, ctime))
+            else:
+                (_, mode, size, mtime, _) = fields
+                yield SyncDirEntry(name, SyncStat(mode, size, mtime))
+
+    def send(self, stream, path, mode=0o644, mtime=None):
+        """
+        Sends (pushes) a stream to a remote file.
+
+        :param stream: the binary stream (i.e. a file opened with 'rb')
+        :param path: the remote path
+        :param mode: the remote file mode
+        :param mtime: the modification time, now if not specified
+        :return: the number of bytes sent
+        """
+        self.__request(b'SEND', '%s,%d' % (path, mode))
+        view = memoryview(self.__buffer)
+        total = 0
+        while True:
+            n = stream.readinto(view[HEADER.size:SYNC_DATA_MAX])
+            if not n:
+                break
+            HEADER.pack_into(self.__buffer, 0, b'DATA', n)
+            self.socket.sendall(view[:HEADER.size + n])
+            total += n
+        self.socket.sendall(HEADER.pack(b'DONE', int(time.time() if mtime is None else mtime)))
+        (_id, length) = HEADER.unpack(self.__readInto(HEADER.size))
+        if _id == b'FAIL':
+            self.__fail(length, 'SEND %s' % path)
+        if _id != b'OKAY':
+            raise RuntimeError("ERROR: sync: unexpected response to SEND: %s" % _id)
+        return total
+
+    def recv(self, path, stream):
+        """
+        Receives (pulls) a remote file writing it to a stream.
+
+        :param path: the remote path
+        :param stream: the binary stream (i.e. a file opened with 'wb')
+        :return: the number of bytes received
+        """
+        self.__request(b'RECV', path)
+        total = 0
+        while True:
+            (_id, length) = HEADER.unpack(self.__readInto(HEADER.size))
+            if _id == b'DONE':
+                return total
+            if _id == b'FAIL':
+                self.__fail(length, 'RECV %s' % path)
+            if _id != b'DATA' or length > SYNC_DATA_MAX:
+                raise RuntimeError("ERROR: sync: unexpected response to RECV: %s %d" % (_id, length))
+            stream.write(self.__readInto(length))
+            total += length
@@ -1,85 +1,281 @@
+import hashlib
 import sys
-from typing import Union
+from typing import Hashable, Optional, Sequence, Union
 
 DEBUG_DISTANCE = False
 
+BANDED_CELL_COST = 8
+''' The cost of a cell of the banded dynamic programming relative to a 64 bits word of the bit-parallel algorithm '''
 
-def levenshtein_distance(s: Union[bytes, str], t: Union[bytes, str]) -> int:
+IGNORED_ATTRIBUTES = frozenset(('uniqueId', 'oid'))
+''' The attributes that are not part of the UI structure, generated ids and ViewServer object hashes '''
+
+
+def levenshtein_distance(s: Union[bytes, str, Sequence], t: Union[bytes, str, Sequence],
+                         max_distance: Optional[int] = None) -> int:
     """
     Find the Levenshtein distance between two Strings.
 
-    Python version of Levenshtein distance method implemented in Java at
-    U{http://www.java2s.com/Code/Java/Data-Type/FindtheLevenshteindistancebetweentwoStrings.htm}.
-
     This is the number of changes needed to change one String into
     another, where each change is a single character modification (deletion,
-    insertion or substitution).
-
-    The previous implementation of the Levenshtein distance algorithm
-    was from U{http://www.merriampark.com/ld.htm}
-
-    Chas Emerick has written an implementation in Java, which avoids an OutOfMemoryError
-    which can occur when my Java implementation is used with very large strings.
-    This implementation of the Levenshtein distance algorithm
-    is from U{http://www.merriampark.com/ldjava.htm}::
-
-        StringUtils.getLevenshteinDistance(null, *)             = IllegalArgumentException
-        StringUtils.getLevenshteinDistance(*, null)             = IllegalArgumentException
-        StringUtils.getLevenshteinDistance("","")               = 0
-        StringUtils.getLevenshteinDistance("","a")              = 1
-        StringUtils.getLevenshteinDistance("aaapppp", "")       = 7
-        StringUtils.getLevenshteinDistance("frog", "fog")       = 1
-        StringUtils.getLevenshteinDistance("fly", "ant")        = 3
-        StringUtils.getLevenshteinDistance("elephant", "hippo") = 7
-        StringUtils.getLevenshteinDistance("hippo", "elephant") = 7
-        StringUtils.getLevenshteinDistance("hippo", "zzzzzzzz") = 8
-        StringUtils.getLevenshteinDistance("hello", "hallo")    = 1
+    insertion or substitution)::
+
+        levenshtein_distance(None, *)             = ValueError
+        levenshtein_distance(*, None)             = ValueError
+        levenshtein_distance("","")               = 0
+        levenshtein_distance("","a")              = 1
+        levenshtein_distance("aaapppp", "")       = 7
+        levenshtein_distance("frog", "fog")       = 1
+        levenshtein_distance("fly", "ant")        = 3
+        levenshtein_distance("elephant", "hippo") = 7
+        levenshtein_distance("hippo", "elephant") = 7
+        levenshtein_distance("hippo", "zzzzzzzz") = 8
+        levenshtein_distance("hello", "hallo")    = 1
+
+    The distance is calculated by the bit-parallel algorithm of Myers, as formulated by Hyyrö for the edit distance,
+    processing a column of the dynamic programming matrix per character of the longer String, with Python integers
+    as bit vectors of the length of the shorter one. When C{max_distance} is specified, it stops as soon as the
+    distance can't be within it and, for a small C{max_distance}, only the diagonal band of the matrix where it
+    could be is calculated.
+
+    Any sequences of hashable elements can be compared, see L{token_distance}.
 
     @param s:  the first String, must not be null
     @param t:  the second String, must not be null
-    @return: result distance
+    @param max_distance: the maximum distance of interest or C{None}
+    @return: result distance, or C{max_distance + 1} if it is greater than C{max_distance}
     @raise ValueError: if either String input C{null}
     """
     if s is None or t is None:
         raise ValueError("Strings must not be None")
 
-    n = len(s)
-    m = len(t)
+    if len(s) > len(t):
+        s, t = t, s
+    m = len(s)
+    n = len(t)
+
+    if max_distance is not None:
+        if max_distance < 0:
+            raise ValueError("max_distance must not be negative")
+        if n - m > max_distance:
+            return max_distance + 1
+        if (2 * max_distance + 1) * BANDED_CELL_COST < m // 64 + 1:
+            return banded_levenshtein_distance(s, t, max_distance)
+
+    # the common prefix and suffix don't change the distance
+    start = 0
+    while start < m and s[start] == t[start]:
+        start += 1
+    end = 0
+    while end < m - start and s[m - 1 - end] == t[n - 1 - end]:
+        end += 1
+    if start or end:
+        s = s[start:m - end]
+        t = t[start:n - end]
+        m = len(s)
+        n = len(t)
+    if m == 0:
+        return n if max_distance is None else min(n, max_distance + 1)
+
+    peq = {}
+    bit = 1
+    for c in s:
+        peq[c] = peq.get(c, 0) | bit
+        bit <<= 1
+    mask = bit - 1
+    last = bit >> 1
+    pv = mask
+    mv = 0
+    score = m
+    limit = n + (max_distance if max_distance is not None else n + m)
+    for j, c in enumerate(t):
+        eq = peq.get(c, 0)
+        xv = eq | mv
+        xh = (((eq & pv) + pv) ^ pv) | eq
+        ph = mv | (~(xh | pv) & mask)
+        mh = pv & xh
+        if ph & last:
+            score += 1
+        elif mh & last:
+            score -= 1
+        if score + j > limit:
+            # the score can decrease at most by one per remaining character
+            if DEBUG_DISTANCE:
+                print("levenshtein_distance: greater than %d at %d of %d" % (max_distance, j, n), file=sys.stderr)
+            return max_distance + 1
+        ph = ((ph << 1) | 1) & mask
+        mh = (mh << 1) & mask
+        pv = mh | (~(xv | ph) & mask)
+        mv = ph & xv
+
+    if max_distance is not None and score > max_distance:
+        return max_distance + 1
+    return score
+
+
+def banded_levenshtein_distance(s: Union[bytes, str, Sequence], t: Union[bytes, str, Sequence],
+                                max_distance: int) -> int:
+    """
+    Finds the Levenshtein distance only if it is not greater than C{max_distance}, calculating the diagonal band of
+    width C{2 * max_distance + 1} of the dynamic programming matrix (Ukkonen), so it takes time proportional to
+    C{len(t) * max_distance} regardless of the length of the Strings.
+
+    @param s:  the first String
+    @param t:  the second String
+    @param max_distance: the maximum distance of interest
+    @return: the distance, or C{max_distance + 1} if it is greater than C{max_distance}
+    """
+    if s is None or t is None:
+        raise ValueError("Strings must not be None")
+    if len(s) > len(t):
+        s, t = t, s
+    m = len(s)
+    n = len(t)
+    k = max_distance
+    over = k + 1
+    if n - m > k:
+        return over
+    # the row i keeps the columns from max(0, i - k) to min(n, i + k)
+    prev = list(range(min(n, k) + 1))
+    prevLo = 0
+    for i in range(1, m + 1):
+        lo = max(0, i - k)
+        hi = min(n, i + k)
+        c = s[i - 1]
+        cur = []
+        best = over
+        left = over
+        for j in range(lo, hi + 1):
+            if j == 0:
+                v = i
+            else:
+                p = j - 1 - prevLo
+                # substitution, or match, from the diagonal
+                v = prev[p] + (c != t[j - 1]) if p >= 0 else over
+                # deletion from above
+                if p + 1 < len(prev):
+                    above = prev[p + 1] + 1
+                    if above < v:
+                        v = above
+                # insertion from the left
+                if left + 1 < v:
+                    v = left + 1
+                if v > over:
+                    v = over
+            cur.append(v)
+            left = v
+            if v < best:
+                best = v
+        if best > k:
+            return over
+        prev = cur
+        prevLo = lo
+    d = prev[n - prevLo]
+    return d if d <= k else over
+
 
-    if n == 0:
-        return m
-    elif m == 0:
-        return n
+def token_distance(tokens1: Sequence[Hashable], tokens2: Sequence[Hashable],
+                   max_distance: Optional[int] = None) -> int:
+    """
+    Finds the edit distance between two sequences of tokens, i.e. the signatures of the Views of two trees, as the
+    number of tokens inserted, deleted or substituted.
 
-    if n > m:
-        tmp = s
-        s = t
-        t = tmp
-        n = m
-        m = len(t)
+    @param tokens1: the first sequence
+    @param tokens2: the second sequence
+    @param max_distance: the maximum distance of interest or C{None}
+    @return: the distance, or C{max_distance + 1} if it is greater than C{max_distance}
+    """
+    return levenshtein_distance(tokens1, tokens2, max_distance)
 
-    p = [0] * (n + 1)
-    d = [0] * (n + 1)
 
-    for i in range(0, n + 1):
-        p[i] = i
+def subtree_hash(attrs: dict, children_hashes=()) -> bytes:
+    """
+    Calculates the structural (Merkle) hash of a View from its attributes and the hashes of its children.
 
-    for j in range(1, m + 1):
-        if DEBUG_DISTANCE:
-            if j % 100 == 0:
-                print("DEBUG:", int(j / (m + 1.0) * 100), "%\r", end=' ', file=sys.stderr)
-        t_j = t[j - 1]
-        d[0] = j
+    Two subtrees having the same hash have the same attributes, in the same order as they were dumped, except
+    L{IGNORED_ATTRIBUTES}, and the same children.
 
-        for i in range(1, n + 1):
-            cost = 0 if s[i - 1] == t_j else 1
-            #  minimum of cell to the left+1, to the top+1, diagonally left and up +cost
-            d[i] = min(min(d[i - 1] + 1, p[i] + 1), p[i - 1] + cost)
+    @param attrs: the attributes of the View
+    @param children_hashes: the hashes of the children, in order
+    @return: the 16 bytes hash
+    """
+    h = hashlib.blake2b(
+        '\x1f'.join(['%s=%s' % (k, v) for k, v in attrs.items() if k not in IGNORED_ATTRIBUTES]).encode(
+            'utf-8', 'surrogatepass'), digest_size=16)
+    for child_hash in children_hashes:
+        h.update(child_hash)
+    return h.digest()
+
+
+def same_attributes(attrs1: dict, attrs2: dict) -> bool:
+    """
+    Compares the attributes of two Views, except L{IGNORED_ATTRIBUTES}.
+    """
+    keys1 = attrs1.keys() - IGNORED_ATTRIBUTES
+    if keys1 != attrs2.keys() - IGNORED_ATTRIBUTES:
+        return False
+    return all(attrs1[k] == attrs2[k] for k in keys1)
 
-        _d = p
-        p = d
-        d = _d
 
+def tree_size(root) -> int:
+    """
+    Counts the Views of a tree.
+    """
+    n = 0
+    stack = [root]
+    while stack:
+        view = stack.pop()
+        n += 1
+        stack.extend(view.children)
+    return n
+
+
+def tree_distance(root1, root2) -> int:
+    """
+    Finds the structural distance between two View trees: the number of Views removed from the first, added in the
+    second and modified, that is, present in both but with different attributes.
+
+    The identical subtrees are found comparing their hashes (see L{View.getSubtreeHash}), so their cost is
+    constant. The rest of the Views are matched, starting at the roots, by their class, id and occurrence among
+    the siblings having the same class and id.
+
+    @param root1: the root of the first tree
+    @param root2: the root of the second tree
+    @return: the distance, 0 if the trees are equal
+    """
+    if root1.getSubtreeHash() == root2.getSubtreeHash():
+        return 0
+    if root1.map.get('class') != root2.map.get('class') or root1.getId() != root2.getId():
+        return tree_size(root1) + tree_size(root2)
+    d = 0 if same_attributes(root1.map, root2.map) else 1
+    identical = {}
+    for child in root1.children:
+        identical.setdefault(child.getSubtreeHash(), []).append(child)
+    matched = set()
+    rest2 = []
+    for child in root2.children:
+        same = identical.get(child.getSubtreeHash())
+        if same:
+            matched.add(id(same.pop(0)))
+        else:
+            rest2.append(child)
+    counts = {}
+    rest1 = {}
+    for child in root1.children:
+        if id(child) not in matched:
+            k = (child.map.get('class'), child.getId())
+            n = counts.get(k, 0)
+            counts[k] = n + 1
+            rest1[k + (n,)] = child
+    counts = {}
+    for child in rest2:
+        k = (child.map.get('class'), child.getId())
+        n = counts.get(k, 0)
+        counts[k] = n + 1
+        match = rest1.pop(k + (n,), None)
+        d += tree_size(child) if match is None else tree_distance(match, child)
+    for child in rest1.values():
+        d += tree_size(child)
     if DEBUG_DISTANCE:
-        print("\n", file=sys.stderr)
-    return p[n]
+        print("tree_distance: %s %s: %d" % (root1.map.get('class'), root1.getId(), d), file=sys.stderr)
+    return d
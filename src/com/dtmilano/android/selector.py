@@ -0,0 +1,440 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright (C) 2012-2024  Diego Torres Milano
+Created on Oct 18, 2026
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+@author: Diego Torres Milano
+
+Selectors
+=========
+A selector finds L{View}s in a tree using a syntax similar to CSS selectors::
+
+    Button
+    android.widget.TextView[text="OK"]
+    #com.example:id/list > LinearLayout TextView:clickable
+    [content-desc~="^Navigate"]:index(0), #toolbar *:contains(540,100)
+
+A selector is a comma separated list of alternatives, each one a list of compound selectors separated by a
+combinator, C{>} for a child and whitespace for a descendant. A compound selector is an optional class, the simple
+name (i.e. C{TextView}), the fully qualified name or C{*}, followed by any number of:
+
+    - C{#id}: the id, fully qualified (i.e. C{#com.example:id/item} or C{#id/item}) or just the name (C{#item})
+    - C{[attr]}: the attribute exists
+    - C{[attr=value]}, C{[attr!=value]}: the attribute is or is not equal to the value
+    - C{[attr^=value]}, C{[attr$=value]}, C{[attr*=value]}: the attribute starts with, ends with or contains the value
+    - C{[attr~=regex]}: the attribute matches the regular expression, using C{search}
+    - C{:clickable}, C{:checkable}, C{:checked}, C{:enabled}, C{:focusable}, C{:focused}, C{:long-clickable},
+      C{:scrollable}, C{:selected}, C{:password}: the flag is C{true}
+    - C{:visible}: the View has a non empty area
+    - C{:index(n)}: the View is the n-th child of its parent, starting at 0
+    - C{:contains(x,y)}: the bounds contain the point
+    - C{:within(left,top,right,bottom)}: the bounds are inside the rectangle
+
+Values can be quoted with single or double quotes, using C{\\} to escape the quote.
+
+A selector is compiled once, by L{compileSelector}, into a plan that is run against the L{ViewIndex} of the tree:
+the candidates are the Views having the attribute value of an equality in the last compound selector, found in the
+index, or the Views of the subtree otherwise, in pre-order, and the rest of the selector is checked walking up the
+ancestors of every candidate.
+"""
+
+from __future__ import print_function
+
+import functools
+import re
+import sys
+from itertools import islice
+
+DEBUG = False
+
+FIRST = 'first'
+ALL = 'all'
+COUNT = 'count'
+
+FLAGS = ('clickable', 'checkable', 'checked', 'enabled', 'focusable', 'focused', 'long-clickable', 'scrollable',
+         'selected', 'password')
+''' The flags that can be used as pseudo-classes, named as the UiAutomator attributes '''
+
+
+class Compound:
+    """
+    A compound selector, all its predicates have to be true for a View.
+    """
+
+    __slots__ = ('predicates', 'className', 'id', 'equals')
+
+    def __init__(self):
+        self.predicates = []
+        ''' The functions receiving a View and returning whether it matches '''
+        self.className = None
+        self.id = None
+        self.equals = None
+        ''' The first (attr, value) equality, used to find the candidates in the index '''
+
+    def matches(self, view):
+        for predicate in self.predicates:
+            if not predicate(view):
+                return False
+        return True
+
+    def key(self, idAttr):
+        """
+        Gets the (attr, value) to find the candidates in the index, if any.
+
+        @param idAttr: the attribute containing the id in this tree
+        """
+        if self.id is not None and '/' in self.id:
+            return idAttr, self.id
+        if self.equals is not None:
+            return self.equals
+        if self.className is not None and '.' in self.className:
+            return 'class', self.className
+        return None
+
+
+class Selector:
+    """
+    A compiled selector, see the module documentation for the syntax.
+    """
+
+    def __init__(self, selector):
+        self.selector = selector
+        self.alternatives = []
+        ''' The lists of (combinator, L{Compound}), the combinator of the first one is C{None} '''
+        self.__s = selector
+        self.__i = 0
+        self.__parse()
+
+    def __str__(self):
+        return self.selector
+
+    def __repr__(self):
+        return 'Selector(%r)' % self.selector
+
+    # -- parsing --
+
+    def __error(self, msg):
+        raise ValueError("Invalid selector %r at %d: %s" % (self.__s, self.__i, msg))
+
+    def __peek(self):
+        return self.__s[self.__i] if self.__i < len(self.__s) else ''
+
+    def __skipSpaces(self):
+        n = len(self.__s)
+        start = self.__i
+        while self.__i < n and self.__s[self.__i].isspace():
+            self.__i += 1
+        return self.__i > start
+
+    def __readUntil(self, stop, allowId=False):
+        s = self.__s
+        n = len(s)
+        start = self.__i
+        while self.__i < n and not s[self.__i].isspace():
+            if allowId and s[self.__i] == ':' and s.startswith('id/', self.__i + 1):
+                # the package separator of a fully qualified id, not a pseudo-class
+                self.__i += 4
+                continue
+            if s[self.__i] in stop:
+                break
+            self.__i += 1
+        return s[start:self.__i]
+
+    def __readValue(self, stop):
+        quote = self.__peek()
+        if quote not in ('"', "'"):
+            value = self.__readUntil(stop)
+            if not value:
+                self.__error("value expected")
+            return value
+        s = self.__s
+        self.__i += 1
+        value = []
+        while self.__i < len(s) and s[self.__i] != quote:
+            if s[self.__i] == '\\' and self.__i + 1 < len(s):
+                self.__i += 1
+            value.append(s[self.__i])
+            self.__i += 1
+        if self.__i >= len(s):
+            self.__error("unterminated string")
+        self.__i += 1
+        return ''.join(value)
+
+    def __expect(self, c):
+        if self.__peek() != c:
+            self.__error("%r expected" % c)
+        self.__i += 1
+
+    def __parse(self):
+        steps = []
+        combinator = None
+        self.__skipSpaces()
+        while True:
+            steps.append((combinator, self.__parseCompound()))
+            spaces = self.__skipSpaces()
+            c = self.__peek()
+            if c == '':
+                self.alternatives.append(steps)
+                return
+            if c == ',':
+                self.__i += 1
+                self.__skipSpaces()
+                self.alternatives.append(steps)
+                steps = []
+                combinator = None
+            elif c == '>':
+                self.__i += 1
+                self.__skipSpaces()
+                combinator = '>'
+            elif spaces:
+                combinator = ' '
+            else:
+                self.__error("unexpected %r" % c)
+
+    def __parseCompound(self):
+        compound = Compound()
+        c = self.__peek()
+        if c == '*':
+            self.__i += 1
+        elif c and c not in '#[:,>':
+            name = self.__readUntil('#[:,>')
+            compound.className = name
+            if '.' in name:
+                compound.predicates.append(lambda view: view.map.get('class') == name)
+            else:
+                suffix = '.' + name
+                compound.predicates.append(
+                    lambda view: view.map.get('class', '').endswith(suffix) or view.map.get('class') == name)
+        elif c not in ('#', '[', ':'):
+            self.__error("selector expected")
+        while True:
+            c = self.__peek()
+            if c == '#':
+                self.__i += 1
+                _id = self.__readUntil('#[:,>', allowId=True)
+                if not _id:
+                    self.__error("id expected")
+                compound.id = _id
+                compound.predicates.append(self.__idPredicate(_id))
+            elif c == '[':
+                self.__i += 1
+                self.__parseAttribute(compound)
+            elif c == ':':
+                self.__i += 1
+                self.__parsePseudo(compound)
+            else:
+                return compound
+
+    @staticmethod
+    def __idPredicate(_id):
+        suffix = '/' + _id
+
+        def predicate(view):
+            value = view.getId()
+            return value is not None and (value == _id or ('/' not in _id and value.endswith(suffix)))
+
+        return predicate
+
+    def __parseAttribute(self, compound):
+        self.__skipSpaces()
+        attr = self.__readUntil('=!~^$*]')
+        if not attr:
+            self.__error("attribute expected")
+        self.__skipSpaces()
+        if self.__peek() == ']':
+            self.__i += 1
+            compound.predicates.append(lambda view: attr in view.map)
+            return
+        op = self.__peek()
+        if op != '=':
+            self.__i += 1
+        self.__expect('=')
+        self.__skipSpaces()
+        value = self.__readValue(']')
+        self.__skipSpaces()
+        self.__expect(']')
+        if op == '=':
+            if compound.equals is None:
+                compound.equals = (attr, value)
+            predicate = lambda view: view.map.get(attr) == value
+        elif op == '!':
+            predicate = lambda view: view.map.get(attr) != value
+        elif op == '^':
+            predicate = lambda view: attr in view.map and str(view.map[attr]).startswith(value)
+        elif op == '$':
+            predicate = lambda view: attr in view.map and str(view.map[attr]).endswith(value)
+        elif op == '*':
+            predicate = lambda view: attr in view.map and value in str(view.map[attr])
+        elif op == '~':
+            try:
+                regex = re.compile(value)
+            except re.error as ex:
+                self.__error("invalid regular expression: %s" % ex)
+            predicate = lambda view: attr in view.map and regex.search(str(view.map[attr])) is not None
+        else:
+            self.__error("unknown operator %r" % op)
+        compound.predicates.append(predicate)
+
+    def __parseArguments(self, n):
+        self.__expect('(')
+        args = self.__readUntil(')').split(',')
+        self.__expect(')')
+        try:
+            args = [int(a) for a in args]
+        except ValueError:
+            self.__error("integer arguments expected")
+        if len(args) != n:
+            self.__error("%d arguments expected" % n)
+        return args
+
+    def __parsePseudo(self, compound):
+        name = self.__readUntil('#[:,>(')
+        if name in FLAGS:
+            if name == 'focused':
+                predicate = lambda view: view.isFocused()
+            else:
+                predicate = lambda view: view.map.get(name) == 'true'
+        elif name == 'visible':
+            def predicate(view):
+                ((left, top), (right, bottom)) = view.getBounds()
+                return right > left and bottom > top
+        elif name == 'index':
+            (index,) = self.__parseArguments(1)
+
+            def predicate(view):
+                parent = view.parent
+                return parent is not None and index < len(parent.children) and parent.children[index] is view
+        elif name == 'contains':
+            point = tuple(self.__parseArguments(2))
+            predicate = lambda view: view.containsPoint(point)
+        elif name == 'within':
+            (l, t, r, b) = self.__parseArguments(4)
+
+            def predicate(view):
+                ((left, top), (right, bottom)) = view.getBounds()
+                return left >= l and top >= t and right <= r and bottom <= b
+        else:
+            self.__error("unknown pseudo-class %r" % name)
+        compound.predicates.append(predicate)
+
+    # -- matching --
+
+    @staticmethod
+    def __matchesAncestors(steps, k, view, root):
+        """
+        Checks the compound selectors before C{steps[k]}, already matched by C{view}, against its ancestors up to
+        C{root}.
+        """
+        if k == 0:
+            return True
+        (combinator, _) = steps[k]
+        compound = steps[k - 1][1]
+        ancestor = view.parent if view is not root else None
+        while ancestor is not None:
+            if compound.matches(ancestor) and Selector.__matchesAncestors(steps, k - 1, ancestor, root):
+                return True
+            if combinator == '>':
+                return False
+            ancestor = ancestor.parent if ancestor is not root else None
+        return False
+
+    def matches(self, view, root=None):
+        """
+        Checks whether a View matches, the ancestors are checked up to C{root} or the root of the tree.
+        """
+        for steps in self.alternatives:
+            if steps[-1][1].matches(view) and self.__matchesAncestors(steps, len(steps) - 1, view, root):
+                return True
+        return False
+
+    def __candidates(self, steps, index, root):
+        top = root or index.root
+        key = steps[-1][1].key('resource-id' if 'resource-id' in top.map else top.idProperty)
+        if key is not None:
+            if DEBUG:
+                print("Selector: candidates for %r from %s=%r" % (self.selector, key[0], key[1]), file=sys.stderr)
+            return index.findAll(key[0], key[1], root)
+        (start, end) = index.subtree(root)
+        return islice(index.views, start, end)
+
+    def __iterate(self, steps, index, root):
+        last = steps[-1][1]
+        n = len(steps) - 1
+        for view in self.__candidates(steps, index, root):
+            if last.matches(view) and self.__matchesAncestors(steps, n, view, root or index.root):
+                yield view
+
+    def first(self, index, root=None):
+        """
+        Finds the first View, in pre-order, in the subtree of C{root}, the whole tree if not specified.
+
+        @param index: the L{ViewIndex} of the tree
+        @return: the View or C{None}
+        """
+        found = None
+        for steps in self.alternatives:
+            view = next(self.__iterate(steps, index, root), None)
+            if view is not None and (found is None or index.position(view) < index.position(found)):
+                found = view
+        return found
+
+    def all(self, index, root=None):
+        """
+        Finds all the Views in the subtree of C{root}, the whole tree if not specified.
+
+        @param index: the L{ViewIndex} of the tree
+        @return: the list of Views in pre-order
+        """
+        if len(self.alternatives) == 1:
+            return list(self.__iterate(self.alternatives[0], index, root))
+        found = {}
+        for steps in self.alternatives:
+            for view in self.__iterate(steps, index, root):
+                found[index.position(view)] = view
+        return [found[p] for p in sorted(found)]
+
+    def count(self, index, root=None):
+        """
+        Counts the Views in the subtree of C{root}, the whole tree if not specified.
+
+        @param index: the L{ViewIndex} of the tree
+        """
+        if len(self.alternatives) == 1:
+            return sum(1 for _ in self.__iterate(self.alternatives[0], index, root))
+        return len(self.all(index, root))
+
+    def run(self, index, root=None, mode=ALL):
+        """
+        Runs the selector in one of the modes L{FIRST}, L{ALL} or L{COUNT}.
+        """
+        if mode == FIRST:
+            return self.first(index, root)
+        if mode == ALL:
+            return self.all(index, root)
+        if mode == COUNT:
+            return self.count(index, root)
+        raise ValueError("Invalid mode: %s" % mode)
+
+
+@functools.lru_cache(maxsize=256)
+def compileSelector(selector):
+    """
+    Compiles a selector, the compiled selectors are cached.
+
+    @type selector: str
+    @return: the L{Selector}
+    @raise ValueError: if the selector is not valid
+    """
+    return Selector(selector)
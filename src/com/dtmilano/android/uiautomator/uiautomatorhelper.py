@@ -22,6 +22,7 @@ from __future__ import print_function
 
 __version__ = '25.0.0'
 
+import functools
 import math
 import os
 import platform
@@ -105,6 +106,23 @@ def check_response(response: StatusResponse) -> None:
         raise RuntimeError(response)
 
 
+def sends_input(method):
+    """
+    Decorates the methods of the API's sending input to the device, counting them in
+    L{UiAutomatorHelper.inputCount}.
+
+    :param method: the method
+    :return: the decorated method
+    """
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        self.uiAutomatorHelper.inputCount += 1
+        return method(self, *args, **kwargs)
+
+    return wrapper
+
+
 class UiAutomatorHelper:
     """
     UiAutomatorHelper is a backend for AndroidViewClient.
@@ -143,6 +161,9 @@ class UiAutomatorHelper:
         ''' Is it macOS? '''
         self.hostname = hostname
         ''' The hostname we are connecting to. '''
+        self.inputCount = 0
+        ''' The number of input actions (clicks, swipes, key presses, text...) sent, the screen may have changed if it
+            is different from a previous value '''
 
         print(
             f'⚠️  CulebraTester2 server should have been started and localport {localport} redirected to remote port {remoteport}.',
@@ -394,6 +415,7 @@ class UiAutomatorHelper:
         def __init__(self, uiAutomatorHelper) -> None:
             super().__init__(uiAutomatorHelper)
 
+        @sends_input
         def start_activity(self, pkg, cls, **kwargs):
             """
             Starts an activity.
@@ -457,6 +479,7 @@ class UiAutomatorHelper:
         def __init__(self, uiAutomatorHelper) -> None:
             super().__init__(uiAutomatorHelper)
 
+        @sends_input
         def click(self, x: int, y: int):
             """
             Clicks on the specified coordinates.
@@ -477,6 +500,7 @@ class UiAutomatorHelper:
             """
             return self.uiAutomatorHelper.api_instance.ui_device_display_size_dp_get()
 
+        @sends_input
         def drag(self, start_x: int, start_y: int, end_x: int, end_y: int, steps: int) -> None:
             """Performs a swipe from one coordinate to another coordinate.
 
@@ -555,6 +579,7 @@ class UiAutomatorHelper:
             body = culebratester_client.Selector(**kwargs)
             return self.uiAutomatorHelper.api_instance.ui_device_has_object_post(body=body).value
 
+        @sends_input
         def press_back(self) -> None:
             """
             Presses BACK.
@@ -564,6 +589,7 @@ class UiAutomatorHelper:
             """
             check_response(self.uiAutomatorHelper.api_instance.ui_device_press_back_get())
 
+        @sends_input
         def press_enter(self) -> None:
             """
             Presses ENTER.
@@ -573,6 +599,7 @@ class UiAutomatorHelper:
             """
             check_response(self.uiAutomatorHelper.api_instance.ui_device_press_enter_get())
 
+        @sends_input
         def press_home(self) -> None:
             """
             Presses HOME.
@@ -582,6 +609,7 @@ class UiAutomatorHelper:
             """
             check_response(self.uiAutomatorHelper.api_instance.ui_device_press_home_get())
 
+        @sends_input
         def press_recent_apps(self) -> None:
             """
             Press recent apps.
@@ -591,6 +619,7 @@ class UiAutomatorHelper:
             """
             check_response(self.uiAutomatorHelper.api_instance.ui_device_press_recent_apps_get())
 
+        @sends_input
         def press_key_code(self, key_code: int, meta_state: int = 0) -> None:
             """
             Presses a key code.
@@ -603,6 +632,7 @@ class UiAutomatorHelper:
             check_response(self.uiAutomatorHelper.api_instance.ui_device_press_key_code_get(key_code=key_code,
                                                                                             meta_state=meta_state))
 
+        @sends_input
         def swipe(self, **kwargs) -> None:
             """
             Swipes.
@@ -786,6 +816,7 @@ class UiAutomatorHelper:
             return self.uiAutomatorHelper.api_instance.ui_object_oid_get_from_parent_get(oid,
                                                                                          ui_selector=ui_selector)
 
+        @sends_input
         def perform_two_pointer_gesture(self, oid: int, startPoint1: Tuple[int, int], startPoint2: Tuple[int, int],
                                         endPoint1: Tuple[int, int], endPoint2: Tuple[int, int], steps: int) -> None:
             """
@@ -809,6 +840,7 @@ class UiAutomatorHelper:
                                                                                                           body=body)
             check_response(response)
 
+        @sends_input
         def pinch_in(self, oid: int, percentage: int, steps: int = 50) -> None:
             """
             Performs a two-pointer gesture, where each pointer moves diagonally toward the other, from the edges to the
@@ -824,6 +856,7 @@ class UiAutomatorHelper:
                                                                                       steps=steps)
             check_response(response)
 
+        @sends_input
         def pinch_out(self, oid: int, percentage: int, steps: int = 50) -> None:
             """
             Performs a two-pointer gesture, where each pointer moves diagonally opposite across the other, from the
@@ -853,6 +886,7 @@ class UiAutomatorHelper:
         def __init__(self, uiAutomatorHelper) -> None:
             super().__init__(uiAutomatorHelper)
 
+        @sends_input
         def clear(self, oid: int) -> None:
             """
             Clears the text content if this object is an editable field.
@@ -862,6 +896,7 @@ class UiAutomatorHelper:
             """
             check_response(self.uiAutomatorHelper.api_instance.ui_object2_clear_get(oid=oid))
 
+        @sends_input
         def click(self, oid: int) -> None:
             """
             Clicks on this object.
@@ -871,6 +906,7 @@ class UiAutomatorHelper:
             """
             check_response(self.uiAutomatorHelper.api_instance.ui_object2_oid_click_get(oid=oid))
 
+        @sends_input
         def click_and_wait(self, oid: int, event_condition_ref, timeout=10000) -> None:
             """
             Clicks and wait.
@@ -911,6 +947,7 @@ class UiAutomatorHelper:
             """
             return self.uiAutomatorHelper.api_instance.ui_object2_oid_get_text_get(oid=oid)
 
+        @sends_input
         def long_click(self, oid: int) -> None:
             """
             Performs a long click on this object.
@@ -920,6 +957,7 @@ class UiAutomatorHelper:
             """
             check_response(self.uiAutomatorHelper.api_instance.ui_object2_oid_long_click_get(oid=oid))
 
+        @sends_input
         def set_text(self, oid: int, text: str):
             """
             Sets the text content if this object is an editable field.
@@ -32,8 +32,11 @@ import sys
 import warnings
 
 import com.dtmilano.android.keyevent
-from com.dtmilano.android.adb.adbclient import AdbClient
-from com.dtmilano.android.distance import levenshtein_distance
+from com.dtmilano.android.adb.adbclient import AdbClient, SHELL_V2_EXIT
+from com.dtmilano.android.distance import levenshtein_distance, same_attributes, subtree_hash, token_distance, \
+    tree_distance
+from com.dtmilano.android.selector import Selector, compileSelector
+from com.dtmilano.android.wait import WAIT_TIMEOUT, waitUntil, waitUntilStable
 
 if sys.executable:
     if 'monkeyrunner' in sys.executable:
@@ -48,16 +51,16 @@ import re
 import socket
 import os
 import time
+import bisect
 import signal
 import copy
-import pickle
 import platform
 import xml.parsers.expat
 import unittest
 import io
 from com.dtmilano.android.common import _nd, _nh, _ns, obtainPxPy, obtainVxVy, \
     obtainVwVh, obtainAdbPath, substituteDeviceTemplate
-from com.dtmilano.android.window import Window
+from com.dtmilano.android.window import Window, Windows, parseWindows
 from com.dtmilano.android.adb import adbclient
 from com.dtmilano.android.uiautomator.uiautomatorhelper import UiAutomatorHelper
 import pprint
@@ -82,6 +85,7 @@ DEBUG_UI_AUTOMATOR = DEBUG and False
 DEBUG_UI_AUTOMATOR_HELPER = DEBUG and False
 DEBUG_NAV_BUTTONS = DEBUG and False
 DEBUG_SELECTOR = DEBUG and False
+DEBUG_WAIT = DEBUG and False
 
 WARNINGS = False
 
@@ -91,6 +95,13 @@ CULEBRATESTER2_PORT = 9987
 
 ADB_DEFAULT_PORT = 5555
 
+IDLE = 'idle'
+''' Used as the C{sleep} of L{ViewClient.dump} to wait until the UI is idle, see L{ViewClient.waitForIdle} '''
+SETTLE_COUNT = 3
+''' The number of consecutive equal snapshots needed to consider the window content settled '''
+SETTLE_TIMEOUT = 10.0
+''' The maximum time, in seconds, to wait for the window content to settle '''
+
 OFFSET = 25
 ''' This assumes the smallest touchable view on the screen is approximately 50px x 50px
     and touches it at M{(x+OFFSET, y+OFFSET)} '''
@@ -108,6 +119,12 @@ SKIP_CERTAIN_CLASSES_IN_GET_XY_ENABLED = False
     coordinates calculation
     @see: L{View.getXY()} '''
 
+SKIPPED_CLASSES_IN_GET_XY = frozenset(['com.android.internal.widget.ActionBarView',
+                                       'com.android.internal.widget.ActionBarContextView',
+                                       'com.android.internal.view.menu.ActionMenuView',
+                                       'com.android.internal.policy.impl.PhoneWindow$DecorView'])
+''' The parents whose position is not added when L{SKIP_CERTAIN_CLASSES_IN_GET_XY_ENABLED} '''
+
 VIEW_CLIENT_TOUCH_WORKAROUND_ENABLED = False
 ''' Under some conditions the touch event should be longer [t(DOWN) << t(UP)]. C{True} enables a
     workaround to delay the events.'''
@@ -123,6 +140,7 @@ TEXT_PROPERTY = 'text:mText'
 TEXT_PROPERTY_API_10 = 'mText'
 TEXT_PROPERTY_UI_AUTOMATOR = 'text'
 WS = "\xfe"  # the whitespace replacement char for TEXT_PROPERTY
+VIEW_SERVER_HASH_RE = re.compile('%s@%s' % (_ns('class'), _nh('oid')))
 TAG_PROPERTY = 'getTag()'
 LEFT_PROPERTY = 'layout:mLeft'
 LEFT_PROPERTY_API_8 = 'mLeft'
@@ -169,18 +187,150 @@ class ViewNotFoundException(Exception):
         super(Exception, self).__init__(msg)
 
 
+class ViewContext:
+    """
+    The state shared by all the L{View}s of the same dump: the device, its version, the backend and the names of the
+    attributes depending on them. It is computed once per dump instead of once per L{View}.
+    """
+
+    __slots__ = ('device', 'build', 'version', 'forceviewserveruse', 'windowId', 'uiAutomatorHelper', 'useUiAutomator',
+                 'idProperty', 'textProperty', 'tagProperty', 'leftProperty', 'topProperty', 'widthProperty',
+                 'heightProperty', 'isFocusedProperty', 'windowGeometry')
+
+    def __init__(self, device, version=-1, forceviewserveruse=False, windowId=None, uiAutomatorHelper=None):
+        """
+        Constructor
+
+        See L{View.__init__} for the description of the parameters.
+        """
+        self.device = device
+        self.build = {}
+        self.forceviewserveruse = forceviewserveruse
+        self.windowId = windowId
+        self.uiAutomatorHelper = uiAutomatorHelper
+        self.windowGeometry = None
+        ''' The L{Windows} snapshot, with the focused window and the status bar dimensions, obtained once per dump by
+            the first L{View.getXY} that needs it, see L{View.__dumpWindowsInformation} '''
+
+        if version != -1:
+            self.build[VERSION_SDK_PROPERTY] = version
+        else:
+            try:
+                if USE_ADB_CLIENT_TO_GET_BUILD_PROPERTIES:
+                    self.build[VERSION_SDK_PROPERTY] = int(device.getProperty(VERSION_SDK_PROPERTY))
+                else:
+                    self.build[VERSION_SDK_PROPERTY] = int(device.shell('getprop ' + VERSION_SDK_PROPERTY)[:-2])
+            except:
+                self.build[VERSION_SDK_PROPERTY] = -1
+
+        version = self.version = self.build[VERSION_SDK_PROPERTY]
+        self.useUiAutomator = (version >= 16) and not forceviewserveruse
+        ''' Whether to use UIAutomator or ViewServer '''
+        self.idProperty = None
+        ''' The id property depending on the View attribute format '''
+        self.textProperty = None
+        ''' The text property depending on the View attribute format '''
+        self.tagProperty = None
+        ''' The tag property depending on the View attribute format '''
+        self.leftProperty = None
+        ''' The left property depending on the View attribute format '''
+        self.topProperty = None
+        ''' The top property depending on the View attribute format '''
+        self.widthProperty = None
+        ''' The width property depending on the View attribute format '''
+        self.heightProperty = None
+        ''' The height property depending on the View attribute format '''
+        self.isFocusedProperty = None
+        ''' The focused property depending on the View attribute format '''
+
+        if version >= 16 and self.useUiAutomator:
+            self.idProperty = ID_PROPERTY_UI_AUTOMATOR
+            self.textProperty = TEXT_PROPERTY_UI_AUTOMATOR
+            self.leftProperty = LEFT_PROPERTY
+            self.topProperty = TOP_PROPERTY
+            self.widthProperty = WIDTH_PROPERTY
+            self.heightProperty = HEIGHT_PROPERTY
+            self.isFocusedProperty = IS_FOCUSED_PROPERTY_UI_AUTOMATOR
+        elif version > 10 and (version < 16 or self.useUiAutomator):
+            self.idProperty = ID_PROPERTY
+            self.textProperty = TEXT_PROPERTY
+            self.tagProperty = TAG_PROPERTY
+            self.leftProperty = LEFT_PROPERTY
+            self.topProperty = TOP_PROPERTY
+            self.widthProperty = WIDTH_PROPERTY
+            self.heightProperty = HEIGHT_PROPERTY
+            self.isFocusedProperty = IS_FOCUSED_PROPERTY
+        elif version == 10:
+            self.idProperty = ID_PROPERTY
+            self.textProperty = TEXT_PROPERTY_API_10
+            self.tagProperty = TAG_PROPERTY
+            self.leftProperty = LEFT_PROPERTY
+            self.topProperty = TOP_PROPERTY
+            self.widthProperty = WIDTH_PROPERTY
+            self.heightProperty = HEIGHT_PROPERTY
+            self.isFocusedProperty = IS_FOCUSED_PROPERTY
+        elif version >= 7 and version < 10:
+            self.idProperty = ID_PROPERTY
+            self.textProperty = TEXT_PROPERTY_API_10
+            self.tagProperty = TAG_PROPERTY
+            self.leftProperty = LEFT_PROPERTY_API_8
+            self.topProperty = TOP_PROPERTY_API_8
+            self.widthProperty = WIDTH_PROPERTY_API_8
+            self.heightProperty = HEIGHT_PROPERTY_API_8
+            self.isFocusedProperty = IS_FOCUSED_PROPERTY
+        elif version > 0 and version < 7:
+            self.idProperty = ID_PROPERTY
+            self.textProperty = TEXT_PROPERTY_API_10
+            self.tagProperty = TAG_PROPERTY
+            self.leftProperty = LEFT_PROPERTY
+            self.topProperty = TOP_PROPERTY
+            self.widthProperty = WIDTH_PROPERTY
+            self.heightProperty = HEIGHT_PROPERTY
+            self.isFocusedProperty = IS_FOCUSED_PROPERTY
+        elif version == -1:
+            self.idProperty = ID_PROPERTY
+            self.textProperty = TEXT_PROPERTY
+            self.tagProperty = TAG_PROPERTY
+            self.leftProperty = LEFT_PROPERTY
+            self.topProperty = TOP_PROPERTY
+            self.widthProperty = WIDTH_PROPERTY
+            self.heightProperty = HEIGHT_PROPERTY
+            self.isFocusedProperty = IS_FOCUSED_PROPERTY
+        else:
+            self.idProperty = ID_PROPERTY
+            self.textProperty = TEXT_PROPERTY
+            self.tagProperty = TAG_PROPERTY
+            self.leftProperty = LEFT_PROPERTY
+            self.topProperty = TOP_PROPERTY
+            self.widthProperty = WIDTH_PROPERTY
+            self.heightProperty = HEIGHT_PROPERTY
+            self.isFocusedProperty = IS_FOCUSED_PROPERTY
+
+
+NO_WINDOWS = {}
+''' The windows of a L{View} before they are obtained, shared to avoid one dict per View, it's never modified as
+    L{View.__dumpWindowsInformation} replaces it '''
+
+
 class View:
     """
     View class
+
+    Views use C{__slots__}, the attributes shared by the Views of a dump are kept in their L{ViewContext}.
     """
 
+    __slots__ = ('map', 'context', 'children', 'parent', 'windows', 'currentFocus', 'uiScrollable', 'target',
+                 'ui_automator_helper_node', 'raw', 'subtreeHash', 'layoutXY', '__weakref__')
+
     @staticmethod
-    def factory(arg1, arg2, version=-1, forceviewserveruse=False, windowId=None, uiAutomatorHelper=None):
+    def factory(arg1, arg2, version=-1, forceviewserveruse=False, windowId=None, uiAutomatorHelper=None, context=None):
         """
         View factory
 
         @type arg1: ClassType or dict
         @type arg2: View instance or AdbClient
+        @type context: ViewContext
+        @param context: the context shared by the Views of the same dump
         """
 
         if DEBUG_VIEW_FACTORY:
@@ -204,24 +354,24 @@ class View:
             if DEBUG_VIEW_FACTORY:
                 print("    View.factory: creating View with specific class: %s" % clazz, file=sys.stderr)
             if clazz == 'android.widget.TextView':
-                return TextView(attrs, device, version, forceviewserveruse, windowId, uiAutomatorHelper)
+                return TextView(attrs, device, version, forceviewserveruse, windowId, uiAutomatorHelper, context)
             elif clazz == 'android.widget.EditText':
-                return EditText(attrs, device, version, forceviewserveruse, windowId, uiAutomatorHelper)
+                return EditText(attrs, device, version, forceviewserveruse, windowId, uiAutomatorHelper, context)
             elif clazz == 'android.widget.ListView':
-                return ListView(attrs, device, version, forceviewserveruse, windowId, uiAutomatorHelper)
+                return ListView(attrs, device, version, forceviewserveruse, windowId, uiAutomatorHelper, context)
             else:
-                return View(attrs, device, version, forceviewserveruse, windowId, uiAutomatorHelper)
+                return View(attrs, device, version, forceviewserveruse, windowId, uiAutomatorHelper, context)
         elif cls:
             if view:
                 return cls.__copy(view)
             else:
-                return cls(attrs, device, version, forceviewserveruse, windowId, uiAutomatorHelper)
+                return cls(attrs, device, version, forceviewserveruse, windowId, uiAutomatorHelper, context)
         elif view:
             return copy.copy(view)
         else:
             if DEBUG_VIEW_FACTORY:
                 print("    View.factory: creating generic View", file=sys.stderr)
-            return View(attrs, device, version, forceviewserveruse, windowId, uiAutomatorHelper)
+            return View(attrs, device, version, forceviewserveruse, windowId, uiAutomatorHelper, context)
 
     @classmethod
     def __copy(cls, view):
@@ -229,20 +379,21 @@ class View:
         Copy constructor
         """
 
-        return cls(view.map, view.device, view.version, view.forceviewserveruse, view.windowId, view.uiAutomatorHelper)
+        return cls(view.map, None, context=view.context)
 
     @classmethod
     def clone(cls, view):
         _map = view.map.copy()
         # enforce the correct class in the map
         _map['class'] = cls.getAndroidClassName()
-        return cls(_map, view.device, view.version, view.forceviewserveruse, view.windowId, view.uiAutomatorHelper)
+        return cls(_map, None, context=view.context)
 
     @classmethod
     def getAndroidClassName(cls):
         return 'android.widget.View'
 
-    def __init__(self, _map, device, version=-1, forceviewserveruse=False, windowId=None, uiAutomatorHelper=None):
+    def __init__(self, _map, device, version=-1, forceviewserveruse=False, windowId=None, uiAutomatorHelper=None,
+                 context=None):
         """
         Constructor
 
@@ -259,6 +410,9 @@ class View:
                         to use C{UiAutomator}.
         @type uiAutomatorHelper: UiAutomatorHelper
         @:param uiAutomatorHelper: The UiAutomatorHelper if available
+        @type context: ViewContext
+        @param context: the context shared by the Views of the same dump, if specified C{device}, C{version},
+                        C{forceviewserveruse}, C{windowId} and C{uiAutomatorHelper} are ignored
         """
 
         if DEBUG_VIEW:
@@ -275,124 +429,24 @@ class View:
                     print("        %s=%s" % (attr, val), file=sys.stderr)
         self.map = _map
         ''' The map that contains the C{attr},C{value} pairs '''
-        self.device = device
-        ''' The AdbClient '''
+        self.context = context or ViewContext(device, version, forceviewserveruse, windowId, uiAutomatorHelper)
+        ''' The L{ViewContext} '''
         self.children = []
         ''' The children of this View '''
         self.parent = None
         ''' The parent of this View '''
-        self.windows = {}
+        self.windows = NO_WINDOWS
         self.currentFocus = None
         ''' The current focus '''
-        self.windowId = windowId
-        ''' The window this view resides '''
-        self.build = {}
-        ''' Build properties '''
-        self.version = version
-        ''' API version number '''
-        self.forceviewserveruse = forceviewserveruse
-        ''' Force ViewServer use '''
         self.uiScrollable = None
         ''' If this is a scrollable View this keeps the L{UiScrollable} object '''
         self.target = False
         ''' Is this a touch target zone '''
-        self.uiAutomatorHelper = uiAutomatorHelper
-        ''' The UiAutomatorHelper '''
         self.ui_automator_helper_node: Optional[WindowHierarchyChild] = None
-
-        if version != -1:
-            self.build[VERSION_SDK_PROPERTY] = version
-        else:
-            try:
-                if USE_ADB_CLIENT_TO_GET_BUILD_PROPERTIES:
-                    self.build[VERSION_SDK_PROPERTY] = int(device.getProperty(VERSION_SDK_PROPERTY))
-                else:
-                    self.build[VERSION_SDK_PROPERTY] = int(device.shell('getprop ' + VERSION_SDK_PROPERTY)[:-2])
-            except:
-                self.build[VERSION_SDK_PROPERTY] = -1
-
-        version = self.build[VERSION_SDK_PROPERTY]
-        self.useUiAutomator = (version >= 16) and not forceviewserveruse
-        ''' Whether to use UIAutomator or ViewServer '''
-        self.idProperty = None
-        ''' The id property depending on the View attribute format '''
-        self.textProperty = None
-        ''' The text property depending on the View attribute format '''
-        self.tagProperty = None
-        ''' The tag property depending on the View attribute format '''
-        self.leftProperty = None
-        ''' The left property depending on the View attribute format '''
-        self.topProperty = None
-        ''' The top property depending on the View attribute format '''
-        self.widthProperty = None
-        ''' The width property depending on the View attribute format '''
-        self.heightProperty = None
-        ''' The height property depending on the View attribute format '''
-        self.isFocusedProperty = None
-        ''' The focused property depending on the View attribute format '''
-
-        if version >= 16 and self.useUiAutomator:
-            self.idProperty = ID_PROPERTY_UI_AUTOMATOR
-            self.textProperty = TEXT_PROPERTY_UI_AUTOMATOR
-            self.leftProperty = LEFT_PROPERTY
-            self.topProperty = TOP_PROPERTY
-            self.widthProperty = WIDTH_PROPERTY
-            self.heightProperty = HEIGHT_PROPERTY
-            self.isFocusedProperty = IS_FOCUSED_PROPERTY_UI_AUTOMATOR
-        elif version > 10 and (version < 16 or self.useUiAutomator):
-            self.idProperty = ID_PROPERTY
-            self.textProperty = TEXT_PROPERTY
-            self.tagProperty = TAG_PROPERTY
-            self.leftProperty = LEFT_PROPERTY
-            self.topProperty = TOP_PROPERTY
-            self.widthProperty = WIDTH_PROPERTY
-            self.heightProperty = HEIGHT_PROPERTY
-            self.isFocusedProperty = IS_FOCUSED_PROPERTY
-        elif version == 10:
-            self.idProperty = ID_PROPERTY
-            self.textProperty = TEXT_PROPERTY_API_10
-            self.tagProperty = TAG_PROPERTY
-            self.leftProperty = LEFT_PROPERTY
-            self.topProperty = TOP_PROPERTY
-            self.widthProperty = WIDTH_PROPERTY
-            self.heightProperty = HEIGHT_PROPERTY
-            self.isFocusedProperty = IS_FOCUSED_PROPERTY
-        elif version >= 7 and version < 10:
-            self.idProperty = ID_PROPERTY
-            self.textProperty = TEXT_PROPERTY_API_10
-            self.tagProperty = TAG_PROPERTY
-            self.leftProperty = LEFT_PROPERTY_API_8
-            self.topProperty = TOP_PROPERTY_API_8
-            self.widthProperty = WIDTH_PROPERTY_API_8
-            self.heightProperty = HEIGHT_PROPERTY_API_8
-            self.isFocusedProperty = IS_FOCUSED_PROPERTY
-        elif version > 0 and version < 7:
-            self.idProperty = ID_PROPERTY
-            self.textProperty = TEXT_PROPERTY_API_10
-            self.tagProperty = TAG_PROPERTY
-            self.leftProperty = LEFT_PROPERTY
-            self.topProperty = TOP_PROPERTY
-            self.widthProperty = WIDTH_PROPERTY
-            self.heightProperty = HEIGHT_PROPERTY
-            self.isFocusedProperty = IS_FOCUSED_PROPERTY
-        elif version == -1:
-            self.idProperty = ID_PROPERTY
-            self.textProperty = TEXT_PROPERTY
-            self.tagProperty = TAG_PROPERTY
-            self.leftProperty = LEFT_PROPERTY
-            self.topProperty = TOP_PROPERTY
-            self.widthProperty = WIDTH_PROPERTY
-            self.heightProperty = HEIGHT_PROPERTY
-            self.isFocusedProperty = IS_FOCUSED_PROPERTY
-        else:
-            self.idProperty = ID_PROPERTY
-            self.textProperty = TEXT_PROPERTY
-            self.tagProperty = TAG_PROPERTY
-            self.leftProperty = LEFT_PROPERTY
-            self.topProperty = TOP_PROPERTY
-            self.widthProperty = WIDTH_PROPERTY
-            self.heightProperty = HEIGHT_PROPERTY
-            self.isFocusedProperty = IS_FOCUSED_PROPERTY
+        self.subtreeHash = None
+        ''' The structural hash of the subtree, see L{getSubtreeHash} '''
+        self.layoutXY = None
+        ''' The position in its window, calculated for the tree by L{calculateLayoutPositions} '''
 
         try:
             if self.isScrollable():
@@ -400,6 +454,24 @@ class View:
         except AttributeError:
             pass
 
+    device = property(lambda self: self.context.device, lambda self, device: setattr(self.context, 'device', device),
+                      doc=''' The AdbClient, setting it changes the context shared by the Views of the same dump ''')
+    build = property(lambda self: self.context.build, doc=''' Build properties ''')
+    version = property(lambda self: self.context.version, doc=''' API version number ''')
+    forceviewserveruse = property(lambda self: self.context.forceviewserveruse, doc=''' Force ViewServer use ''')
+    windowId = property(lambda self: self.context.windowId, doc=''' The window this view resides ''')
+    uiAutomatorHelper = property(lambda self: self.context.uiAutomatorHelper, doc=''' The UiAutomatorHelper ''')
+    useUiAutomator = property(lambda self: self.context.useUiAutomator,
+                              doc=''' Whether to use UIAutomator or ViewServer ''')
+    idProperty = property(lambda self: self.context.idProperty)
+    textProperty = property(lambda self: self.context.textProperty)
+    tagProperty = property(lambda self: self.context.tagProperty)
+    leftProperty = property(lambda self: self.context.leftProperty)
+    topProperty = property(lambda self: self.context.topProperty)
+    widthProperty = property(lambda self: self.context.widthProperty)
+    heightProperty = property(lambda self: self.context.heightProperty)
+    isFocusedProperty = property(lambda self: self.context.isFocusedProperty)
+
     def __getitem__(self, key):
         return self.map[key]
 
@@ -412,6 +484,9 @@ class View:
         # I should try to see if 'name' is a defined method
         # but it seems that if I call locals() here an infinite loop is entered
 
+        if name == 'map' or name.startswith('__'):
+            # slots not yet set (i.e. while unpickling) and special methods are not in the map
+            raise AttributeError(name)
         if name in self.map:
             r = self.map[name]
         elif name + '()' in self.map:
@@ -710,28 +785,29 @@ class View:
                 _id = "NO_ID"
             print("getXY(%s %s ## %s)" % (self.getClass(), _id, self.getUniqueId()), file=sys.stderr)
 
-        x = self.__getX()
-        y = self.__getY()
         if self.useUiAutomator:
-            return (x, y)
+            return self.__getX(), self.__getY()
 
-        parent = self.parent
-        if DEBUG_COORDS: print("   getXY: x=%s y=%s parent=%s" % (x, y, parent.getUniqueId() if parent else "None"),
-                               file=sys.stderr)
         hx = 0
         ''' Hierarchy accumulated X '''
         hy = 0
         ''' Hierarchy accumulated Y '''
-
-        if DEBUG_COORDS: print("   getXY: not using UiAutomator, calculating parent coordinates", file=sys.stderr)
+        if self.layoutXY is not None:
+            (x, y) = self.layoutXY
+            parent = None
+            if DEBUG_COORDS: print("   getXY: layout x=%s y=%s" % (x, y), file=sys.stderr)
+        else:
+            x = self.__getX()
+            y = self.__getY()
+            parent = self.parent
+            if DEBUG_COORDS: print("   getXY: x=%s y=%s parent=%s" % (x, y, parent.getUniqueId() if parent else "None"),
+                                   file=sys.stderr)
+            if DEBUG_COORDS: print("   getXY: not using UiAutomator, calculating parent coordinates", file=sys.stderr)
         while parent is not None:
             if DEBUG_COORDS: print("      getXY: parent: %s %s <<<<" % (parent.getClass(), parent.getId()),
                                    file=sys.stderr)
             if SKIP_CERTAIN_CLASSES_IN_GET_XY_ENABLED:
-                if parent.getClass() in ['com.android.internal.widget.ActionBarView',
-                                         'com.android.internal.widget.ActionBarContextView',
-                                         'com.android.internal.view.menu.ActionMenuView',
-                                         'com.android.internal.policy.impl.PhoneWindow$DecorView']:
+                if parent.getClass() in SKIPPED_CLASSES_IN_GET_XY:
                     if DEBUG_COORDS: print("   getXY: skipping %s %s (%d,%d)" % (
                         parent.getClass(), parent.getId(), parent.__getX(), parent.__getY()), file=sys.stderr)
                     parent = parent.parent
@@ -789,6 +865,28 @@ class View:
             print("                     y=%d+%d+%d-%d+%d" % (y, hy, wvy, statusBarOffset, pwy), file=sys.stderr)
         return x + hx + wvx + pwx, y + hy + wvy - statusBarOffset + pwy
 
+    @staticmethod
+    def calculateLayoutPositions(views):
+        """
+        Calculates the position of every View in its window, L{layoutXY}, adding its position to the one of its
+        parent in a single top-down pass, so L{getXY} does not have to walk up the tree.
+        Only used by the B{ViewServer} backend, where the position of a View is relative to its parent.
+
+        @param views: the Views of a tree in pre-order, every parent before its children
+        """
+
+        # the offset of the children of every parent, by id
+        offsets = {}
+        for view in views:
+            parent = view.parent
+            (hx, hy) = offsets.get(id(parent), (0, 0)) if parent is not None else (0, 0)
+            view.layoutXY = (view.__getX() + hx, view.__getY() + hy)
+            if view.children:
+                if SKIP_CERTAIN_CLASSES_IN_GET_XY_ENABLED and view.getClass() in SKIPPED_CLASSES_IN_GET_XY:
+                    offsets[id(view)] = (hx, hy)
+                else:
+                    offsets[id(view)] = view.layoutXY
+
     def getCoords(self):
         """
         Gets the coords of the View
@@ -841,129 +939,29 @@ class View:
         return x, y
 
     def __obtainStatusBarDimensionsIfVisible(self):
-        sbw = 0
-        sbh = 0
-        for winId in self.windows:
-            w = self.windows[winId]
-            if DEBUG_COORDS: print("      __obtainStatusBarDimensionsIfVisible: w=", w, "   w.activity=", w.activity,
-                                   "%%%", file=sys.stderr)
-            if w.activity == 'StatusBar':
-                if w.wvy == 0 and w.visibility == 0:
-                    if DEBUG_COORDS: print("      __obtainStatusBarDimensionsIfVisible: statusBar=", (w.wvw, w.wvh),
-                                           file=sys.stderr)
-                    sbw = w.wvw
-                    sbh = w.wvh
-                break
-
-        return sbw, sbh
-
-    def __obtainVxVy(self, m):
-        return obtainVxVy(m)
-
-    def __obtainVwVh(self, m):
-        return obtainVwVh(m)
-
-    def __obtainPxPy(self, m):
-        return obtainPxPy(m)
+        if self.context.windowGeometry is not None:
+            return self.context.windowGeometry.statusBarDimensions
+        return Windows(self.windows).statusBarDimensions
 
     def __dumpWindowsInformation(self, debug=False):
-        self.windows = {}
-        self.currentFocus = None
-        dww = self.device.shell('dumpsys window windows')
-        if DEBUG_WINDOWS or debug: print(dww, file=sys.stderr)
-        lines = dww.splitlines()
-        widRE = re.compile(r'^ *Window #%s Window\{%s (u\d+ )?%s?.*\}:' %
-                           (_nd('num'), _nh('winId'), _ns('activity', greedy=True)))
-        currentFocusRE = re.compile(r'^  mCurrentFocus=Window\{%s .*' % _nh('winId'))
-        viewVisibilityRE = re.compile(' mViewVisibility=0x%s ' % _nh('visibility'))
-        # This is for 4.0.4 API-15
-        containingFrameRE = re.compile(r'^   *mContainingFrame=\[%s,%s\]\[%s,%s\] mParentFrame=\[%s,%s\]\[%s,%s\]' %
-                                       (_nd('cx'), _nd('cy'), _nd('cw'), _nd('ch'), _nd('px'), _nd('py'), _nd('pw'),
-                                        _nd('ph')))
-        contentFrameRE = re.compile(r'^   *mContentFrame=\[%s,%s\]\[%s,%s\] mVisibleFrame=\[%s,%s\]\[%s,%s\]' %
-                                    (_nd('x'), _nd('y'), _nd('w'), _nd('h'), _nd('vx'), _nd('vy'), _nd('vx1'),
-                                     _nd('vy1')))
-        # This is for 4.1 API-16
-        framesRE = re.compile(r'^   *Frames: containing=\[%s,%s\]\[%s,%s\] parent=\[%s,%s\]\[%s,%s\]' %
-                              (_nd('cx'), _nd('cy'), _nd('cw'), _nd('ch'), _nd('px'), _nd('py'), _nd('pw'), _nd('ph')))
-        contentRE = re.compile(r'^     *content=\[%s,%s\]\[%s,%s\] visible=\[%s,%s\]\[%s,%s\]' %
-                               (_nd('x'), _nd('y'), _nd('w'), _nd('h'), _nd('vx'), _nd('vy'), _nd('vx1'), _nd('vy1')))
-        policyVisibilityRE = re.compile('mPolicyVisibility=%s ' % _ns('policyVisibility', greedy=True))
-
-        for l in range(len(lines)):
-            m = widRE.search(lines[l])
-            if m:
-                num = int(m.group('num'))
-                winId = m.group('winId')
-                activity = m.group('activity')
-                wvx = 0
-                wvy = 0
-                wvw = 0
-                wvh = 0
-                px = 0
-                py = 0
-                visibility = -1
-                policyVisibility = 0x0
-
-                for l2 in range(l + 1, len(lines)):
-                    m = widRE.search(lines[l2])
-                    if m:
-                        l += (l2 - 1)
-                        break
-                    m = viewVisibilityRE.search(lines[l2])
-                    if m:
-                        visibility = int(m.group('visibility'))
-                        if DEBUG_COORDS: print("__dumpWindowsInformation: visibility=", visibility, file=sys.stderr)
-                    if self.build[VERSION_SDK_PROPERTY] >= 17:
-                        m = framesRE.search(lines[l2])
-                        if m:
-                            px, py = obtainPxPy(m)
-                            m = contentRE.search(lines[l2 + 2])
-                            if m:
-                                wvx, wvy = obtainVxVy(m)
-                                wvw, wvh = obtainVwVh(m)
-                    elif self.build[VERSION_SDK_PROPERTY] >= 16:
-                        m = framesRE.search(lines[l2])
-                        if m:
-                            px, py = self.__obtainPxPy(m)
-                            m = contentRE.search(lines[l2 + 1])
-                            if m:
-                                # FIXME: the information provided by 'dumpsys window windows' in 4.2.1 (API 16)
-                                # when there's a system dialog may not be correct and causes the View coordinates
-                                # be offset by this amount, see
-                                # https://github.com/dtmilano/AndroidViewClient/issues/29
-                                wvx, wvy = self.__obtainVxVy(m)
-                                wvw, wvh = self.__obtainVwVh(m)
-                    elif self.build[VERSION_SDK_PROPERTY] == 15:
-                        m = containingFrameRE.search(lines[l2])
-                        if m:
-                            px, py = self.__obtainPxPy(m)
-                            m = contentFrameRE.search(lines[l2 + 1])
-                            if m:
-                                wvx, wvy = self.__obtainVxVy(m)
-                                wvw, wvh = self.__obtainVwVh(m)
-                    elif self.build[VERSION_SDK_PROPERTY] == 10:
-                        m = containingFrameRE.search(lines[l2])
-                        if m:
-                            px, py = self.__obtainPxPy(m)
-                            m = contentFrameRE.search(lines[l2 + 1])
-                            if m:
-                                wvx, wvy = self.__obtainVxVy(m)
-                                wvw, wvh = self.__obtainVwVh(m)
-                    else:
-                        warnings.warn("Unsupported Android version %d" % self.build[VERSION_SDK_PROPERTY])
-
-                    # print >> sys.stderr, "Searching policyVisibility in", lines[l2]
-                    m = policyVisibilityRE.search(lines[l2])
-                    if m:
-                        policyVisibility = 0x0 if m.group('policyVisibility') == 'true' else 0x8
+        """
+        Sets L{windows} and L{currentFocus} from the window geometry of the dump, obtaining it if this is the first
+        View of the dump needing it.
 
-                self.windows[winId] = Window(num, winId, activity, wvx, wvy, wvw, wvh, px, py,
-                                             visibility + policyVisibility)
-            else:
-                m = currentFocusRE.search(lines[l])
-                if m:
-                    self.currentFocus = m.group('winId')
+        @return: the position of the window of this View
+        """
+        windows = self.context.windowGeometry
+        if windows is None:
+            if isinstance(self.device, AdbClient) and self.device.displayState.info is not None:
+                # the geometry is obtained for the current orientation, notifying the listeners if the device rotated
+                self.device.displayState.refreshOrientation()
+            dww = self.device.shell('dumpsys window windows')
+            if DEBUG_WINDOWS or debug: print(dww, file=sys.stderr)
+            windows = self.context.windowGeometry = parseWindows(dww, self.build[VERSION_SDK_PROPERTY])
+        elif DEBUG_WINDOWS or debug:
+            print("__dumpWindowsInformation: using the window geometry of this dump", file=sys.stderr)
+        self.windows = windows
+        self.currentFocus = windows.currentFocus
 
         if self.windowId and self.windowId in self.windows and self.windows[self.windowId].visibility == 0:
             w = self.windows[self.windowId]
@@ -1124,6 +1122,25 @@ class View:
         """
         child.parent = self
         self.children.append(child)
+        view = self
+        while view is not None and view.subtreeHash is not None:
+            view.subtreeHash = None
+            view = view.parent
+
+    def getSubtreeHash(self):
+        """
+        Gets the structural (Merkle) hash of the subtree of this View, calculated from its attributes and the hashes
+        of its children. It's calculated while the dump is parsed, or the first time it's needed.
+
+        Two subtrees having the same hash are equal, except for the generated ids.
+
+        @return: the hash
+        @see: L{com.dtmilano.android.distance.subtree_hash}
+        """
+
+        if self.subtreeHash is None:
+            self.subtreeHash = subtree_hash(self.map, [ch.getSubtreeHash() for ch in self.children])
+        return self.subtreeHash
 
     def isClickable(self):
         return self.__getattr__('isClickable')()
@@ -1302,6 +1319,8 @@ class TextView(View):
     TextView class.
     """
 
+    __slots__ = ()
+
     @classmethod
     def getAndroidClassName(cls):
         return 'android.widget.TextView'
@@ -1312,6 +1331,8 @@ class EditText(TextView):
     EditText class.
     """
 
+    __slots__ = ()
+
     @classmethod
     def getAndroidClassName(cls):
         return 'android.widget.EditText'
@@ -2367,23 +2388,165 @@ class ListView(View):
     ListView class.
     """
 
-    pass
+    __slots__ = ()
+
+
+class ChangeSet:
+    """
+    The changes of the tree after an incremental dump, see L{ViewClient.incremental}.
+    """
+
+    def __init__(self):
+        self.added = []
+        ''' The Views that were not in the previous tree, in pre-order '''
+        self.removed = []
+        ''' The Views of the previous tree that are no longer in the tree '''
+        self.modified = []
+        ''' The Views still in the tree whose attributes changed '''
+
+    def __bool__(self):
+        return bool(self.added or self.removed or self.modified)
+
+    def __str__(self):
+        return "ChangeSet(added=%d, removed=%d, modified=%d)" % (len(self.added), len(self.removed),
+                                                                 len(self.modified))
+
+
+class ViewIndex:
+    """
+    Indexes the L{View}s of a tree by the values of their attributes, so finding them by value is a dictionary
+    lookup and by regular expression the scan of a flat list, instead of a walk of the tree.
+
+    The Views are kept in pre-order, the order in which the tree is searched, so the first match is the same the
+    recursive search finds and the Views of any subtree are the contiguous range starting at its root.
+    Every attribute is indexed the first time it's used.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.views = []
+        ''' The Views in pre-order '''
+        self.__positions = {}
+        stack = [root]
+        while stack:
+            view = stack.pop()
+            self.__positions[id(view)] = len(self.views)
+            self.views.append(view)
+            stack.extend(reversed(view.children))
+        self.__ends = [0] * len(self.views)
+        for i in range(len(self.views) - 1, -1, -1):
+            children = self.views[i].children
+            self.__ends[i] = self.__ends[self.__positions[id(children[-1])]] if children else i + 1
+        self.__indexes = {}
+
+    def __contains__(self, view):
+        i = self.__positions.get(id(view))
+        return i is not None and self.views[i] is view
+
+    def position(self, view):
+        """
+        Gets the position of a View in pre-order.
+        """
+        return self.__positions[id(view)]
+
+    def subtree(self, root=None):
+        """
+        Gets the range of positions of the subtree of C{root}, the whole tree if not specified.
+
+        @return: the tuple (start, end) so the Views are C{views[start:end]}
+        """
+        if root is None or root is self.root:
+            return 0, len(self.views)
+        start = self.__positions[id(root)]
+        return start, self.__ends[start]
+
+    def __index(self, attr):
+        index = self.__indexes.get(attr)
+        if index is None:
+            index = {}
+            for i, view in enumerate(self.views):
+                if attr in view.map:
+                    try:
+                        index.setdefault(view.map[attr], []).append(i)
+                    except TypeError:
+                        # unhashable values can't be found by value anyway
+                        pass
+            self.__indexes[attr] = index
+        return index
+
+    def findAll(self, attr, val, root=None):
+        """
+        Finds the Views in the subtree of C{root}, the whole tree if not specified, whose C{attr} equals C{val}.
+
+        @return: the list of Views in pre-order
+        """
+        (start, end) = self.subtree(root)
+        positions = self.__index(attr).get(val, [])
+        return [self.views[i] for i in positions[bisect.bisect_left(positions, start):bisect.bisect_left(positions, end)]]
+
+    def find(self, attr, val, root=None):
+        """
+        Finds the first View in the subtree of C{root} whose C{attr} equals C{val}.
+
+        @return: the View or C{None}
+        """
+        (start, end) = self.subtree(root)
+        positions = self.__index(attr).get(val, [])
+        i = bisect.bisect_left(positions, start)
+        if i < len(positions) and positions[i] < end:
+            return self.views[positions[i]]
+        return None
+
+    def matchAll(self, attr, regex, root=None, first=False):
+        """
+        Finds the Views in the subtree of C{root} whose C{attr} matches C{regex}, using C{regex.search}.
+
+        @return: the list of Views in pre-order
+        """
+        (start, end) = self.subtree(root)
+        matchingViews = []
+        for i in range(start, end):
+            view = self.views[i]
+            if attr in view.map and regex.search(view.map[attr]):
+                matchingViews.append(view)
+                if first:
+                    break
+        return matchingViews
+
+    def match(self, attr, regex, root=None):
+        """
+        Finds the first View in the subtree of C{root} whose C{attr} matches C{regex}.
+
+        @return: the View or C{None}
+        """
+        views = self.matchAll(attr, regex, root, first=True)
+        return views[0] if views else None
 
 
 class UiAutomator2AndroidViewClient():
     """
     UiAutomator XML to AndroidViewClient
+
+    The XML can be fed in chunks, as received, using L{feed} and L{close}. Anything before the XML declaration
+    (i.e. warnings) is kept in L{prefix} and anything after the end of the hierarchy (i.e. C{Killed}) is ignored.
     """
 
     def __init__(self, device, version, uiAutomatorHelper):
         self.device = device
         self.version = version
         self.uiAutomatorHelper = uiAutomatorHelper
+        self.context = ViewContext(device, version, uiAutomatorHelper=uiAutomatorHelper)
+        ''' The context shared by the Views of this dump '''
         self.root = None
         self.nodeStack = []
         self.parent = None
         self.views = []
         self.idCount = 1
+        self.prefix = b''
+        ''' What was received before the XML declaration '''
+        self.complete = False
+        ''' Whether the end of the hierarchy has been parsed '''
+        self.__parser = None
 
     def StartElement(self, name, attributes):
         """
@@ -2394,13 +2557,14 @@ class UiAutomator2AndroidViewClient():
         elif name == 'node':
             # Instantiate an Element object
             attributes['uniqueId'] = 'id/no_id/%d' % self.idCount
-            bounds = re.split(r'[\][,]', attributes['bounds'])
-            attributes['bounds'] = ((int(bounds[1]), int(bounds[2])), (int(bounds[4]), int(bounds[5])))
+            # bounds are [left,top][right,bottom]
+            (left, top, right, bottom) = attributes['bounds'][1:-1].replace('][', ',').split(',')
+            attributes['bounds'] = ((int(left), int(top)), (int(right), int(bottom)))
             if DEBUG_BOUNDS:
                 print("bounds=", attributes['bounds'], file=sys.stderr)
             self.idCount += 1
-            child = View.factory(attributes, self.device, version=self.version,
-                                 uiAutomatorHelper=self.uiAutomatorHelper)
+            # expat interns the attribute names, the keys are shared by all the maps
+            child = View.factory(attributes, None, context=self.context)
             self.views.append(child)
             # Push element onto the stack and make it a child of parent
             if not self.nodeStack:
@@ -2416,9 +2580,11 @@ class UiAutomator2AndroidViewClient():
         """
 
         if name == 'hierarchy':
-            pass
+            self.complete = True
         elif name == 'node':
-            self.nodeStack.pop()
+            view = self.nodeStack.pop()
+            # the children are complete, so is the subtree
+            view.subtreeHash = subtree_hash(view.map, [ch.subtreeHash for ch in view.children])
 
     def CharacterData(self, data):
         """
@@ -2430,22 +2596,70 @@ class UiAutomator2AndroidViewClient():
             element = self.nodeStack[-1]
             element.cdata += data
 
-    def Parse(self, uiautomatorxml):
-        # Create an Expat parser
-        parser = xml.parsers.expat.ParserCreate()  # @UndefinedVariable
-        # Set the Expat event handlers to our methods
-        parser.StartElementHandler = self.StartElement
-        parser.EndElementHandler = self.EndElement
-        parser.CharacterDataHandler = self.CharacterData
-        # Parse the XML File
+    def feed(self, data):
+        """
+        Parses a chunk of the XML. The nodes are created as soon as their start tags are received.
+
+        @type data: bytes or str
+        @param data: the chunk
+        """
+        if self.complete:
+            return
+        if isinstance(data, str):
+            data = data.encode(encoding='utf-8', errors='replace')
+        if self.__parser is None:
+            # the declaration could be split between chunks, only what precedes it is kept
+            self.prefix += data
+            i = self.prefix.find(b'<?xml')
+            if i == -1:
+                return
+            (self.prefix, data) = (self.prefix[:i], self.prefix[i:])
+            # Create an Expat parser
+            self.__parser = xml.parsers.expat.ParserCreate()  # @UndefinedVariable
+            self.__parser.buffer_text = True
+            # Set the Expat event handlers to our methods
+            self.__parser.StartElementHandler = self.StartElement
+            self.__parser.EndElementHandler = self.EndElement
+            self.__parser.CharacterDataHandler = self.CharacterData
         try:
-            encoded = uiautomatorxml.encode(encoding='utf-8', errors='replace')
-            _ = parser.Parse(encoded, True)
+            self.__parser.Parse(data, False)
         except xml.parsers.expat.ExpatError as ex:  # @UndefinedVariable
-            print("ERROR: Offending XML:\n", repr(uiautomatorxml), file=sys.stderr)
+            if self.complete:
+                # junk after the end of the hierarchy
+                return
+            print("ERROR: Offending XML:\n", repr(data), file=sys.stderr)
             raise RuntimeError(ex)
+
+    def close(self):
+        """
+        Finishes parsing.
+
+        @return: the root node
+        """
+        if self.__parser is None:
+            raise ValueError("received does not contain valid XML: " + self.prefix.decode('utf-8', 'replace'))
+        if not self.complete:
+            try:
+                self.__parser.Parse(b'', True)
+            except xml.parsers.expat.ExpatError as ex:  # @UndefinedVariable
+                raise RuntimeError(ex)
         return self.root
 
+    def Parse(self, uiautomatorxml):
+        """
+        Parses the XML.
+
+        @type uiautomatorxml: str, bytes or an iterable of them
+        @param uiautomatorxml: the XML or its chunks
+        @return: the root node
+        """
+        if isinstance(uiautomatorxml, (str, bytes, bytearray)):
+            self.feed(uiautomatorxml)
+        else:
+            for chunk in uiautomatorxml:
+                self.feed(chunk)
+        return self.close()
+
 
 class Excerpt2Code():
     ''' Excerpt XML to code '''
@@ -2551,7 +2765,7 @@ class ViewClient:
 
     def __init__(self, device, serialno, adb=None, autodump=True, forceviewserveruse=False, localport=None,
                  remoteport=None, startviewserver=True, ignoreuiautomatorkilled=False, compresseddump=True,
-                 useuiautomatorhelper=False, debug={}):
+                 useuiautomatorhelper=False, incremental=False, dumpcachettl=0, debug={}):
         """
         Constructor
 
@@ -2579,12 +2793,19 @@ class ViewClient:
         @param compresseddump: turns --compressed flag for uiautomator dump on/off
         @:type useuiautomatorhelper: boolean
         @:param useuiautomatorhelper: use UiAutomatorHelper Android app as backend
+        @type incremental: boolean
+        @param incremental: merge every dump into the previous tree keeping the identity of the Views that are
+                            still there, see L{changes}
+        @type dumpcachettl: float
+        @param dumpcachettl: seconds a dump can be reused by L{dump} if no input was sent, 0 disables the cache
         """
 
         if not device:
             raise Exception('Device is not connected')
         self.device = device
         ''' The C{AdbClient} device instance '''
+        if isinstance(device, AdbClient):
+            device.displayState.addListener(self.__onDisplayChanged)
 
         if not serialno:
             raise ValueError("Serialno cannot be None")
@@ -2637,6 +2858,10 @@ class ViewClient:
         ''' The root node '''
         self.viewsById = {}
         ''' The map containing all the L{View}s indexed by their L{View.getUniqueId()} '''
+        self.__uniqueIdCounters = {}
+        ''' The last unique id number generated for each base id, see L{__splitAttrs} '''
+        self.__viewIndex = None
+        ''' The L{ViewIndex} of the tree under L{root}, see L{__getViewIndex} '''
         self.display = {}
         ''' The map containing the device's display properties: width, height and density '''
 
@@ -2656,30 +2881,50 @@ class ViewClient:
         self.build = {}
         ''' The map containing the device's build properties: version.sdk, version.release '''
 
-        for prop in [VERSION_SDK_PROPERTY, VERSION_RELEASE_PROPERTY]:
-            self.build[prop] = -1
+        self.ro = {}
+        ''' The map containing the device's ro properties: secure, debuggable '''
+
+        buildProps = [VERSION_SDK_PROPERTY, VERSION_RELEASE_PROPERTY]
+        roProps = ['secure', 'debuggable', 'product.board', 'product.brand']
+        props = buildProps + ['ro.' + p for p in roProps]
+        values = None
+        if USE_ADB_CLIENT_TO_GET_BUILD_PROPERTIES and isinstance(device, AdbClient):
             try:
-                if USE_ADB_CLIENT_TO_GET_BUILD_PROPERTIES:
-                    self.build[prop] = device.getProperty(prop)
+                # served from the properties cache of the AdbClient, loaded by a single getprop
+                values = [device.getProperty(prop) for prop in props]
+            except Exception as ex:
+                warnings.warn("Couldn't obtain the properties from the AdbClient: %s" % ex)
+        if values is None:
+            try:
+                if hasattr(device, 'shell_batch'):
+                    # all the properties are obtained in one shell session
+                    values = [out.rstrip('\r\n') if exitCode == 0 else None for (out, exitCode) in
+                              device.shell_batch(['getprop ' + prop for prop in props])]
                 else:
-                    self.build[prop] = device.shell('getprop ro.build.' + prop)[:-2]
-            except:
+                    values = [device.shell('getprop ' + prop).rstrip('\r\n') for prop in props]
+            except Exception as ex:
+                warnings.warn("Couldn't obtain the build properties, the SDK version is unknown and UiAutomator "
+                              "won't be used: %s" % ex)
+                values = [None] * len(props)
+
+        for prop, value in zip(buildProps, values):
+            self.build[prop] = -1
+            if value is None:
                 if WARNINGS:
                     warnings.warn("Couldn't determine build %s" % prop)
+            else:
+                self.build[prop] = value
 
             if prop == VERSION_SDK_PROPERTY:
                 # we expect it to be an int
                 self.build[prop] = int(self.build[prop] if self.build[prop] else -1)
 
-        self.ro = {}
-        ''' The map containing the device's ro properties: secure, debuggable '''
-        for prop in ['secure', 'debuggable', 'product.board', 'product.brand']:
-            try:
-                self.ro[prop] = device.shell('getprop ro.' + prop)[:-2]
-            except:
+        for prop, value in zip(roProps, values[len(buildProps):]):
+            if value is None:
                 if WARNINGS:
                     warnings.warn("Couldn't determine ro %s" % prop)
-                self.ro[prop] = 'UNKNOWN'
+                value = 'UNKNOWN'
+            self.ro[prop] = value
 
         self.forceViewServerUse = forceviewserveruse
         ''' Force the use of ViewServer even if the conditions to use UiAutomator are satisfied '''
@@ -2748,6 +2993,22 @@ class ViewClient:
         '''
         self.compressedDump = compresseddump
 
+        self.incremental = incremental
+        ''' Whether every dump is merged into the previous tree, see L{ViewClient.__mergeTree} '''
+        self.changes = None
+        ''' The L{ChangeSet} of the last dump when L{incremental} '''
+        self.lastSettle = None
+        ''' The L{Stability} of the last L{dump} with C{settle}, its C{elapsed} is the time the screen took to settle '''
+        self.dumpCacheTtl = dumpcachettl
+        ''' Seconds a dump can be reused if no input was sent and the focused window is the same, 0 disables it '''
+        self.dumpCacheHits = 0
+        ''' The number of L{dump}s that reused the previous dump '''
+        self.dumpCacheMisses = 0
+        ''' The number of L{dump}s that could not reuse the previous dump, when the cache is enabled '''
+        self.__dumpCache = None
+        self.__treeGeneration = 0
+        ''' Incremented every time the tree is set, even if the previous root is kept by L{__mergeTree} '''
+
         self.navBack = None
         self.navHome = None
         self.navRecentApps = None
@@ -2755,6 +3016,13 @@ class ViewClient:
         if autodump:
             self.dump()
 
+    def __onDisplayChanged(self, old, new):
+        """
+        Invalidates the window geometry of the current dump when the device rotates.
+        """
+        if old is not None and old.get('orientation') != new.get('orientation') and isinstance(self.root, View):
+            self.root.context.windowGeometry = None
+
     def __del__(self):
         # should clean up some things
         if hasattr(self, 'uiAutomatorHelper') and self.uiAutomatorHelper:
@@ -3131,6 +3399,123 @@ class ViewClient:
         """
         time.sleep(secs)
 
+    def waitUntil(self, predicate, timeout=WAIT_TIMEOUT, dump=False):
+        """
+        Waits until a predicate is true, polling it with an exponential backoff, see L{com.dtmilano.android.wait}.
+
+        Usage:
+          vc.waitUntil(lambda: vc.device.getFocusedWindowName() == 'com.example/com.example.Main')
+          vc.waitUntil(lambda: vc.findViewWithText('Done'), dump=True)
+
+        @type predicate: callable
+        @param predicate: the predicate, called without arguments
+        @type timeout: float
+        @param timeout: the timeout, in seconds
+        @type dump: bool
+        @param dump: whether to dump the window content before every evaluation of the predicate
+        @return: the value returned by the predicate, the last one, which is false, if it timed out
+        """
+
+        if dump:
+            def _predicate():
+                self.__dumpWindowContent(-1, 0)
+                return predicate()
+        else:
+            _predicate = predicate
+        return waitUntil(_predicate, timeout, sleep=self.__waitForWindowUpdate)
+
+    def waitForIdle(self, timeout=WAIT_TIMEOUT, count=2, hierarchy=False):
+        """
+        Waits until the UI is idle.
+
+        On B{CulebraTester2} this is C{UiDevice.waitForIdle}, otherwise the geometry of the windows, from
+        C{dumpsys window windows}, or the hash of the tree, if C{hierarchy} is set, is polled until it is the same
+        C{count} consecutive times.
+
+        @type timeout: float
+        @param timeout: the timeout, in seconds
+        @type count: int
+        @param count: the number of consecutive equal samples needed to consider the UI idle
+        @type hierarchy: bool
+        @param hierarchy: whether to poll the hash of the tree, dumping the window content, instead of the windows
+        @return: C{True} if the UI became idle before the timeout
+        """
+
+        if self.uiAutomatorHelper:
+            self.uiAutomatorHelper.ui_device.wait_for_idle(timeout=int(timeout * 1000))
+            return True
+        if hierarchy or not isinstance(self.device, AdbClient):
+            signal = self.__hierarchySignal
+        else:
+            signal = self.__windowsSignal
+        stability = waitUntilStable(signal, count=count, timeout=timeout)
+        if DEBUG_WAIT:
+            print("waitForIdle: %s" % (stability,), file=sys.stderr)
+        return stability.stable
+
+    def waitForView(self, selector, timeout=WAIT_TIMEOUT):
+        """
+        Waits until a View matching the selector is in the window content, dumping it until it is found.
+
+        Usage:
+          ok = vc.waitForView('Button[text="OK"]')
+
+        @type selector: str
+        @param selector: the selector, see L{query}
+        @type timeout: float
+        @param timeout: the timeout, in seconds
+        @return: the first View matching the selector or C{None} if it timed out
+        @raise ValueError: if the selector is not valid
+        """
+
+        selector = compileSelector(selector) if not isinstance(selector, Selector) else selector
+        return self.waitUntil(lambda: self.query(selector, mode='first'), timeout, dump=True)
+
+    def __settle(self, window, count, timeout):
+        """
+        Dumps back to back until C{count} consecutive snapshots are equal or the C{timeout} expires.
+        A snapshot is the focused window name and the structural hash of the compressed dump.
+
+        @return: the L{Stability}
+        """
+
+        focusedWindowName = self.device.getFocusedWindowName if isinstance(self.device, AdbClient) else lambda: None
+
+        def snapshot():
+            self.__dumpWindowContent(window, 0)
+            return focusedWindowName(), self.getTreeHash()
+
+        compressedDump = self.compressedDump
+        self.compressedDump = True
+        try:
+            stability = waitUntilStable(snapshot, count=count, timeout=timeout, interval=0, maxInterval=0)
+        finally:
+            self.compressedDump = compressedDump
+        if DEBUG_WAIT or (WARNINGS and not stability.stable):
+            print("dump: %s after %.3fs and %d snapshots" % ('settled' if stability.stable else 'NOT settled',
+                                                             stability.elapsed, stability.samples), file=sys.stderr)
+        return stability
+
+    def __waitForWindowUpdate(self, secs):
+        """
+        Sleeps between the evaluations of L{waitUntil}. On B{CulebraTester2} it returns as soon as a window is
+        updated.
+        """
+
+        if self.uiAutomatorHelper:
+            self.uiAutomatorHelper.ui_device.wait_for_window_update(timeout=int(secs * 1000))
+        else:
+            time.sleep(secs)
+
+    def __windowsSignal(self):
+        windows = self.device.getWindows()
+        return windows.currentFocus, tuple((w.winId, w.wvx, w.wvy, w.wvw, w.wvh, w.visibility)
+                                           for w in windows.values())
+
+    def __hierarchySignal(self):
+        self.__dumpWindowContent(-1, 0)
+        return self.getTreeHash()
+
     def assertServiceResponse(self, response):
         """
         Checks whether the response received from the server is correct or raises and Exception.
@@ -3167,9 +3552,12 @@ class ViewClient:
 
         if not received or received == "":
             raise ValueError("received is empty")
+        previous = self.root
+        self.__treeGeneration += 1
         self.views = []
         ''' The list of Views represented as C{str} obtained after splitting it into lines after being received from the server. Done by L{self.setViews()}. '''
         self.__parseTree(received.split("\n"), windowId)
+        self.__mergeTree(previous)
         if DEBUG:
             print("there are %d views in this dump" % len(self.views), file=sys.stderr)
 
@@ -3183,6 +3571,7 @@ class ViewClient:
 
         if not received or received == "":
             raise ValueError("received is empty")
+        self.__treeGeneration += 1
         self.views = []
         ''' The list of Views represented as C{str} obtained after splitting it into lines after being received from the server. Done by L{self.setViews()}. '''
         if self.uiAutomatorHelper:
@@ -3196,6 +3585,10 @@ class ViewClient:
         """
         Splits the C{View} attributes in C{strArgs} and optionally adds the view id to the C{viewsById} list.
 
+        The line is tokenized in a single pass: after the C{class@oid} token every attribute has the form
+        C{name=len,value} and its value is read by its declared length, so values containing spaces need no
+        special treatment.
+
         Unique Ids
         ==========
         It is very common to find C{View}s having B{NO_ID} as the Id. This turns very difficult to
@@ -3212,73 +3605,85 @@ class ViewClient:
 
         if self.useUiAutomator:
             raise RuntimeError("This method is not compatible with UIAutomator")
-        # replace the spaces in text:mText to preserve them in later split
-        # they are translated back after the attribute matches
-        textRE = re.compile('%s=%s,' % (self.textProperty, _nd('len')))
-        m = textRE.search(strArgs)
-        if m:
-            __textStart = m.end()
-            __textLen = int(m.group('len'))
-            __textEnd = m.end() + __textLen
-            s1 = strArgs[__textStart:__textEnd]
-            s2 = s1.replace(' ', WS)
-            strArgs = strArgs.replace(s1, s2, 1)
-
-        idRE = re.compile(r"(?P<viewId>id/\S+)")
-        attrRE = re.compile(r'%s(?P<parens>\(\))?=%s,(?P<val>[^ ]*)' % (_ns('attr'), _nd('len')), flags=re.DOTALL)
-        hashRE = re.compile('%s@%s' % (_ns('class'), _nh('oid')))
 
         attrs = {}
         viewId = None
-        m = idRE.search(strArgs)
+        n = len(strArgs)
+        while n and strArgs[n - 1] in '\r\n':
+            n -= 1
+        i = 0
+        while i < n and strArgs[i] == ' ':
+            i += 1
+        end = strArgs.find(' ', i, n)
+        if end == -1:
+            end = n
+        m = VIEW_SERVER_HASH_RE.match(strArgs, i, end)
         if m:
-            viewId = m.group('viewId')
-            if DEBUG:
-                print("found view with id=%s" % viewId, file=sys.stderr)
-
-        for attr in strArgs.split():
-            m = attrRE.match(attr)
-            if m:
-                __attr = m.group('attr')
-                __parens = '()' if m.group('parens') else ''
-                __len = int(m.group('len'))
-                __val = m.group('val')
-                if WARNINGS and __len != len(__val):
-                    warnings.warn("Invalid len: expected: %d   found: %d   s=%s   e=%s" % (
-                        __len, len(__val), __val[:50], __val[-50:]))
-                if __attr == self.textProperty:
-                    # restore spaces that have been replaced
-                    __val = __val.replace(WS, ' ')
-                attrs[__attr + __parens] = __val
-            else:
-                m = hashRE.match(attr)
-                if m:
-                    attrs['class'] = m.group('class')
-                    attrs['oid'] = m.group('oid')
-                else:
-                    if DEBUG:
-                        print(attr, "doesn't match", file=sys.stderr)
-
-        if True:  # was assignViewById
-            if not viewId:
-                # If the view has NO_ID we are assigning a default id here (id/no_id) which is
-                # immediately incremented if another view with no id was found before to generate
-                # a unique id
-                viewId = "id/no_id/1"
-            if viewId in self.viewsById:
-                # sometimes the view ids are not unique, so let's generate a unique id here
-                i = 1
-                while True:
-                    newId = re.sub(r'/\d+$', '', viewId) + '/%d' % i
-                    if not newId in self.viewsById:
-                        break
-                    i += 1
-                viewId = newId
+            attrs['class'] = m.group('class')
+            attrs['oid'] = m.group('oid')
+            i = end
+        while i < n:
+            if strArgs[i] == ' ':
+                i += 1
+                continue
+            eq = strArgs.find('=', i, n)
+            comma = strArgs.find(',', eq + 1, n) if eq != -1 else -1
+            space = strArgs.find(' ', i, n)
+            if comma == -1 or (space != -1 and space < comma) or not strArgs[eq + 1:comma].isdigit():
                 if DEBUG:
-                    print("adding viewById %s" % viewId, file=sys.stderr)
-            # We are assigning a new attribute to keep the original id preserved, which could have
-            # been NO_ID repeated multiple times
-            attrs['uniqueId'] = viewId
+                    print(strArgs[i:space if space != -1 else n], "doesn't match", file=sys.stderr)
+                if space == -1:
+                    break
+                i = space
+                continue
+            start = comma + 1
+            _len = int(strArgs[eq + 1:comma])
+            end = start + _len
+            if end < n and strArgs[end] != ' ':
+                # the length is counted in UTF-16 code units, characters outside the BMP take two
+                end = start
+                units = 0
+                while units < _len and end < n:
+                    units += 2 if strArgs[end] > '\uffff' else 1
+                    end += 1
+                if end < n and strArgs[end] != ' ':
+                    end = strArgs.find(' ', end, n)
+                    if end == -1:
+                        end = n
+                    if WARNINGS:
+                        warnings.warn("Invalid len: expected: %d   found: %d   s=%s" % (
+                            _len, end - start, strArgs[start:start + 50]))
+            elif end > n:
+                end = n
+            value = strArgs[start:end]
+            attrs[sys.intern(strArgs[i:eq])] = value
+            if viewId is None:
+                idx = value.find('id/')
+                if idx != -1:
+                    viewId = value[idx:].split(None, 1)[0]
+                    if DEBUG:
+                        print("found view with id=%s" % viewId, file=sys.stderr)
+            i = end
+
+        if not viewId:
+            # If the view has NO_ID we are assigning a default id here (id/no_id) which is
+            # immediately incremented if another view with no id was found before to generate
+            # a unique id
+            viewId = "id/no_id/1"
+        if viewId in self.viewsById:
+            # sometimes the view ids are not unique, so let's generate a unique id here, counting per base id
+            # avoids probing again all the ids already generated
+            base = viewId[:viewId.rfind('/')] if viewId[viewId.rfind('/') + 1:].isdigit() else viewId
+            i = self.__uniqueIdCounters.get(base, 0) + 1
+            while '%s/%d' % (base, i) in self.viewsById:
+                i += 1
+            self.__uniqueIdCounters[base] = i
+            viewId = '%s/%d' % (base, i)
+            if DEBUG:
+                print("adding viewById %s" % viewId, file=sys.stderr)
+        # We are assigning a new attribute to keep the original id preserved, which could have
+        # been NO_ID repeated multiple times
+        attrs['uniqueId'] = viewId
 
         return attrs
 
@@ -3294,11 +3699,14 @@ class ViewClient:
         self.root = None
         self.viewsById = {}
         self.views = []
+        self.__uniqueIdCounters = {}
         parent = None
         parents = []
         treeLevel = -1
         newLevel = -1
         lastView = None
+        context = ViewContext(self.device, self.build[VERSION_SDK_PROPERTY], self.forceViewServerUse, windowId,
+                              self.uiAutomatorHelper)
         for v in receivedLines:
             if v == '' or v == 'DONE' or v == 'DONE.':
                 break
@@ -3306,8 +3714,7 @@ class ViewClient:
             if not self.root:
                 if v[0] == ' ':
                     raise Exception("Unexpected root element starting with ' '.")
-                self.root = View.factory(attrs, self.device, self.build[VERSION_SDK_PROPERTY], self.forceViewServerUse,
-                                         windowId, self.uiAutomatorHelper)
+                self.root = View.factory(attrs, None, context=context)
                 if DEBUG: self.root.raw = v
                 treeLevel = 0
                 newLevel = 0
@@ -3318,8 +3725,7 @@ class ViewClient:
                 newLevel = (len(v) - len(v.lstrip()))
                 if newLevel == 0:
                     raise Exception("newLevel==0 treeLevel=%d but tree can have only one root, v=%s" % (treeLevel, v))
-                child = View.factory(attrs, self.device, self.build[VERSION_SDK_PROPERTY], self.forceViewServerUse,
-                                     windowId, self.uiAutomatorHelper)
+                child = View.factory(attrs, None, context=context)
                 if DEBUG: child.raw = v
                 if newLevel == treeLevel:
                     parent.add(child)
@@ -3342,6 +3748,11 @@ class ViewClient:
                     lastView = child
             self.views.append(lastView)
             self.viewsById[lastView.getUniqueId()] = lastView
+        for view in reversed(self.views):
+            # in reverse pre-order the children come before their parent
+            view.subtreeHash = subtree_hash(view.map, [ch.subtreeHash for ch in view.children])
+        if not context.useUiAutomator:
+            View.calculateLayoutPositions(self.views)
 
     def __updateNavButtons(self):
         """
@@ -3367,9 +3778,9 @@ class ViewClient:
     def __treeFromWindowHierarchy(self, windowHierarchy):
         # FIXME: idCount should be a class field
         idCount = 1
-        version = self.build[VERSION_SDK_PROPERTY]
+        context = ViewContext(self.device, self.build[VERSION_SDK_PROPERTY], uiAutomatorHelper=self.uiAutomatorHelper)
         self.root = windowHierarchy
-        self.__processWindowHierarchyChild(self.root, idCount, version)
+        self.__processWindowHierarchyChild(self.root, idCount, context)
 
     @staticmethod
     def attributesFromWindowHierarchyChild(unique_id: str, child: WindowHierarchyChild) -> \
@@ -3385,32 +3796,58 @@ class ViewClient:
                 'uniqueId': unique_id}
 
     def __processWindowHierarchyChild(self, node: Union[WindowHierarchy, WindowHierarchyChild], idCount: int,
-                                      version) -> None:
+                                      context: ViewContext) -> None:
         if node.id != 'hierarchy':
             unique_id = f'fid/no_id/{idCount}'
             attributes = ViewClient.attributesFromWindowHierarchyChild(unique_id, node)
-            view: View = View.factory(attributes, self.device, version=version,
-                                      uiAutomatorHelper=self.uiAutomatorHelper)
+            view: View = View.factory(attributes, None, context=context)
             view.ui_automator_helper_node = node
             idCount += 1
             self.views.append(view)
         for ch in node.children:
-            self.__processWindowHierarchyChild(ch, idCount, version)
+            self.__processWindowHierarchyChild(ch, idCount, context)
 
     def __parseTreeFromUiAutomatorDump(self, receivedXml):
         if DEBUG:
             print("__parseTreeFromUiAutomatorDump(", receivedXml[:40], "...)", file=sys.stderr)
         parser = UiAutomator2AndroidViewClient(self.device, self.build[VERSION_SDK_PROPERTY], self.uiAutomatorHelper)
+        parser.Parse(receivedXml)
+        self.__setTreeFromUiAutomatorParser(parser)
+
+    def __streamUiAutomatorDump(self, cmd, execOut=False):
+        """
+        Runs the UiAutomator dump command feeding its output to the parser as it is received.
+
+        @param execOut: whether to run the command with L{AdbClient.exec_out}, receiving the raw output
+        @return: the parser
+        """
+        parser = UiAutomator2AndroidViewClient(self.device, self.build[VERSION_SDK_PROPERTY], self.uiAutomatorHelper)
+        if execOut:
+            chunks = self.device.exec_out(cmd)
+            try:
+                for data in chunks:
+                    parser.feed(data)
+            finally:
+                chunks.close()
+            return parser
+        packets = self.device.shell_v2(cmd)
         try:
-            start_xml_index = receivedXml.index("<?xml")
-            end_xml_index = receivedXml.rindex(">")
-        except ValueError:
-            raise ValueError("received does not contain valid XML: " + receivedXml)
-        self.root = parser.Parse(receivedXml[start_xml_index:end_xml_index + 1])
+            for (packetId, data) in packets:
+                if packetId != SHELL_V2_EXIT:
+                    parser.feed(data)
+        finally:
+            packets.close()
+        return parser
+
+    def __setTreeFromUiAutomatorParser(self, parser):
+        previous = self.root
+        self.__treeGeneration += 1
+        self.root = parser.close()
         self.views = parser.views
         self.viewsById = {}
         for v in self.views:
             self.viewsById[v.getUniqueId()] = v
+        self.__mergeTree(previous)
         self.__updateNavButtons()
         if DEBUG_NAV_BUTTONS:
             if not self.navBack:
@@ -3420,6 +3857,91 @@ class ViewClient:
             if not self.navRecentApps:
                 print("WARNING: navRecentApps not found", file=sys.stderr)
 
+    def __mergeTree(self, previous):
+        """
+        When L{incremental}, merges the tree just parsed into the C{previous} one and sets L{changes}.
+
+        The Views of both trees are matched by their structural key: the class, the id and the occurrence of this
+        class and id among the siblings, starting at the roots. Every matched View of the previous tree is kept,
+        updating its attributes, so the references held to it are still valid after the dump, and the new Views
+        are only used for what was added.
+
+        @param previous: the root of the previous tree
+        """
+
+        if not self.incremental or not isinstance(self.root, View):
+            self.changes = None
+            return
+        changes = ChangeSet()
+        if not isinstance(previous, View) or ViewClient.__structuralKey(previous, 0) != \
+                ViewClient.__structuralKey(self.root, 0):
+            if isinstance(previous, View):
+                changes.removed.extend(ViewIndex(previous).views)
+            changes.added.extend(self.views)
+            self.changes = changes
+            return
+        root = self.root
+        ViewClient.__mergeView(previous, root, changes)
+        self.root = previous
+        self.__viewIndex = ViewIndex(previous)
+        self.views = self.__viewIndex.views
+        self.viewsById = {}
+        for v in self.views:
+            self.viewsById[v.getUniqueId()] = v
+        self.changes = changes
+        if DEBUG:
+            print("__mergeTree: %s" % changes, file=sys.stderr)
+
+    @staticmethod
+    def __structuralKey(view, occurrence):
+        return view.map.get('class'), view.getId(), occurrence
+
+    @staticmethod
+    def __mergeView(old, new, changes):
+        """
+        Updates C{old} with the attributes and the children of C{new}, that has the same structural key.
+        """
+
+        identical = old.getSubtreeHash() == new.getSubtreeHash()
+        if not identical and not same_attributes(old.map, new.map):
+            changes.modified.append(old)
+        old.map = new.map
+        old.context = new.context
+        old.subtreeHash = new.subtreeHash
+        old.layoutXY = new.layoutXY
+        old.ui_automator_helper_node = new.ui_automator_helper_node
+        if identical:
+            # the same structure, only the generated ids may have changed
+            for (och, nch) in zip(old.children, new.children):
+                ViewClient.__mergeView(och, nch, changes)
+            return
+        if not old.children and not new.children:
+            return
+        previous = {}
+        counts = {}
+        for ch in old.children:
+            k = ch.map.get('class'), ch.getId()
+            n = counts.get(k, 0)
+            counts[k] = n + 1
+            previous[k + (n,)] = ch
+        counts = {}
+        children = []
+        for ch in new.children:
+            k = ch.map.get('class'), ch.getId()
+            n = counts.get(k, 0)
+            counts[k] = n + 1
+            match = previous.pop(k + (n,), None)
+            if match is None:
+                changes.added.extend(ViewIndex(ch).views)
+            else:
+                ViewClient.__mergeView(match, ch, changes)
+                ch = match
+            ch.parent = old
+            children.append(ch)
+        for ch in previous.values():
+            changes.removed.extend(ViewIndex(ch).views)
+        old.children = children
+
     def getRoot(self):
         """
         Gets the root node of the C{View} tree
@@ -3476,13 +3998,23 @@ class ViewClient:
         for ch in root.children:
             ViewClient.__traverse(ch, indent=indent + "   ", transform=transform, stream=stream)
 
-    def dump(self, window=-1, sleep=1):
+    def dump(self, window=-1, sleep=1, settle=False, settleCount=SETTLE_COUNT, settleTimeout=SETTLE_TIMEOUT):
         """
         Dumps the window content.
 
         Sleep is useful to wait some time before obtaining the new content when something in the
         window has changed.
 
+        Instead of guessing how long to sleep, C{settle} takes snapshots back to back, the focused window and the
+        compressed dump, until C{settleCount} consecutive ones have the same structural hash or C{settleTimeout}
+        expires. The result is kept in L{lastSettle}.
+
+        If the dump cache is enabled (see C{dumpcachettl} in L{__init__}) and no input was sent through the
+        L{AdbClient} or the L{UiAutomatorHelper} since the previous dump, the focused window is the same and the
+        previous dump is younger than L{dumpCacheTtl}, the previous Views are returned without sleeping or dumping.
+        The focused window is compared with the one obtained before the previous dump or, if it was not obtained
+        then, by the first dump reusing it. A dump with C{settle} always dumps.
+
         @type window: int or str
         @param window: the window id or name of the window to dump.
         The B{name} is the package name or the window name (i.e. StatusBar) for
@@ -3492,12 +4024,72 @@ class ViewClient:
         Use -1 to dump all windows.
         This parameter only is used when the backend is B{ViewServer} and it's
         ignored for B{UiAutomator}.
-        @type sleep: int
-        @param sleep: sleep in seconds before proceeding to dump the content
+        @type sleep: int or str
+        @param sleep: sleep in seconds before proceeding to dump the content, or L{IDLE} to wait until the UI is idle,
+        which usually returns much sooner, see L{waitForIdle}. It is ignored if C{settle} is set.
+        @type settle: bool
+        @param settle: whether to wait until the window content settles
+        @type settleCount: int
+        @param settleCount: the number of consecutive equal snapshots needed to consider the content settled
+        @type settleTimeout: float
+        @param settleTimeout: the maximum time, in seconds, to wait for the content to settle
 
         @return: the list of Views as C{str} received from the server after being split into lines
         """
-        if sleep > 0:
+        device = self.device if isinstance(self.device, AdbClient) else None
+        # the focused window is known without running dumpsys if there is no AdbClient
+        (focusKnown, focus) = (device is None, None)
+        if self.dumpCacheTtl > 0:
+            if not settle and self.__dumpCache is not None:
+                # the focused window is only obtained, running dumpsys, when nothing else invalidated the dump
+                (cachedTime, cachedGeneration, cachedKey, cachedFocusKnown, cachedFocus) = self.__dumpCache
+                if time.monotonic() - cachedTime < self.dumpCacheTtl and cachedGeneration == self.__treeGeneration \
+                        and cachedKey == self.__dumpCacheKey(window):
+                    (focusKnown, focus) = (True, device.getFocusedWindowName() if device else None)
+                    if not cachedFocusKnown:
+                        # the first check after the dump, the focused window is kept to compare the next ones
+                        self.__dumpCache = (cachedTime, cachedGeneration, cachedKey, True, focus)
+                        cachedFocus = focus
+                    if focus == cachedFocus:
+                        self.dumpCacheHits += 1
+                        if DEBUG:
+                            print("dump: using the previous dump, %s %s" % (cachedKey, focus), file=sys.stderr)
+                        return self.views
+            self.dumpCacheMisses += 1
+            self.__dumpCache = None
+
+        if settle:
+            self.lastSettle = self.__settle(window, settleCount, settleTimeout)
+            if self.useUiAutomator and not self.uiAutomatorHelper and not self.compressedDump:
+                self.__dumpWindowContent(window, 0)
+            # otherwise, the last snapshot is the dump
+            (focusKnown, focus) = (True, self.lastSettle.value[0])
+        else:
+            self.__dumpWindowContent(window, sleep)
+
+        if self.dumpCacheTtl > 0:
+            # the focused window, if it was not obtained by the cache check or by settle, is obtained by the next check
+            self.__dumpCache = (time.monotonic(), self.__treeGeneration, self.__dumpCacheKey(window), focusKnown, focus)
+        return self.views
+
+    def __dumpCacheKey(self, window):
+        """
+        Obtains what, besides the focused window, has to be the same for the previous dump to be still valid: the
+        window and the number of input actions sent.
+        """
+        device = self.device if isinstance(self.device, AdbClient) else None
+        return (window, device.inputCount if device else None,
+                self.uiAutomatorHelper.inputCount if self.uiAutomatorHelper else None)
+
+    def __dumpWindowContent(self, window, sleep):
+        """
+        Dumps the window content, see L{dump}.
+
+        @return: the list of Views
+        """
+        if sleep == IDLE:
+            self.waitForIdle()
+        elif sleep > 0:
             time.sleep(sleep)
 
         if self.useUiAutomator:
@@ -3506,6 +4098,9 @@ class ViewClient:
                 self.ui_automator_helper_dump = received
             else:
                 api = self.getSdkVersion()
+                # the dump written to a file is received with exec:, the dump written to /dev/tty needs the PTY of
+                # the shell: service
+                execOut = False
                 if api >= 24:
                     # In API 23 the process' stdout,in and err are connected to the socket not to the pts as in
                     # previous versions, so we can't redirect to /dev/tty
@@ -3519,6 +4114,7 @@ class ViewClient:
                     cmd = 'cp /dev/null {pathname}/{filename} && uiautomator dump {compressed} {pathname}/{filename} >/dev/null && cat {pathname}/{filename}'.format(
                         pathname=pathname, filename=filename,
                         compressed='--compressed' if self.compressedDump else '')
+                    execOut = True
                 elif api == 23:
                     # In API 23 the process' stdout,in and err are connected to the socket not to the pts as in
                     # previous versions, so we can't redirect to /dev/tty
@@ -3528,6 +4124,7 @@ class ViewClient:
                         filename = 'window_dump.xml'
                         cmd = 'uiautomator dump %s %s/%s >/dev/null && cat %s/%s' % (
                             '--compressed' if self.compressedDump else '', pathname, filename, pathname, filename)
+                        execOut = True
                     elif self.ro['product.board'] in ['msd838', 'msd938_STB', 'msd938', 'msm8916']:
                         cmd = 'uiautomator dump %s /dev/tty >/dev/null' % (
                             '--compressed' if self.compressedDump else '')
@@ -3536,6 +4133,7 @@ class ViewClient:
                         filename = 'window_dump.xml'
                         cmd = 'uiautomator dump %s %s/%s >/dev/null && cat %s/%s' % (
                             '--compressed' if self.compressedDump else '', pathname, filename, pathname, filename)
+                        execOut = True
                 else:
                     # NOTICE:
                     # Using /dev/tty this works even on devices with no sdcard
@@ -3543,7 +4141,19 @@ class ViewClient:
                         '--compressed' if api >= 18 and self.compressedDump else '')
                 if DEBUG_UI_AUTOMATOR:
                     print("executing '%s'" % cmd, file=sys.stderr)
-                received = self.device.shell(cmd)
+                if isinstance(self.device, AdbClient):
+                    # the dump is parsed while it's received, it's never kept as a whole
+                    parser = self.__streamUiAutomatorDump(cmd, execOut)
+                    if parser.complete or parser.root is not None:
+                        self.views = []
+                        self.__setTreeFromUiAutomatorParser(parser)
+                        if DEBUG:
+                            print("there are %d views in this dump" % len(self.views), file=sys.stderr)
+                        return self.views
+                    # no hierarchy, check the errors below
+                    received = parser.prefix.decode('utf-8', 'replace')
+                else:
+                    received = self.device.shell(cmd)
 
             if not received:
                 raise RuntimeError('ERROR: Empty UiAutomator dump was received')
@@ -3738,6 +4348,20 @@ class ViewClient:
                 self.windows[int('0x' + wid, 16)] = package
             return self.windows
 
+    def __getViewIndex(self, root):
+        """
+        Gets the index of the current tree, building it after every dump.
+
+        @return: the L{ViewIndex} or C{None} if C{root} is not a View of the current tree
+        """
+        if not isinstance(self.root, View):
+            return None
+        if self.__viewIndex is None or self.__viewIndex.root is not self.root:
+            self.__viewIndex = ViewIndex(self.root)
+        if root is self.root or root in self.__viewIndex:
+            return self.__viewIndex
+        return None
+
     def findViewById(self, viewId, root="ROOT", viewFilter=None):
         """
         Finds the View with the specified viewId.
@@ -3766,6 +4390,23 @@ class ViewClient:
         if root == "ROOT":
             return self.findViewById(viewId, self.root, viewFilter)
 
+        index = self.__getViewIndex(root)
+        if index is not None:
+            attrs = ['resource-id', root.idProperty]
+            byUniqueId = re.match('^id/no_id', viewId) or re.match('^id/.+/.+', viewId)
+            if byUniqueId:
+                attrs.append('uniqueId')
+            candidates = {}
+            for attr in attrs:
+                for v in index.findAll(attr, viewId, root):
+                    candidates[id(v)] = v
+            for v in sorted(candidates.values(), key=index.position):
+                # getId() is the resource-id or, if not present, the id property
+                if v.getId() == viewId or (byUniqueId and v.getUniqueId() == viewId):
+                    if not viewFilter or viewFilter(v):
+                        return v
+            return None
+
         try:
             rootId = root.getId()
         except AttributeError as ex:
@@ -3858,6 +4499,10 @@ class ViewClient:
         if root == "ROOT":
             root = self.root
 
+        index = self.__getViewIndex(root)
+        if index is not None:
+            return index.findAll(attr, val, root)
+
         if DEBUG: print("__findViewWithAttributeInTree: type val=", type(val), file=sys.stderr)
         if DEBUG: print(
             "__findViewWithAttributeInTree: checking if root=%s has attr=%s == %s" % (root.__smallStr__(), attr, val),
@@ -3918,6 +4563,9 @@ class ViewClient:
 
         if isinstance(val, RegexType):
             return self.__findViewWithAttributeInTreeThatMatches(attr, val, root)
+        index = self.__getViewIndex(root)
+        if index is not None:
+            return index.find(attr, val, root)
         else:
             try:
                 if DEBUG:
@@ -3944,7 +4592,7 @@ class ViewClient:
         else:
             raise ViewNotFoundException(attr, val, root)
 
-    def __findViewWithAttributeInTreeThatMatches(self, attr, regex, root, rlist=[]):
+    def __findViewWithAttributeInTreeThatMatches(self, attr, regex, root):
         if not self.root:
             print("ERROR: no root, did you forget to call dump()?", file=sys.stderr)
             return None
@@ -3952,6 +4600,10 @@ class ViewClient:
         if root == "ROOT":
             root = self.root
 
+        index = self.__getViewIndex(root)
+        if index is not None:
+            return index.match(attr, regex, root)
+
         if DEBUG: print("__findViewWithAttributeInTreeThatMatches: checking if root=%s attr=%s matches %s" % (
             root.__smallStr__(), attr, regex), file=sys.stderr)
 
@@ -3961,13 +4613,13 @@ class ViewClient:
             return root
         else:
             for ch in root.children:
-                v = self.__findViewWithAttributeInTreeThatMatches(attr, regex, ch, rlist)
+                v = self.__findViewWithAttributeInTreeThatMatches(attr, regex, ch)
                 if v:
                     return v
 
         return None
 
-    def __findViewsWithAttributeInTreeThatMatches(self, attr, regex, root, rlist=[]):
+    def __findViewsWithAttributeInTreeThatMatches(self, attr, regex, root):
         # Note the plural in this method name
         matchingViews = []
         if not self.root:
@@ -3977,6 +4629,10 @@ class ViewClient:
         if isinstance(root, str) and root == "ROOT":
             root = self.root
 
+        index = self.__getViewIndex(root)
+        if index is not None:
+            return index.matchAll(attr, regex, root)
+
         if DEBUG:
             print("__findViewsWithAttributeInTreeThatMatches: checking if root=%s attr=%s matches %s" % (
                 root.__smallStr__(), attr, regex), file=sys.stderr)
@@ -4108,6 +4764,37 @@ class ViewClient:
 
         return [v for v in self.views if (v.containsPoint(point) and _filter(v))]
 
+    def query(self, selector, root="ROOT", mode='all'):
+        """
+        Finds the Views matching a selector, see L{com.dtmilano.android.selector} for the syntax.
+
+        Usage:
+          ok = vc.query('Button[text="OK"]', mode='first')
+          items = vc.query('#com.example:id/list > *:clickable')
+
+        @type selector: str
+        @param selector: the selector, or an already compiled L{Selector}
+        @type root: View
+        @param root: the root of the subtree where the Views are searched
+        @type mode: str
+        @param mode: C{first} to find the first View (or C{None}), C{all} to find all of them, C{count} to count them
+        @return: depending on C{mode}, the first View, the list of Views in pre-order or the number of Views
+        @raise ValueError: if the selector is not valid
+        """
+
+        if not isinstance(selector, Selector):
+            selector = compileSelector(selector)
+        if not self.root:
+            print("ERROR: no root, did you forget to call dump()?", file=sys.stderr)
+            return 0 if mode == 'count' else [] if mode == 'all' else None
+        if root == "ROOT":
+            root = self.root
+        index = self.__getViewIndex(root)
+        if index is None:
+            # a View that is not part of the current tree
+            index = ViewIndex(root)
+        return selector.run(index, root, mode)
+
     def findObject(self, **kwargs):
         if self.uiAutomatorHelper:
             if DEBUG_UI_AUTOMATOR_HELPER:
@@ -4460,19 +5147,10 @@ On OSX install
 ''')
 
     def installPackage(self, apk, allowTestApk=False, grantAllPermissions=False):
-        command = [self.adb, "-s", self.serialno, "install", "-r"]
-
-        if allowTestApk:
-            command.append("-t")
-
-        if grantAllPermissions:
-            command.append("-g")
-
-        command.append(apk)
-        subprocess.check_call(command, shell=False)
+        return self.device.installPackage(apk, allowTestApk, grantAllPermissions)
 
     def uninstallPackage(self, package):
-        return subprocess.check_call([self.adb, "-s", self.serialno, "uninstall", package], shell=False)
+        return self.device.uninstallPackage(package)
 
     @staticmethod
     def writeViewImageToFileInDir(view):
@@ -4487,31 +5165,14 @@ On OSX install
             raise RuntimeError('You must set ViewClient.imageDiretory in order to use this method')
         view.writeImageToFile(ViewClient.imageDirectory)
 
-    @staticmethod
-    def __pickleable(tree):
-        """
-        Makes the tree pickleable.
+    def getTreeHash(self):
         """
+        Gets the structural hash of the current tree, two dumps of the same screen have the same hash.
 
-        def removeDeviceReference(view):
-            """
-            Removes the reference to a L{MonkeyDevice}.
-            """
-
-            view.device = None
-
-        ###########################################################################################
-        # FIXME: Unfortunately deepcopy does not work with MonkeyDevice objects, which is
-        # sadly the reason why we cannot pickle the tree and we need to remove the MonkeyDevice
-        # references.
-        # We wanted to copy the tree to preserve the original and make piclkleable the copy.
-        # treeCopy = copy.deepcopy(tree)
-        treeCopy = tree
-        # IMPORTANT:
-        # This assumes that the first element in the list is the tree root
-        ViewClient.__traverse(treeCopy[0], transform=removeDeviceReference)
-        ###########################################################################################
-        return treeCopy
+        @return: the hash or C{None} if there's no tree
+        @see: L{View.getSubtreeHash}
+        """
+        return self.root.getSubtreeHash() if isinstance(self.root, View) else None
 
     def distanceTo(self, tree):
         """
@@ -4521,42 +5182,29 @@ On OSX install
         @param tree: Tree of Views
         @return: the distance
         """
-        return ViewClient.distance(ViewClient.__pickleable(self.views), tree)
+        return ViewClient.distance(self.views, tree)
 
     @staticmethod
     def distance(tree1, tree2):
         """
-        Calculates the distance between the two trees.
+        Calculates the distance between the two trees, from 0, the same tree, to 1, nothing in common.
+
+        It's the structural distance (see L{com.dtmilano.android.distance.tree_distance}), the number of Views
+        removed, added or modified, divided by the number of Views in both trees. Identical subtrees are detected
+        by their hashes, so equal trees are compared in constant time.
 
         @type tree1: list of Views
-        @param tree1: Tree of Views
+        @param tree1: Tree of Views, the first element is the root
         @type tree2: list of Views
-        @param tree2: Tree of Views
+        @param tree2: Tree of Views, the first element is the root
         @return: the distance
         """
-        ################################################################
-        # FIXME: this should copy the entire tree and then transform it #
-        ################################################################
-        pickleableTree1 = ViewClient.__pickleable(tree1)
-        pickleableTree2 = ViewClient.__pickleable(tree2)
-        s1 = pickle.dumps(pickleableTree1)
-        s2 = pickle.dumps(pickleableTree2)
-
+        if not tree1 or not tree2:
+            return 0.0 if not tree1 and not tree2 else 1.0
+        d = tree_distance(tree1[0], tree2[0])
         if DEBUG_DISTANCE:
-            print("distance: calculating distance between", s1[:20], "and", s2[:20], file=sys.stderr)
-
-        l1 = len(s1)
-        l2 = len(s2)
-        t = float(max(l1, l2))
-
-        if l1 == l2:
-            if DEBUG_DISTANCE:
-                print("distance: trees have same length, using Hamming distance", file=sys.stderr)
-            return ViewClient.__hammingDistance(s1, s2) / t
-        else:
-            if DEBUG_DISTANCE:
-                print("distance: trees have different length, using Levenshtein distance", file=sys.stderr)
-            return levenshtein_distance(s1, s2) / t
+            print("distance: %d Views differ" % d, file=sys.stderr)
+        return d / float(len(tree1) + len(tree2))
 
     @staticmethod
     def __hammingDistance(s1, s2):
@@ -4587,15 +5235,29 @@ On OSX install
 
         return ViewClient.__hammingDistance(s1, s2)
 
-    def levenshteinDistance(self, tree):
+    levenshtein_distance = staticmethod(levenshtein_distance)
+
+    def levenshteinDistance(self, tree, maxDistance=None):
         """
         Finds the Levenshtein distance between this tree and the one passed as argument.
+
+        @param maxDistance: the maximum distance of interest, see L{levenshtein_distance}
         """
 
         s1 = ' '.join(map(View.__microStr__, self.views))
         s2 = ' '.join(map(View.__microStr__, tree))
 
-        return levenshtein_distance(s1, s2)
+        return levenshtein_distance(s1, s2, maxDistance)
+
+    def tokenDistance(self, tree, maxDistance=None):
+        """
+        Finds the edit distance between this tree and the one passed as argument as the number of Views, identified
+        by their class, id and coordinates, inserted, deleted or substituted.
+
+        @param maxDistance: the maximum distance of interest, see L{token_distance}
+        """
+
+        return token_distance([v.__microStr__() for v in self.views], [v.__microStr__() for v in tree], maxDistance)
 
     @staticmethod
     def excerpt(_str, execute=False):
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright (C) 2012-2024  Diego Torres Milano
+Created on Oct 18, 2026
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+@author: Diego Torres Milano
+
+Waits
+=====
+Polling with an exponential backoff, used by L{ViewClient.waitUntil}, L{ViewClient.waitForIdle} and
+L{ViewClient.waitForView} instead of fixed sleeps.
+
+The first polls are close together, so a condition that is already true, or becomes true soon, is detected almost
+immediately, and the interval grows up to a maximum for conditions that take longer, so the device is not flooded
+with requests.
+"""
+
+from __future__ import print_function
+
+import collections
+import sys
+import time
+
+DEBUG = False
+
+WAIT_TIMEOUT = 10.0
+''' The default timeout, in seconds '''
+WAIT_INTERVAL = 0.05
+''' The first polling interval, in seconds '''
+WAIT_MAX_INTERVAL = 1.0
+''' The maximum polling interval, in seconds '''
+WAIT_BACKOFF = 2.0
+''' The factor by which the polling interval grows '''
+
+Stability = collections.namedtuple('Stability', ['stable', 'value', 'samples', 'elapsed'])
+Stability.__doc__ = ''' The result of L{waitUntilStable}: whether the value became stable before the timeout, the
+    last value, the number of samples taken and the seconds elapsed '''
+
+
+def intervals(interval=WAIT_INTERVAL, backoff=WAIT_BACKOFF, maxInterval=WAIT_MAX_INTERVAL):
+    """
+    Generates the polling intervals, growing exponentially from C{interval} up to C{maxInterval}.
+
+    @type interval: float
+    @param interval: the first interval, in seconds
+    @type backoff: float
+    @param backoff: the factor by which the interval grows
+    @type maxInterval: float
+    @param maxInterval: the maximum interval, in seconds
+    """
+    if interval < 0 or backoff < 1 or maxInterval < interval:
+        raise ValueError("invalid intervals: interval=%s backoff=%s maxInterval=%s" % (interval, backoff, maxInterval))
+    while True:
+        yield interval
+        interval = min(interval * backoff, maxInterval)
+
+
+def waitUntil(predicate, timeout=WAIT_TIMEOUT, interval=WAIT_INTERVAL, backoff=WAIT_BACKOFF,
+              maxInterval=WAIT_MAX_INTERVAL, sleep=time.sleep):
+    """
+    Waits until a predicate is true, evaluating it at the L{intervals}.
+
+    @type predicate: callable
+    @param predicate: the predicate, called without arguments
+    @type timeout: float
+    @param timeout: the timeout, in seconds
+    @type sleep: callable
+    @param sleep: sleeps between evaluations, receiving the seconds. It can return earlier, i.e. when an event
+        notifies that the predicate may have changed.
+    @return: the value returned by the predicate, the last one, which is false, if it timed out
+    """
+    deadline = time.monotonic() + timeout
+    for delay in intervals(interval, backoff, maxInterval):
+        result = predicate()
+        if result:
+            return result
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            if DEBUG:
+                print("waitUntil: timed out after %.3fs" % timeout, file=sys.stderr)
+            return result
+        sleep(min(delay, remaining))
+
+
+def waitUntilStable(signal, count=2, timeout=WAIT_TIMEOUT, interval=WAIT_INTERVAL, backoff=WAIT_BACKOFF,
+                    maxInterval=WAIT_MAX_INTERVAL, sleep=time.sleep):
+    """
+    Waits until a signal returns the same value C{count} consecutive times.
+
+    The interval grows while the value does not change and it starts again from C{interval} when it changes, as
+    something that is still changing may stop at any moment.
+
+    @type signal: callable
+    @param signal: the signal, called without arguments, returning a value that can be compared
+    @type count: int
+    @param count: the number of consecutive equal values needed to consider the signal stable, at least 2
+    @type timeout: float
+    @param timeout: the timeout, in seconds
+    @type sleep: callable
+    @param sleep: sleeps between samples, receiving the seconds
+    @return: the L{Stability}
+    """
+    if count < 2:
+        raise ValueError("count should be at least 2: %s" % count)
+    start = time.monotonic()
+    deadline = start + timeout
+    delays = intervals(interval, backoff, maxInterval)
+    value = signal()
+    samples = 1
+    equal = 1
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            if DEBUG:
+                print("waitUntilStable: timed out after %d samples" % samples, file=sys.stderr)
+            return Stability(False, value, samples, time.monotonic() - start)
+        sleep(min(next(delays), remaining))
+        previous = value
+        value = signal()
+        samples += 1
+        if value == previous:
+            equal += 1
+            if equal >= count:
+                return Stability(True, value, samples, time.monotonic() - start)
+        else:
+            equal = 1
+            delays = intervals(interval, backoff, maxInterval)
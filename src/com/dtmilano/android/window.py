@@ -20,9 +20,49 @@ limitations under the License.
 
 from __future__ import print_function
 
+import collections
+import re
 import sys
+import warnings
+
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
+
+from com.dtmilano.android.common import _nd, _nh, _ns, obtainPxPy, obtainVxVy, obtainVwVh
 
 DEBUG = False
+DEBUG_WINDOWS = DEBUG and False
+
+WINDOW_RE = re.compile(r'^ *Window #%s Window\{%s (u\d+ )?%s?.*\}:' %
+                       (_nd('num'), _nh('winId'), _ns('activity', greedy=True)))
+CURRENT_FOCUS_RE = re.compile(r'^  mCurrentFocus=Window\{%s .*' % _nh('winId'))
+VIEW_VISIBILITY_RE = re.compile(' mViewVisibility=0x%s ' % _nh('visibility'))
+POLICY_VISIBILITY_RE = re.compile('mPolicyVisibility=%s ' % _ns('policyVisibility', greedy=True))
+# This is for 4.0.4 API-15
+CONTAINING_FRAME_RE = re.compile(r'^   *mContainingFrame=\[%s,%s\]\[%s,%s\] mParentFrame=\[%s,%s\]\[%s,%s\]' %
+                                 (_nd('cx'), _nd('cy'), _nd('cw'), _nd('ch'), _nd('px'), _nd('py'), _nd('pw'),
+                                  _nd('ph')))
+CONTENT_FRAME_RE = re.compile(r'^   *mContentFrame=\[%s,%s\]\[%s,%s\] mVisibleFrame=\[%s,%s\]\[%s,%s\]' %
+                              (_nd('x'), _nd('y'), _nd('w'), _nd('h'), _nd('vx'), _nd('vy'), _nd('vx1'), _nd('vy1')))
+# This is for 4.1 API-16 and later
+FRAMES_RE = re.compile(r'^   *Frames: containing=\[%s,%s\]\[%s,%s\] parent=\[%s,%s\]\[%s,%s\]' %
+                       (_nd('cx'), _nd('cy'), _nd('cw'), _nd('ch'), _nd('px'), _nd('py'), _nd('pw'), _nd('ph')))
+CONTENT_RE = re.compile(r'^     *content=\[%s,%s\]\[%s,%s\] visible=\[%s,%s\]\[%s,%s\]' %
+                        (_nd('x'), _nd('y'), _nd('w'), _nd('h'), _nd('vx'), _nd('vy'), _nd('vx1'), _nd('vy1')))
+
+WindowsParsingStrategy = collections.namedtuple('WindowsParsingStrategy', ['framesRE', 'contentRE', 'contentOffset'])
+WindowsParsingStrategy.__doc__ = ''' How the frames of a window are found: the line matching C{framesRE} gives the
+    parent position and the line C{contentOffset} lines below it, matching C{contentRE}, the window position and size '''
+
+WINDOWS_PARSING_STRATEGIES = (
+    (17, WindowsParsingStrategy(FRAMES_RE, CONTENT_RE, 2)),
+    (16, WindowsParsingStrategy(FRAMES_RE, CONTENT_RE, 1)),
+    (15, WindowsParsingStrategy(CONTAINING_FRAME_RE, CONTENT_FRAME_RE, 1)),
+    (10, WindowsParsingStrategy(CONTAINING_FRAME_RE, CONTENT_FRAME_RE, 1)),
+)
+''' The strategies by SDK version, the first two also apply to any later version '''
 
 class Window(object):
     '''
@@ -73,3 +113,144 @@ class Window(object):
         return "Window(%d, wid=%s, a=%s, x=%d, y=%d, w=%d, h=%d, px=%d, py=%d, v=%d, f=%s)" % \
                 (self.num, self.winId, self.activity, self.wvx, self.wvy, self.wvw, self.wvh, self.px, self.py, self.visibility, self.focused)
 
+
+def windowsParsingStrategy(sdk):
+    '''
+    Gets the strategy to parse C{dumpsys window windows} for an SDK version.
+
+    @type sdk: int
+    @param sdk: the SDK version
+    @return: the L{WindowsParsingStrategy} or C{None} if the version is not supported
+    '''
+    for minSdk, strategy in WINDOWS_PARSING_STRATEGIES:
+        if sdk == minSdk or (sdk > minSdk and minSdk >= 16):
+            return strategy
+    return None
+
+
+class Windows(Mapping):
+    '''
+    An immutable snapshot of the windows obtained from C{dumpsys window windows}: a mapping from the window id to
+    the L{Window}, also keeping the id of the window having the focus.
+    '''
+
+    __slots__ = ('__windows', 'currentFocus', 'statusBarDimensions')
+
+    def __init__(self, windows=None, currentFocus=None):
+        '''
+        Constructor
+
+        @type windows: dict
+        @param windows: the L{Window}s by id, the one having the focus already marked as focused
+        @type currentFocus: str
+        @param currentFocus: the id of the window having the focus, even if it is not visible
+        '''
+        self.__windows = dict(windows) if windows else {}
+        self.currentFocus = currentFocus
+        self.statusBarDimensions = Windows.__statusBarDimensions(self.__windows)
+        ''' The width and height of the status bar, (0, 0) if it is not visible '''
+
+    def __getitem__(self, winId):
+        return self.__windows[winId]
+
+    def __iter__(self):
+        return iter(self.__windows)
+
+    def __len__(self):
+        return len(self.__windows)
+
+    def __str__(self):
+        return "Windows(%s, focus=%s)" % (", ".join(str(w) for w in self.__windows.values()), self.currentFocus)
+
+    __repr__ = __str__
+
+    def getFocusedWindow(self):
+        '''
+        Gets the focused window.
+
+        @return: the L{Window} having the focus, if it is visible, or C{None}
+        '''
+        w = self.__windows.get(self.currentFocus)
+        return w if w is not None and w.focused else None
+
+    @staticmethod
+    def __statusBarDimensions(windows):
+        for w in windows.values():
+            if w.activity == 'StatusBar':
+                if w.wvy == 0 and w.visibility == 0:
+                    return w.wvw, w.wvh
+                break
+        return 0, 0
+
+
+def parseWindows(output, sdk):
+    '''
+    Parses the output of C{dumpsys window windows}.
+
+    Every line is visited once: a window header starts a new L{Window} and the lines until the next header set its
+    visibility and frames, using the L{WindowsParsingStrategy} for the SDK version.
+
+    @type output: str
+    @param output: the output of C{dumpsys window windows}
+    @type sdk: int
+    @param sdk: the SDK version of the device
+    @return: the L{Windows}
+    '''
+    strategy = windowsParsingStrategy(sdk)
+    if strategy is None:
+        warnings.warn("Unsupported Android version %d" % sdk)
+    windows = {}
+    currentFocus = None
+    # num, winId, activity, wvx, wvy, wvw, wvh, px, py, visibility, policyVisibility
+    window = None
+    contentLine = -1
+    for n, line in enumerate(output.splitlines()):
+        m = WINDOW_RE.match(line)
+        if m:
+            if window:
+                windows[window[1]] = _newWindow(*window)
+            window = [int(m.group('num')), m.group('winId'), m.group('activity'), 0, 0, 0, 0, 0, 0, -1, 0x0]
+            contentLine = -1
+            continue
+        if window is not None:
+            if n == contentLine:
+                m = strategy.contentRE.match(line)
+                if m:
+                    # FIXME: the information provided by 'dumpsys window windows' in 4.2.1 (API 16)
+                    # when there's a system dialog may not be correct and causes the View coordinates
+                    # be offset by this amount, see
+                    # https://github.com/dtmilano/AndroidViewClient/issues/29
+                    window[3:5] = obtainVxVy(m)
+                    window[5:7] = obtainVwVh(m)
+                    continue
+            if 'Visibility=' in line:
+                m = VIEW_VISIBILITY_RE.search(line)
+                if m:
+                    window[9] = int(m.group('visibility'))
+                m = POLICY_VISIBILITY_RE.search(line)
+                if m:
+                    window[10] = 0x0 if m.group('policyVisibility') == 'true' else 0x8
+                continue
+            if strategy:
+                m = strategy.framesRE.match(line)
+                if m:
+                    window[7:9] = obtainPxPy(m)
+                    contentLine = n + strategy.contentOffset
+                    continue
+        m = CURRENT_FOCUS_RE.match(line)
+        if m:
+            currentFocus = m.group('winId')
+    if window:
+        windows[window[1]] = _newWindow(*window)
+
+    if currentFocus in windows and windows[currentFocus].visibility == 0:
+        windows[currentFocus].focused = True
+    if DEBUG_WINDOWS:
+        print("parseWindows: focus=", currentFocus, file=sys.stderr)
+        for w in windows.values():
+            print("parseWindows:", w, file=sys.stderr)
+    return Windows(windows, currentFocus)
+
+
+def _newWindow(num, winId, activity, wvx, wvy, wvw, wvh, px, py, visibility, policyVisibility):
+    return Window(num, winId, activity, wvx, wvy, wvw, wvh, px, py, visibility + policyVisibility)
@@ -790,6 +790,17 @@ class MockDevice(object):
             return 1184
         return None
 
+    def shell_batch(self, commands):
+        results = []
+        for cmd in commands:
+            m = re.match(r'getprop (\S+)', cmd)
+            if m:
+                value = self.getProperty(m.group(1))
+                results.append(('%s\n' % value if value is not None else '\n', 0))
+            else:
+                results.append((self.shell(cmd) or '', 0))
+        return results
+
     def shutdownMockViewServer(self):
         if DEBUG:
             print("MockDevice.shutdownMockViewServer()", self, end=' ', file=sys.stderr)
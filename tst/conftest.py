@@ -0,0 +1,267 @@
+import re
+import socketserver
+import struct
+import threading
+
+import pytest
+
+SERIALNO = 'emulator-5554'
+
+SHELL_OUTPUT = {
+    'getprop ro.build.version.sdk': '30\n',
+    'getprop ro.sf.lcd_density': '420\n',
+    'getprop': '[ro.build.version.sdk]: [30]\n[ro.build.version.release]: [11]\n[ro.sf.lcd_density]: [420]\n'
+               '[sys.boot_completed]: [1]\n',
+    'dumpsys display': '  mViewports=[DisplayViewport{type=INTERNAL, valid=true, isActive=true, displayId=0, '
+                       'orientation=0, logicalFrame=Rect(0, 0 - 1080, 1920), deviceWidth=1080, deviceHeight=1920}]\n',
+    'dumpsys window displays': '  mPredictedRotation=0\n',
+}
+
+
+FEATURES = ['shell_v2', 'cmd']
+
+NODE = ('<node index="{i}" text="Item {i} é" resource-id="com.example:id/item" class="android.widget.TextView" '
+        'package="com.example" content-desc="" checkable="false" checked="false" clickable="true" enabled="true" '
+        'focusable="true" focused="false" scrollable="false" long-clickable="false" password="false" '
+        'selected="false" bounds="[0,{top}][1080,{bottom}]">')
+
+
+def hierarchy(n):
+    nodes = ''.join(NODE.format(i=i, top=i * 10, bottom=i * 10 + 10) + '</node>' for i in range(n))
+    return ("<?xml version='1.0' encoding='UTF-8' standalone='yes' ?><hierarchy rotation=\"0\">" +
+            NODE.format(i=0, top=0, bottom=1920) + nodes + '</node></hierarchy>')
+
+
+BATCH_RE = re.compile(r'\{ (.*?)\n\} 2>&1\necho "(__AVC_\w+__)\$\?"\n', re.DOTALL)
+
+
+class FakeAdbServer(socketserver.ThreadingTCPServer):
+    """
+    A minimal ADB server speaking the host side of the smart socket protocol with one device attached.
+    Shell outputs, also used by exec:, are either a string or bytes (stdout), a tuple (stdout, stderr, exit code) or
+    a callable returning one of them, called on every request.
+    """
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, serialno=SERIALNO, shell=None):
+        super().__init__(('127.0.0.1', 0), FakeAdbHandler)
+        self.serialno = serialno
+        self.shell = dict(SHELL_OUTPUT)
+        if shell:
+            self.shell.update(shell)
+        self.features = list(FEATURES)
+        self.files = {}
+        ''' The device files, path -> (mode, content), used by sync: '''
+        self.framebuffer = None
+        ''' The (header, pixels) sent by framebuffer:, or a list of them sent in turn, repeating the last one '''
+        self.stall = set()
+        self.hang = set()
+        ''' The shell commands whose stdout is sent but that never exit, used by shell,v2 '''
+        self.connections = 0
+        self.active = 0
+        self.maxActive = 0
+        self.transports = 0
+        self.requests = []
+        self.lock = threading.Lock()
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+
+class FakeAdbHandler(socketserver.BaseRequestHandler):
+
+    def readRequest(self):
+        header = self.readExactly(4)
+        if not header:
+            return None
+        return self.readExactly(int(header, 16)).decode('utf-8')
+
+    def readExactly(self, n):
+        data = b''
+        while len(data) < n:
+            chunk = self.request.recv(n - len(data))
+            if not chunk:
+                return data
+            data += chunk
+        return data
+
+    def sync(self):
+        files = self.server.files
+        v2 = 'stat_v2' in self.server.features
+        while True:
+            header = self.readExactly(8)
+            if len(header) < 8:
+                return
+            _id, length = struct.unpack('<4sI', header)
+            if _id == b'QUIT':
+                return
+            path = self.readExactly(length).decode('utf-8')
+            if _id == b'SEND':
+                path, mode = path.rsplit(',', 1)
+                data = b''
+                while True:
+                    _id, length = struct.unpack('<4sI', self.readExactly(8))
+                    if _id == b'DONE':
+                        break
+                    assert _id == b'DATA' and length <= 64 * 1024
+                    data += self.readExactly(length)
+                files[path] = (0o100000 | int(mode), data)
+                self.request.sendall(struct.pack('<4sI', b'OKAY', 0))
+            elif _id == b'RECV':
+                if path not in files:
+                    msg = b'No such file or directory'
+                    self.request.sendall(struct.pack('<4sI', b'FAIL', len(msg)) + msg)
+                    continue
+                data = files[path][1]
+                for i in range(0, len(data), 64 * 1024):
+                    chunk = data[i:i + 64 * 1024]
+                    self.request.sendall(struct.pack('<4sI', b'DATA', len(chunk)) + chunk)
+                self.request.sendall(struct.pack('<4sI', b'DONE', 0))
+            elif _id == b'STAT':
+                mode, data = files.get(path, (0, b''))
+                self.request.sendall(struct.pack('<4sIII', b'STAT', mode, len(data), 1700000000 if mode else 0))
+            elif _id in (b'STA2', b'LST2') and v2:
+                mode, data = files.get(path, (0, b''))
+                self.request.sendall(struct.pack('<4sIQQIIIIQqqq', _id, 0 if mode else 2, 1, 2, mode, 1, 2000, 2000,
+                                                 len(data), 1700000000, 1700000000, 1700000000))
+            elif _id in (b'LIST', b'LIS2'):
+                prefix = path.rstrip('/') + '/'
+                for p in sorted(files):
+                    if p.startswith(prefix) and '/' not in p[len(prefix):]:
+                        name = p[len(prefix):].encode('utf-8')
+                        mode, data = files[p]
+                        if _id == b'LIS2':
+                            self.request.sendall(struct.pack('<4sIQQIIIIQqqqI', b'DNT2', 0, 1, 2, mode, 1, 2000, 2000,
+                                                             len(data), 0, 1700000000, 0, len(name)) + name)
+                        else:
+                            self.request.sendall(struct.pack('<4sIIII', b'DENT', mode, len(data), 1700000000,
+                                                             len(name)) + name)
+                if _id == b'LIS2':
+                    self.request.sendall(struct.pack('<4sIQQIIIIQqqqI', b'DONE', *([0] * 12)))
+                else:
+                    self.request.sendall(struct.pack('<4sIIII', b'DONE', 0, 0, 0, 0))
+            else:
+                return
+
+    def output(self, cmd):
+        batch = BATCH_RE.findall(cmd)
+        if batch:
+            # run AdbClient.shell_batch() scripts command by command
+            stdout = ''
+            for c, sentinel in batch:
+                out, err, exitCode = self.output(c)
+                stdout += (out + err).decode('utf-8') + '%s%d\n' % (sentinel, exitCode)
+            return stdout.encode('utf-8'), b'', 0
+        out = self.server.shell.get(cmd, '')
+        if callable(out):
+            out = out()
+        if isinstance(out, (str, bytes)):
+            out = (out, '', 0)
+        return tuple(o.encode('utf-8') if isinstance(o, str) else o for o in out)
+
+    def reply(self, payload):
+        self.request.sendall(b'OKAY%04X%s' % (len(payload), payload))
+
+    def handle(self):
+        with self.server.lock:
+            self.server.active += 1
+            self.server.maxActive = max(self.server.maxActive, self.server.active)
+        try:
+            self.serve()
+        except ConnectionError:
+            # clients use SO_LINGER with a 0 timeout, closing the idle sockets resets the connection
+            pass
+        finally:
+            with self.server.lock:
+                self.server.active -= 1
+
+    def serve(self):
+        server = self.server
+        with server.lock:
+            server.connections += 1
+        while True:
+            request = self.readRequest()
+            if request is None:
+                return
+            with server.lock:
+                server.requests.append(request)
+            if request == 'host:version':
+                self.reply(b'0029')
+            elif request == 'host:devices-l':
+                self.reply(b'%s\tdevice product:sdk model:sdk device:generic\n' % server.serialno.encode('utf-8'))
+            elif request == 'host-serial:%s:features' % server.serialno:
+                self.reply(','.join(server.features).encode('utf-8'))
+                return
+            elif request.startswith('host:transport:'):
+                if request[len('host:transport:'):] != server.serialno:
+                    self.request.sendall(b'FAIL0010device not found')
+                    return
+                with server.lock:
+                    server.transports += 1
+                self.request.sendall(b'OKAY')
+            elif request.split(':', 1)[-1] in server.stall:
+                # never answer, wait until the client gives up
+                self.request.recv(1)
+                return
+            elif request == 'framebuffer:' and server.framebuffer:
+                with server.lock:
+                    frames = server.framebuffer
+                    if isinstance(frames, list):
+                        header, pixels = frames.pop(0) if len(frames) > 1 else frames[0]
+                    else:
+                        header, pixels = frames
+                self.request.sendall(b'OKAY' + header)
+                self.readRequest()
+                self.request.sendall(pixels)
+                return
+            elif request == 'sync:':
+                self.request.sendall(b'OKAY')
+                self.sync()
+                return
+            elif request.startswith('shell:'):
+                stdout, stderr, _ = self.output(request[len('shell:'):])
+                self.request.sendall(b'OKAY' + stdout + stderr)
+                return
+            elif request.startswith('exec:'):
+                stdout, stderr, _ = self.output(request[len('exec:'):])
+                self.request.sendall(b'OKAY' + stdout + stderr)
+                return
+            elif request.startswith('shell,v2,raw:'):
+                if 'shell_v2' not in server.features:
+                    self.request.sendall(b'FAIL0007unknown')
+                    return
+                stdout, stderr, exitCode = self.output(request[len('shell,v2,raw:'):])
+                self.request.sendall(b'OKAY')
+                for packetId, data in ((1, stdout), (2, stderr)):
+                    if data:
+                        self.request.sendall(struct.pack('<BI', packetId, len(data)) + data)
+                if request[len('shell,v2,raw:'):] in server.hang:
+                    # wait until the client gives up
+                    self.request.recv(1)
+                    return
+                self.request.sendall(struct.pack('<BIB', 3, 1, exitCode))
+                return
+            else:
+                self.request.sendall(b'FAIL0007unknown')
+                return
+
+
+@pytest.fixture
+def viewclient(adbserver):
+    from com.dtmilano.android.adb.adbclient import AdbClient
+    from com.dtmilano.android.viewclient import ViewClient
+    device = AdbClient(SERIALNO, hostname='127.0.0.1', port=adbserver.port)
+    yield ViewClient(device, SERIALNO, adb='/bin/true', autodump=False)
+    device.close()
+
+
+@pytest.fixture
+def adbserver():
+    server = FakeAdbServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
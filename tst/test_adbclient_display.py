@@ -0,0 +1,71 @@
+import pytest
+
+from com.dtmilano.android.adb.adbclient import AdbClient
+
+from conftest import SERIALNO
+
+SURFACE_ORIENTATION = 'dumpsys input | grep SurfaceOrientation'
+
+
+def shells(adbserver, cmd):
+    return [r for r in adbserver.requests if r.startswith('shell') and r.endswith(':' + cmd)]
+
+
+@pytest.fixture
+def adbclient(adbserver):
+    adbserver.shell[SURFACE_ORIENTATION] = '      SurfaceOrientation: 0\n'
+    adbClient = AdbClient(SERIALNO, hostname='127.0.0.1', port=adbserver.port)
+    yield adbClient
+    adbClient.close()
+
+
+def test_display_info_is_cached(adbserver, adbclient):
+    assert adbclient.display == {'width': 1080, 'height': 1920, 'density': 420 / 160, 'orientation': 0}
+    for prop in ['display.width', 'display.height', 'display.density', 'display.orientation']:
+        adbclient.getProperty(prop)
+    assert len(shells(adbserver, 'dumpsys display')) == 1
+
+
+def test_refresh_orientation(adbserver, adbclient):
+    changes = []
+    adbclient.displayState.addListener(lambda old, new: changes.append((old['orientation'], new['orientation'])))
+    assert adbclient.displayState.refreshOrientation() == 0
+    assert changes == []
+    assert len(shells(adbserver, 'dumpsys display')) == 1
+
+    adbserver.shell[SURFACE_ORIENTATION] = '      SurfaceOrientation: 1\n'
+    adbserver.shell['dumpsys display'] = (
+        '  mViewports=[DisplayViewport{type=INTERNAL, valid=true, isActive=true, displayId=0, orientation=1, '
+        'logicalFrame=Rect(0, 0 - 1920, 1080), deviceWidth=1920, deviceHeight=1080}]\n')
+    assert adbclient.displayState.refreshOrientation() == 1
+    assert changes == [(0, 1)]
+    assert adbclient.display['orientation'] == 1
+    assert (adbclient.display['width'], adbclient.display['height']) == (1920, 1080)
+    assert adbclient.getProperty('display.orientation') == 1
+
+
+def test_orientation_falls_back_to_surface_orientation(adbserver):
+    adbserver.shell['dumpsys display'] = ''
+    adbserver.shell['wm size; wm density'] = 'Physical size: 1080x1920\nPhysical density: 420\n'
+    adbserver.shell[SURFACE_ORIENTATION] = '      SurfaceOrientation: 3\n'
+    adbClient = AdbClient(SERIALNO, hostname='127.0.0.1', port=adbserver.port)
+    try:
+        assert adbClient.display['orientation'] == 3
+        assert adbClient.display['width'] == 1080
+    finally:
+        adbClient.close()
+
+
+def test_touch_transforms_to_the_current_orientation(adbserver, adbclient):
+    adbclient.touch(100, 200, orientation=0)
+    assert shells(adbserver, 'input tap 100 200')
+
+    adbserver.shell[SURFACE_ORIENTATION] = '      SurfaceOrientation: 1\n'
+    adbserver.shell['dumpsys display'] = (
+        '  mViewports=[DisplayViewport{type=INTERNAL, valid=true, isActive=true, displayId=0, orientation=1, '
+        'logicalFrame=Rect(0, 0 - 1920, 1080), deviceWidth=1920, deviceHeight=1080}]\n')
+    adbclient.touch(100, 200, orientation=0)
+    assert adbclient.display['orientation'] == 1
+    assert shells(adbserver, 'input tap 1720 100')
+    adbclient.drag((100, 200), (100, 300), 10, orientation=0)
+    assert shells(adbserver, 'input touchscreen swipe 1720 100 1620 100 10')
@@ -0,0 +1,66 @@
+import pytest
+
+from com.dtmilano.android.adb.adbclient import AdbClient, parseGetprop
+
+from conftest import SERIALNO
+
+
+def shells(adbserver, cmd):
+    return [r for r in adbserver.requests if r.startswith('shell') and r.endswith(':' + cmd)]
+
+
+@pytest.fixture
+def adbclient(adbserver):
+    adbClient = AdbClient(SERIALNO, hostname='127.0.0.1', port=adbserver.port)
+    yield adbClient
+    adbClient.close()
+
+
+def test_parse_getprop():
+    assert parseGetprop('[a.b]: [1]\n[empty]: []\n[multi]: [line 1\nline 2]\n[c]: [x]y]\n') == {
+        'a.b': '1', 'empty': '', 'multi': 'line 1\nline 2', 'c': 'x]y'}
+
+
+def test_properties_are_loaded_once(adbserver, adbclient):
+    assert adbclient.getProperty('ro.build.version.release') == '11'
+    assert adbclient.getProperty('ro.build.version.sdk', strip=False) == '30\n'
+    assert adbclient.getProperty('ro.nonexistent') == ''
+    assert len(shells(adbserver, 'getprop')) == 1
+    assert not [r for r in adbserver.requests if 'getprop ro.' in r]
+
+
+def test_volatile_properties_are_not_cached(adbserver, adbclient):
+    adbserver.shell['getprop sys.boot_completed'] = '0\n'
+    assert adbclient.getProperty('sys.boot_completed') == '0'
+    adbserver.shell['getprop sys.boot_completed'] = '1\n'
+    assert adbclient.getProperty('sys.boot_completed') == '1'
+
+
+@pytest.mark.parametrize('key', ['persist.sys.locale', 'debug.hwui.profile', 'service.bootanim.exit',
+                                 'vendor.usb.config'])
+def test_only_read_only_properties_are_cached(adbserver, adbclient, key):
+    adbserver.shell['getprop'] = '[ro.build.version.sdk]: [30]\n[%s]: [old]\n' % key
+    adbserver.shell['getprop ' + key] = 'old\n'
+    assert adbclient.getProperty(key) == 'old'
+    # setprop
+    adbserver.shell['getprop ' + key] = 'new\n'
+    assert adbclient.getProperty(key) == 'new'
+
+
+def test_properties_invalidation_and_ttl(adbserver, adbclient):
+    adbclient.getProperty('ro.build.version.release')
+    adbserver.shell['getprop'] = '[ro.build.version.release]: [12]\n'
+    assert adbclient.getProperty('ro.build.version.release') == '11'
+    adbclient.invalidateProperties()
+    assert adbclient.getProperty('ro.build.version.release') == '12'
+    adbclient.propertyCacheTtl = 0
+    adbserver.shell['getprop ro.build.version.release'] = '13\n'
+    assert adbclient.getProperty('ro.build.version.release') == '13'
+
+
+def test_viewclient_reads_the_properties_cache(adbserver, viewclient):
+    assert viewclient.build['ro.build.version.sdk'] == 30 and viewclient.useUiAutomator
+    assert viewclient.build['ro.build.version.release'] == '11'
+    shells = [r for r in adbserver.requests if r.startswith('shell')]
+    assert not [r for r in shells if 'getprop ro.' in r]
+    assert len([r for r in shells if r.endswith(':getprop')]) == 1
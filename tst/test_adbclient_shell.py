@@ -0,0 +1,90 @@
+import pytest
+
+from com.dtmilano.android.adb.adbclient import AdbClient, SHELL_V2_STDOUT, SHELL_V2_STDERR, SHELL_V2_EXIT
+from com.dtmilano.android.adb.dumpsys import Dumpsys
+
+from conftest import SERIALNO
+
+MEMINFO = '''Applications Memory Usage (in Kilobytes):
+                   Pss  Private  Private  SwapPss     Heap     Heap     Heap
+  Native Heap     4066     4000        0        0    12288     8546     3741
+  Dalvik Heap     1838     1800        0        0     6042     3021     3021
+           TOTAL    12950    11676       12        0    18330    11567     6762
+ Objects
+               Views:       12         ViewRootImpl:        1
+         AppContexts:        3           Activities:        1
+'''
+
+
+@pytest.fixture
+def adbclient(adbserver):
+    adbClient = AdbClient(SERIALNO, hostname='127.0.0.1', port=adbserver.port)
+    yield adbClient
+    adbClient.close()
+
+
+def test_shell_v2_separates_streams_and_exit_code(adbserver, adbclient):
+    adbserver.shell['ls /nonexistent'] = ('out\n', 'ls: /nonexistent: No such file or directory\n', 1)
+    packets = list(adbclient.shell_v2('ls /nonexistent'))
+    assert packets == [(SHELL_V2_STDOUT, b'out\n'),
+                       (SHELL_V2_STDERR, b'ls: /nonexistent: No such file or directory\n'),
+                       (SHELL_V2_EXIT, 1)]
+
+
+def test_shell_falls_back_to_legacy_service(adbserver):
+    adbserver.features = []
+    adbserver.shell['echo hi'] = 'hi\n'
+    adbClient = AdbClient(SERIALNO, hostname='127.0.0.1', port=adbserver.port)
+    try:
+        assert list(adbClient.shell_v2('echo hi')) == [(SHELL_V2_STDOUT, b'hi\n'), (SHELL_V2_EXIT, None)]
+        assert adbClient.shell('echo hi') == 'hi\n'
+    finally:
+        adbClient.close()
+
+
+def test_shell_merges_stdout_and_stderr(adbserver, adbclient):
+    adbserver.shell['cmd'] = ('a\n', 'b\n', 0)
+    assert adbclient.shell('cmd') == 'a\nb\n'
+    assert adbclient.shell('cmd', False) == b'a\nb\n'
+
+
+def test_shell_lines(adbserver, adbclient):
+    adbserver.shell['cat'] = 'one\r\ntwo\n\nthree é'
+    assert list(adbclient.shell_lines('cat')) == ['one', 'two', '', 'three é']
+
+
+def test_dumpsys_meminfo_parses_lines(adbserver, adbclient):
+    adbserver.shell['dumpsys meminfo com.example'] = MEMINFO
+    dumpsys = Dumpsys.meminfo(adbclient, 'com.example')
+    assert dumpsys.nativeHeap == 4066
+    assert dumpsys.dalvikHeap == 1838
+    assert dumpsys.total == 12950
+    assert dumpsys.views == 12
+    assert dumpsys.viewRootImpl == 1
+    assert dumpsys.appContexts == 3
+    assert dumpsys.activity == 1
+
+
+def test_shell_batch(adbserver, adbclient):
+    adbserver.shell['getprop ro.build.version.release'] = '11\n'
+    adbserver.shell['false'] = ('', 'error\n', 1)
+    adbserver.shell['printf x'] = 'x'
+    requests = len(adbserver.requests)
+    results = adbclient.shell_batch(['getprop ro.build.version.sdk', 'false', 'printf x',
+                                     'getprop ro.build.version.release'])
+    assert results == [('30\n', 0), ('error\n', 1), ('x', 0), ('11\n', 0)]
+    assert len([r for r in adbserver.requests[requests:] if r.startswith('shell')]) == 1
+    assert adbclient.shell_batch([]) == []
+
+
+def test_exec_out_is_raw(adbserver, adbclient):
+    data = bytes(range(256)) * 1024 + b'\r\n\n'
+    adbserver.shell['cat /data/local/tmp/blob'] = data
+    assert b''.join(adbclient.exec_out('cat /data/local/tmp/blob')) == data
+    assert 'exec:cat /data/local/tmp/blob' in adbserver.requests
+
+
+def test_exec_out_requires_api_21(adbserver, adbclient):
+    adbclient.build['ro.build.version.sdk'] = 19
+    with pytest.raises(RuntimeError):
+        adbclient.exec_out('ls')
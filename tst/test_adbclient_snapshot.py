@@ -0,0 +1,107 @@
+import struct
+
+import numpy as np
+import pytest
+
+from com.dtmilano.android.adb.adbclient import AdbClient
+
+from conftest import SERIALNO
+
+WIDTH = 1080
+HEIGHT = 1920
+
+
+def framebuffer(width, height, bgra=False):
+    """
+    A version 1 framebuffer header, RGBA or BGRA, and pixels where every pixel is (x % 256, y % 256, 7, 255).
+    """
+    (roffset, boffset) = (16, 0) if bgra else (0, 16)
+    header = struct.pack('<13L', 1, 32, width * height * 4, width, height, roffset, 8, boffset, 8, 8, 8, 24, 8)
+    pixels = np.empty((height, width, 4), dtype=np.uint8)
+    pixels[..., 0] = (np.arange(width) % 256)[np.newaxis, :]
+    pixels[..., 1] = (np.arange(height) % 256)[:, np.newaxis]
+    pixels[..., 2] = 7
+    pixels[..., 3] = 255
+    if bgra:
+        pixels = pixels[..., [2, 1, 0, 3]]
+    return header, pixels.tobytes()
+
+
+@pytest.fixture
+def adbclient(adbserver):
+    adbClient = AdbClient(SERIALNO, hostname='127.0.0.1', port=adbserver.port)
+    yield adbClient
+    adbClient.close()
+
+
+def test_take_snapshot_array_is_a_view_of_the_pooled_buffer(adbserver, adbclient):
+    adbserver.framebuffer = framebuffer(WIDTH, HEIGHT)
+    array = adbclient.takeSnapshotArray()
+    assert array.shape == (HEIGHT, WIDTH, 4)
+    assert tuple(array[100, 300]) == (300 % 256, 100, 7, 255)
+    assert not array.flags.owndata
+    assert np.shares_memory(adbclient.takeSnapshotArray(), array)
+
+
+def test_take_snapshot_array_into_buffer(adbserver, adbclient):
+    adbserver.framebuffer = framebuffer(WIDTH, HEIGHT, bgra=True)
+    buffer = bytearray(WIDTH * HEIGHT * 4)
+    array = adbclient.takeSnapshotArray(buffer)
+    assert array.shape == (HEIGHT, WIDTH, 3)
+    assert tuple(array[100, 300]) == (300 % 256, 100, 7)
+    assert np.shares_memory(array, np.frombuffer(buffer, dtype=np.uint8))
+    with pytest.raises(ValueError):
+        adbclient.takeSnapshotArray(bytearray(16))
+
+
+def test_take_snapshot_array_rotated(adbserver, adbclient):
+    adbserver.framebuffer = framebuffer(HEIGHT, WIDTH)
+    adbclient.display['orientation'] = 1
+    array = adbclient.takeSnapshotArray()
+    assert array.shape == (HEIGHT, WIDTH, 4)
+    # rotated 90 degrees counterclockwise, the last column of the frame is the first row
+    assert tuple(array[0, 100]) == ((HEIGHT - 1) % 256, 100, 7, 255)
+    assert adbclient.takeSnapshotArray(rotate=False).shape == (WIDTH, HEIGHT, 4)
+
+
+def test_stream_frames_drops_duplicates(adbserver, adbclient):
+    first = framebuffer(WIDTH, HEIGHT)
+    (header, pixels) = first
+    second = (header, bytes(len(pixels)))
+    adbserver.framebuffer = [first, first, first, second]
+    frames = adbclient.stream_frames(fps=0)
+    (t0, frame0) = next(frames)
+    assert tuple(frame0[100, 300]) == (300 % 256, 100, 7, 255)
+    (t1, frame1) = next(frames)
+    assert t1 > t0
+    assert adbserver.requests.count('framebuffer:') == 4
+    assert not frame1.any()
+    # the previous frame is still valid
+    assert tuple(frame0[100, 300]) == (300 % 256, 100, 7, 255)
+
+
+def test_stream_frames_region_and_rate(adbserver, adbclient):
+    adbserver.framebuffer = framebuffer(WIDTH, HEIGHT)
+    frames = adbclient.stream_frames(fps=20, region=(300, 100, 310, 120), duplicates=True)
+    timestamps = []
+    for _ in range(4):
+        (timestamp, frame) = next(frames)
+        assert frame.shape == (20, 10, 4)
+        assert tuple(frame[0, 0]) == (300 % 256, 100, 7, 255)
+        timestamps.append(timestamp)
+    assert timestamps[-1] - timestamps[0] >= 3 / 20 - 0.01
+
+
+def test_take_snapshot_screencap_uses_exec_out(adbserver, adbclient):
+    import io
+    from PIL import Image
+    png = io.BytesIO()
+    # a gradient makes the compressed data contain plenty of b'\r\n'
+    Image.frombytes('L', (256, 256), bytes(range(256)) * 256).convert('RGB').save(png, 'PNG')
+    assert b'\r\n' in png.getvalue()
+    adbserver.shell['/system/bin/screencap -p'] = png.getvalue()
+    adbclient.build['ro.build.version.sdk'] = 22
+    adbclient.display.update(width=WIDTH, height=HEIGHT)
+    image = adbclient.takeSnapshot(reconnect=True)
+    assert image.size == (256, 256) and image.getpixel((10, 20)) == (10, 10, 10)
+    assert 'exec:/system/bin/screencap -p' in adbserver.requests
@@ -0,0 +1,71 @@
+import io
+import os
+
+import pytest
+
+from com.dtmilano.android.adb.adbclient import AdbClient
+from com.dtmilano.android.adb.sync import SYNC_DATA_MAX
+
+from conftest import SERIALNO
+
+
+@pytest.fixture
+def adbclient(adbserver):
+    adbClient = AdbClient(SERIALNO, hostname='127.0.0.1', port=adbserver.port)
+    yield adbClient
+    adbClient.close()
+
+
+def test_push_pull_roundtrip(adbserver, adbclient, tmp_path):
+    content = os.urandom(3 * SYNC_DATA_MAX + 123)
+    local = tmp_path / 'big.bin'
+    local.write_bytes(content)
+    assert adbclient.push(str(local), '/sdcard/big.bin') == len(content)
+    assert adbserver.files['/sdcard/big.bin'] == (0o100644, content)
+    out = io.BytesIO()
+    assert adbclient.pull('/sdcard/big.bin', out) == len(content)
+    assert out.getvalue() == content
+
+
+def test_pull_missing_file(adbclient, tmp_path):
+    with pytest.raises(RuntimeError, match='No such file'):
+        adbclient.pull('/sdcard/missing', str(tmp_path / 'missing'))
+    # the local file is not left behind
+    assert not (tmp_path / 'missing').exists()
+
+
+@pytest.mark.parametrize('features', [[], ['stat_v2', 'ls_v2']])
+def test_stat_and_list(adbserver, features):
+    adbserver.features = features
+    adbserver.files['/sdcard/dir/a.txt'] = (0o100644, b'abc')
+    adbserver.files['/sdcard/dir/b.txt'] = (0o100600, b'')
+    adbClient = AdbClient(SERIALNO, hostname='127.0.0.1', port=adbserver.port)
+    try:
+        st = adbClient.stat('/sdcard/dir/a.txt')
+        assert (st.mode, st.size) == (0o100644, 3)
+        assert adbClient.stat('/sdcard/nothing').mode == 0
+        if 'stat_v2' in features:
+            assert adbClient.stat('/sdcard/nothing').error == 2
+            assert adbClient.stat('/sdcard/dir/a.txt').uid == 2000
+        entries = adbClient.listDirectory('/sdcard/dir')
+        assert [(e.name, e.stat.size) for e in entries] == [('a.txt', 3), ('b.txt', 0)]
+    finally:
+        adbClient.close()
+
+
+def test_install_package(adbserver, adbclient, tmp_path):
+    apk = tmp_path / 'app.apk'
+    apk.write_bytes(b'PK\x03\x04')
+    adbserver.shell['pm install -r -g /data/local/tmp/app.apk'] = 'Performing Streamed Install\nSuccess\n'
+    assert adbclient.installPackage(str(apk), grantAllPermissions=True) == 0
+    assert adbserver.files['/data/local/tmp/app.apk'][1] == b'PK\x03\x04'
+    with pytest.raises(RuntimeError):
+        adbclient.installPackage(str(apk))
+
+
+def test_install_package_quotes_remote_path(adbserver, adbclient, tmp_path):
+    apk = tmp_path / "it's.apk"
+    apk.write_bytes(b'PK\x03\x04')
+    adbserver.shell["pm install -r '/data/local/tmp/it'\"'\"'s.apk'"] = 'Success\n'
+    assert adbclient.installPackage(str(apk)) == 0
+    assert adbserver.files["/data/local/tmp/it's.apk"][1] == b'PK\x03\x04'
@@ -0,0 +1,49 @@
+import time
+
+import pytest
+
+from com.dtmilano.android.adb.adbclient import AdbClient, Timer
+
+from conftest import SERIALNO
+
+
+def test_checkok_times_out(adbserver):
+    adbserver.stall.add('sleep 100')
+    adbClient = AdbClient(SERIALNO, hostname='127.0.0.1', port=adbserver.port, timeout=0.5)
+    try:
+        start = time.monotonic()
+        with pytest.raises(Timer.TimeoutException):
+            adbClient.shell('sleep 100')
+        assert time.monotonic() - start < 2
+    finally:
+        adbClient.close()
+
+
+def test_shell_output_times_out(adbserver):
+    adbserver.shell['logcat'] = 'first line\n'
+    adbserver.hang.add('logcat')
+    adbClient = AdbClient(SERIALNO, hostname='127.0.0.1', port=adbserver.port, timeout=0.5)
+    try:
+        # the truncated output is not returned as if the command had finished
+        with pytest.raises(Timer.TimeoutException):
+            adbClient.shell('logcat')
+    finally:
+        adbClient.close()
+
+
+def test_timeout_exception_is_socket_timeout():
+    import socket
+    assert issubclass(Timer.TimeoutException, socket.timeout)
+
+
+def test_timers_are_deprecated(adbserver):
+    adbClient = AdbClient(SERIALNO, hostname='127.0.0.1', port=adbserver.port)
+    try:
+        with pytest.warns(DeprecationWarning):
+            timerId = adbClient.setTimer(10, 'test')
+        assert timerId in adbClient.timers
+        with pytest.warns(DeprecationWarning):
+            adbClient.cancelTimer(timerId)
+        assert adbClient.timers == {}
+    finally:
+        adbClient.close()
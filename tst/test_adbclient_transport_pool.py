@@ -0,0 +1,68 @@
+import socket
+import time
+
+from com.dtmilano.android.adb.adbclient import AdbClient, TransportPool
+
+from conftest import SERIALNO
+
+
+def waitForIdle(pool, n, timeout=5):
+    deadline = time.monotonic() + timeout
+    while pool.stats()['idle'] < n and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return pool.stats()['idle']
+
+
+def test_pool_checkout_hits_after_refill(adbserver):
+    pool = TransportPool(SERIALNO, '127.0.0.1', adbserver.port, size=2)
+    try:
+        assert waitForIdle(pool, 2) == 2
+        s = pool.checkout()
+        s.close()
+        assert pool.stats()['hits'] == 1
+        assert pool.stats()['misses'] == 0
+        assert waitForIdle(pool, 2) == 2
+    finally:
+        pool.close()
+
+
+def test_pool_discards_closed_sockets(adbserver):
+    pool = TransportPool(SERIALNO, '127.0.0.1', adbserver.port, size=1)
+    try:
+        assert waitForIdle(pool, 1) == 1
+        stale = pool._TransportPool__idle[0]
+        stale.shutdown(socket.SHUT_RDWR)
+        assert not TransportPool.isAlive(stale)
+        s = pool.checkout()
+        assert s is not stale
+        assert TransportPool.isAlive(s)
+        s.close()
+        assert pool.stats()['hits'] == 0
+        assert pool.stats()['misses'] == 1
+    finally:
+        pool.close()
+
+
+def test_shell_reuses_pooled_transports(adbserver):
+    adbserver.shell['echo hello'] = 'hello\n'
+    adbClient = AdbClient(SERIALNO, hostname='127.0.0.1', port=adbserver.port)
+    try:
+        waitForIdle(adbClient.transportPool, adbClient.poolsize)
+        for _ in range(10):
+            waitForIdle(adbClient.transportPool, adbClient.poolsize)
+            assert adbClient.shell('echo hello') == 'hello\n'
+        stats = adbClient.getTransportPoolStats()
+        assert stats['hits'] >= 10
+        assert adbserver.requests.count('host:devices-l') == 1
+    finally:
+        adbClient.close()
+
+
+def test_shell_without_pool(adbserver):
+    adbClient = AdbClient(SERIALNO, hostname='127.0.0.1', port=adbserver.port, poolsize=0)
+    try:
+        assert adbClient.transportPool is None
+        assert adbClient.getTransportPoolStats() is None
+        assert adbClient.shell('getprop ro.build.version.sdk') == '30\n'
+    finally:
+        adbClient.close()
@@ -0,0 +1,88 @@
+import asyncio
+import io
+
+from com.dtmilano.android.adb.adbclient import SHELL_V2_STDOUT
+from com.dtmilano.android.adb.asyncadbclient import AsyncAdbClient, aclosing
+
+from conftest import SERIALNO
+from test_adbclient_snapshot import HEIGHT, WIDTH, framebuffer
+
+
+def test_create_and_shell(adbserver):
+    adbserver.shell['echo hi'] = 'hi\n'
+
+    async def run():
+        client = await AsyncAdbClient.create(SERIALNO, '127.0.0.1', adbserver.port)
+        assert client.getSdkVersion() == 30
+        assert client.display == {'width': 1080, 'height': 1920, 'orientation': 0, 'density': 420 / 160.0}
+        assert await client.getProperty('display.width') == 1080
+        assert await client.shell('echo hi') == 'hi\n'
+        await client.touch(10, 20)
+        await client.drag((10, 20), (30, 40), 500)
+
+    asyncio.run(run())
+    assert 'shell,v2,raw:input tap 10 20' in adbserver.requests
+    assert 'shell,v2,raw:input touchscreen swipe 10 20 30 40 500' in adbserver.requests
+
+
+def test_get_devices(adbserver):
+    devices = asyncio.run(AsyncAdbClient(hostname='127.0.0.1', port=adbserver.port).getDevices())
+    assert [(d.serialno, d.status) for d in devices] == [(SERIALNO, 'device')]
+
+
+def test_bounded_concurrency(adbserver):
+    adbserver.shell['true'] = ''
+
+    async def run():
+        clients = await AsyncAdbClient.createForAllDevices('127.0.0.1', adbserver.port, concurrency=2)
+        assert len(clients) == 1
+        client = clients[0]
+        adbserver.maxActive = 0
+        await asyncio.gather(*[client.shell('true') for _ in range(20)])
+
+    asyncio.run(run())
+    assert 1 <= adbserver.maxActive <= 2
+
+
+def test_shell_v2_closed_early_releases_the_connection(adbserver):
+    adbserver.shell['cat big'] = 'x' * 100000
+
+    async def run():
+        clients = await AsyncAdbClient.createForAllDevices('127.0.0.1', adbserver.port, concurrency=1)
+        client = clients[0]
+        async with aclosing(client.shell_v2('cat big')) as packets:
+            async for packetId, data in packets:
+                assert packetId == SHELL_V2_STDOUT
+                break
+        assert not client.semaphore.locked()
+        return await asyncio.wait_for(client.shell('cat big'), 5)
+
+    assert len(asyncio.run(run())) == 100000
+
+
+def test_take_snapshot(adbserver):
+    adbserver.framebuffer = framebuffer(WIDTH, HEIGHT)
+
+    async def run():
+        client = await AsyncAdbClient.create(SERIALNO, '127.0.0.1', adbserver.port)
+        return await client.takeSnapshot(box=(300, 100, 310, 120))
+
+    image = asyncio.run(run())
+    assert image.size == (10, 20)
+    assert image.getpixel((0, 0)) == (300 % 256, 100, 7, 255)
+
+
+def test_take_snapshot_screencap(adbserver):
+    from PIL import Image
+    png = io.BytesIO()
+    Image.new('RGB', (WIDTH, HEIGHT), (1, 2, 3)).save(png, 'PNG')
+    adbserver.shell['/system/bin/screencap -p'] = png.getvalue()
+
+    async def run():
+        client = await AsyncAdbClient.create(SERIALNO, '127.0.0.1', adbserver.port)
+        client.build['ro.build.version.sdk'] = 22
+        return await client.takeSnapshot()
+
+    image = asyncio.run(run())
+    assert image.size == (WIDTH, HEIGHT) and image.getpixel((10, 20)) == (1, 2, 3)
+    assert 'exec:/system/bin/screencap -p' in adbserver.requests
@@ -0,0 +1,138 @@
+import time
+
+import pytest
+
+from conftest import hierarchy
+from test_dump_settle import DUMP
+from test_window_parser import WINDOWS, dumpsys
+
+
+@pytest.fixture
+def vc(adbserver, viewclient):
+    adbserver.shell['dumpsys window windows'] = dumpsys(WINDOWS, 'ccc3')
+    adbserver.shell[DUMP % '--compressed'] = hierarchy(3)
+    viewclient.dumpCacheTtl = 60
+    return viewclient
+
+
+def dumps(adbserver):
+    return sum(1 for r in adbserver.requests if r.endswith(DUMP % '--compressed'))
+
+
+def focusRequests(adbserver):
+    return sum(1 for r in adbserver.requests if r.endswith('dumpsys window windows'))
+
+
+def test_dump_cache_disabled(adbserver, viewclient):
+    adbserver.shell[DUMP % '--compressed'] = hierarchy(3)
+    assert viewclient.dumpCacheTtl == 0
+    viewclient.dump(sleep=0)
+    viewclient.dump(sleep=0)
+    assert dumps(adbserver) == 2
+    assert (viewclient.dumpCacheHits, viewclient.dumpCacheMisses) == (0, 0)
+
+
+def test_dump_cache(adbserver, vc):
+    views = vc.dump(sleep=0)
+    start = time.monotonic()
+    assert vc.dump() is views
+    assert vc.dump(sleep=0) is views
+    # no sleep when the previous dump is used
+    assert time.monotonic() - start < 0.5
+    assert dumps(adbserver) == 1
+    assert (vc.dumpCacheHits, vc.dumpCacheMisses) == (2, 1)
+
+
+def test_dump_cache_invalidated_by_input(adbserver, vc):
+    vc.dump(sleep=0)
+    vc.device.press('BACK')
+    vc.dump(sleep=0)
+    vc.device.type('hello')
+    vc.dump(sleep=0)
+    vc.dump(sleep=0)
+    assert dumps(adbserver) == 3
+    assert (vc.dumpCacheHits, vc.dumpCacheMisses) == (1, 3)
+
+
+def test_dump_cache_invalidated_by_focus(adbserver, vc):
+    vc.dump(sleep=0)
+    vc.dump(sleep=0)
+    adbserver.shell['dumpsys window windows'] = dumpsys(WINDOWS, 'aaa1')
+    vc.dump(sleep=0)
+    assert dumps(adbserver) == 2
+
+
+def test_dump_cache_not_invalidated_by_force_stop_or_wake(adbserver, vc):
+    adbserver.shell['dumpsys window policy'] = 'mScreenOnFully=true\n'
+    vc.dump(sleep=0)
+    vc.device.forceStop('com.example')
+    vc.device.wake()
+    vc.dump(sleep=0)
+    assert dumps(adbserver) == 1
+    adbserver.shell['dumpsys window policy'] = 'mScreenOnFully=false\n'
+    vc.device.wake()
+    vc.dump(sleep=0)
+    assert dumps(adbserver) == 2
+
+
+def test_dump_cache_expires(adbserver, vc):
+    vc.dumpCacheTtl = 0.2
+    vc.dump(sleep=0)
+    time.sleep(0.25)
+    vc.dump(sleep=0)
+    assert dumps(adbserver) == 2
+
+
+def test_dump_cache_focus_only_when_needed(adbserver, vc):
+    vc.dump(sleep=0)
+    assert focusRequests(adbserver) == 0
+    # the focused window obtained by the first check is kept for the next ones
+    vc.dump(sleep=0)
+    vc.dump(sleep=0)
+    assert focusRequests(adbserver) == 2 and dumps(adbserver) == 1
+    # the input invalidates the dump without obtaining the focused window
+    vc.device.press('BACK')
+    vc.dump(sleep=0)
+    assert focusRequests(adbserver) == 2 and dumps(adbserver) == 2
+    vc.dump(sleep=0)
+    # the focused window obtained by the check is the one kept for the new dump
+    adbserver.shell['dumpsys window windows'] = dumpsys(WINDOWS, 'aaa1')
+    vc.dump(sleep=0)
+    assert focusRequests(adbserver) == 4 and dumps(adbserver) == 3
+    vc.dump(sleep=0)
+    assert focusRequests(adbserver) == 5 and dumps(adbserver) == 3
+
+
+def test_dump_cache_invalidated_by_incremental_set_views(adbserver, vc):
+    vc.incremental = True
+    vc.dump(sleep=0)
+    root = vc.root
+    vc.setViewsFromUiAutomatorDump(hierarchy(4))
+    # the previous root is kept by the merge but the tree changed
+    assert vc.root is root and len(vc.views) == 5
+    assert len(vc.dump(sleep=0)) == 4
+    assert dumps(adbserver) == 2 and vc.root is root
+
+
+def test_dump_cache_settle(adbserver, vc):
+    vc.dump(sleep=0)
+    vc.dump(settle=True, settleCount=2)
+    assert dumps(adbserver) == 3
+    vc.dump(sleep=0)
+    assert dumps(adbserver) == 3 and vc.dumpCacheHits == 1
+
+
+def test_ui_automator_helper_input_count():
+    from com.dtmilano.android.uiautomator.uiautomatorhelper import UiAutomatorHelper
+
+    class Api:
+        def __getattr__(self, name):
+            return lambda *args, **kwargs: type('StatusResponse', (), {'status': 'OK'})
+
+    helper = UiAutomatorHelper(adb='/bin/true')
+    helper.api_instance = Api()
+    helper.ui_device.press_back()
+    helper.ui_device.click(10, 20)
+    helper.ui_object2.set_text(1, 'text')
+    helper.ui_device.wait_for_idle()
+    assert helper.inputCount == 3
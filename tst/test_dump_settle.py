@@ -0,0 +1,44 @@
+import itertools
+
+from conftest import hierarchy
+from test_wait import changing
+from test_window_parser import WINDOWS, dumpsys
+
+DUMP = ('cp /dev/null /storage/self/primary/window_dump.xml && uiautomator dump %s '
+        '/storage/self/primary/window_dump.xml >/dev/null && cat /storage/self/primary/window_dump.xml')
+
+
+def requests(adbserver, compressed):
+    return sum(1 for r in adbserver.requests if r.endswith(DUMP % compressed))
+
+
+def test_dump_settle(adbserver, viewclient):
+    adbserver.shell['dumpsys window windows'] = dumpsys(WINDOWS, 'ccc3')
+    adbserver.shell[DUMP % '--compressed'] = changing([hierarchy(1), hierarchy(2), hierarchy(3)])
+    adbserver.shell[DUMP % ''] = hierarchy(7)
+    viewclient.compressedDump = False
+    views = viewclient.dump(settle=True)
+    stability = viewclient.lastSettle
+    assert stability.stable and stability.samples == 5 and stability.elapsed > 0
+    assert stability.value[0] == 'com.example/com.example.Main'
+    # settled on the compressed snapshots, the result is the full dump
+    assert requests(adbserver, '--compressed') == 5 and requests(adbserver, '') == 1
+    assert len(views) == 8 and not viewclient.compressedDump
+
+
+def test_dump_settle_compressed(adbserver, viewclient):
+    assert viewclient.compressedDump
+    adbserver.shell[DUMP % '--compressed'] = hierarchy(2)
+    views = viewclient.dump(settle=True, settleCount=2)
+    assert viewclient.lastSettle.stable and viewclient.lastSettle.samples == 2
+    assert requests(adbserver, '--compressed') == 2 and len(views) == 3
+
+
+def test_dump_settle_timeout(adbserver, viewclient):
+    counter = itertools.count(1)
+    adbserver.shell[DUMP % '--compressed'] = lambda: hierarchy(next(counter))
+    adbserver.shell[DUMP % ''] = hierarchy(1)
+    viewclient.compressedDump = False
+    viewclient.dump(settle=True, settleTimeout=0.3)
+    assert not viewclient.lastSettle.stable and viewclient.lastSettle.elapsed >= 0.3
+    assert len(viewclient.views) == 2
@@ -1,5 +1,8 @@
+import random
+
 import pytest
 
+from com.dtmilano.android.distance import banded_levenshtein_distance, levenshtein_distance, token_distance
 from com.dtmilano.android.viewclient import ViewClient
 
 
@@ -21,3 +24,68 @@ def test_levenshtein_distance():
     assert ViewClient.levenshtein_distance(b"hippo", "zzzzzzzz") == 8
     assert ViewClient.levenshtein_distance(b"hippo", b"zzzzzzzz") == 8
     assert ViewClient.levenshtein_distance("hello", "hallo") == 1
+
+
+def dynamic_programming(s, t):
+    p = list(range(len(s) + 1))
+    for j in range(1, len(t) + 1):
+        d = [j] + [0] * len(s)
+        for i in range(1, len(s) + 1):
+            d[i] = min(d[i - 1] + 1, p[i] + 1, p[i - 1] + (s[i - 1] != t[j - 1]))
+        p = d
+    return p[-1]
+
+
+def mutate(r, s, n):
+    s = list(s)
+    for _ in range(n):
+        i = r.randrange(len(s) + 1)
+        op = r.randrange(3)
+        if op == 0:
+            s.insert(i, 'z')
+        elif op == 1 and i < len(s):
+            del s[i]
+        elif i < len(s):
+            s[i] = 'y'
+    return ''.join(s)
+
+
+def test_matches_dynamic_programming():
+    r = random.Random(2)
+    for _ in range(500):
+        s = ''.join(r.choice('abc') for _ in range(r.randint(0, 150)))
+        t = mutate(r, s, r.randint(0, 20)) if r.random() < 0.5 else ''.join(
+            r.choice('abc') for _ in range(r.randint(0, 150)))
+        d = dynamic_programming(s, t)
+        assert levenshtein_distance(s, t) == d
+        for k in (0, 2, 10, 100):
+            assert levenshtein_distance(s, t, k) == min(d, k + 1)
+            assert banded_levenshtein_distance(s, t, k) == min(d, k + 1)
+
+
+def test_max_distance():
+    assert levenshtein_distance("kitten", "sitting", 3) == 3
+    assert levenshtein_distance("kitten", "sitting", 2) == 3
+    assert levenshtein_distance("a", "abcdef", 2) == 3
+    with pytest.raises(ValueError):
+        levenshtein_distance("a", "b", -1)
+
+
+def test_token_distance():
+    assert token_distance([], []) == 0
+    assert token_distance(['Button-1', 'TextView-2'], ['Button-1', 'TextView-2']) == 0
+    assert token_distance(['Button-1', 'TextView-2', 'TextView-3'], ['Button-1', 'EditText-4', 'TextView-3']) == 1
+    assert token_distance([('a', 1), ('b', 2)], [('b', 2)], max_distance=0) == 1
+
+
+def test_large_input():
+    r = random.Random(3)
+    s = ''.join(r.choice('abcdefghij') for _ in range(20000))
+    t = mutate(r, s, 40)
+    d = dynamic_programming(s[:2000], t[:2000])
+    assert levenshtein_distance(s[:2000], t[:2000]) == d
+    assert banded_levenshtein_distance(s[:2000], t[:2000], 40) == min(d, 41)
+    d = levenshtein_distance(s, t)
+    assert 0 < d <= 40
+    assert levenshtein_distance(s, t, max_distance=10) == 11
+    assert banded_levenshtein_distance(s, t, 40) == d
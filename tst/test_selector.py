@@ -0,0 +1,87 @@
+import re
+
+import pytest
+
+from com.dtmilano.android.selector import compileSelector
+
+from conftest import hierarchy
+
+
+def node(cls, rid='', text='', bounds='[0,0][100,100]', clickable='false', children=''):
+    return ('<node index="0" text="%s" resource-id="%s" class="%s" package="com.example" content-desc="" '
+            'checkable="false" checked="false" clickable="%s" enabled="true" focusable="false" focused="false" '
+            'scrollable="false" long-clickable="false" password="false" selected="false" bounds="%s">%s</node>' % (
+                text, rid, cls, clickable, bounds, children))
+
+
+OK = node('android.widget.Button', rid='com.example:id/ok', text='OK', bounds='[0,200][0,200]')
+LIST = node('android.widget.LinearLayout', rid='com.example:id/list', bounds='[0,0][1080,1000]', children=(
+    node('android.widget.TextView', rid='com.example:id/title', text='One', clickable='true') +
+    node('android.widget.TextView', rid='com.example:id/title', text='Two', bounds='[0,100][100,200]') +
+    node('android.widget.LinearLayout', children=OK)))
+XML = ("<?xml version='1.0' encoding='UTF-8' standalone='yes' ?><hierarchy rotation=\"0\">" +
+       node('android.widget.FrameLayout', bounds='[0,0][1080,1920]', children=(
+           LIST + node('android.widget.TextView', rid='com.example:id/title', text='Three',
+                       bounds='[0,1000][1080,1920]'))) +
+       '</hierarchy>')
+
+
+@pytest.fixture
+def vc(viewclient):
+    viewclient.setViewsFromUiAutomatorDump(XML)
+    return viewclient
+
+
+def texts(views):
+    return [v.getText() for v in views]
+
+
+def test_class_id_and_attributes(vc):
+    assert texts(vc.query('TextView')) == ['One', 'Two', 'Three']
+    assert texts(vc.query('android.widget.TextView[text="Two"]')) == ['Two']
+    assert texts(vc.query('#title')) == ['One', 'Two', 'Three']
+    assert texts(vc.query('#com.example:id/title[text!=One]')) == ['Two', 'Three']
+    assert texts(vc.query('[text~="^T"]')) == ['Two', 'Three']
+    assert texts(vc.query("[text^=T][text$='e']")) == ['Three']
+    assert texts(vc.query('*[text*=w]')) == ['Two']
+    assert vc.query('[text]', mode='count') == 7
+    assert vc.query('#ok', mode='first').getText() == 'OK'
+
+
+def test_combinators_and_pseudo_classes(vc):
+    assert texts(vc.query('#list > TextView')) == ['One', 'Two']
+    assert texts(vc.query('#list Button')) == ['OK']
+    assert vc.query('#list > Button') == []
+    assert texts(vc.query('FrameLayout > TextView, Button')) == ['OK', 'Three']
+    assert texts(vc.query('TextView:clickable')) == ['One']
+    assert texts(vc.query('#list > *:index(1)')) == ['Two']
+    assert texts(vc.query('TextView:contains(50,150)')) == ['Two']
+    assert texts(vc.query('[text!=""]:within(0,0,100,200)')) == ['One', 'Two', 'OK']
+    assert texts(vc.query('[text!=""]:within(0,0,100,200):visible')) == ['One', 'Two']
+
+
+def test_modes_and_root(vc):
+    assert vc.query('TextView', mode='first').getText() == 'One'
+    assert vc.query('TextView', mode='count') == 3
+    assert vc.query('Button, TextView', mode='first').getText() == 'One'
+    assert vc.query('EditText', mode='first') is None
+    lst = vc.findViewById('com.example:id/list')
+    assert texts(vc.query('TextView', root=lst)) == ['One', 'Two']
+    # the ancestors are only checked up to the root
+    assert vc.query('FrameLayout TextView', root=lst) == []
+    with pytest.raises(ValueError):
+        vc.query('TextView', mode='last')
+
+
+def test_compiled_once():
+    assert compileSelector('#list > TextView') is compileSelector('#list > TextView')
+    for invalid in ('', 'TextView[', '[text=', ':unknown', ':index(a)', '[text~="("]', 'A > > B'):
+        with pytest.raises(ValueError):
+            compileSelector(invalid)
+
+
+def test_uses_index(vc):
+    vc.setViewsFromUiAutomatorDump(hierarchy(2000))
+    assert vc.query('#com.example:id/item[text="Item 1999 é"]', mode='count') == 1
+    assert len(vc.query('TextView:contains(5,19995)')) == 1
+    assert vc.query('TextView:contains(5,19995)') == vc.findViewsContainingPoint((5, 19995))
@@ -0,0 +1,66 @@
+import time
+
+from com.dtmilano.android.distance import tree_distance
+from com.dtmilano.android.viewclient import ViewClient
+
+from conftest import hierarchy
+
+HEADER = "<?xml version='1.0' encoding='UTF-8' standalone='yes' ?><hierarchy rotation=\"0\">"
+
+
+def node(cls, text='', children=''):
+    return '<node index="0" text="%s" resource-id="" class="%s" bounds="[0,0][10,10]">%s</node>' % (
+        text, cls, children)
+
+
+def dump(viewclient, items, title='Title'):
+    viewclient.setViewsFromUiAutomatorDump(HEADER + node('android.widget.FrameLayout', children=(
+        node('android.widget.TextView', text=title) + node('android.widget.LinearLayout', children=''.join(
+            node('android.widget.TextView', text=item) for item in items)))) + '</hierarchy>')
+    return viewclient.views
+
+
+def test_subtree_hashes(viewclient):
+    tree1 = dump(viewclient, ['a', 'b'])
+    hash1 = viewclient.getTreeHash()
+    tree2 = dump(viewclient, ['a', 'b'])
+    assert tree2[0] is not tree1[0]
+    assert viewclient.getTreeHash() == hash1
+    assert tree2[3].getSubtreeHash() == tree1[3].getSubtreeHash()
+    assert tree2[3].getSubtreeHash() != tree2[4].getSubtreeHash()
+    # the generated ids are not part of the hash
+    (a1, a2) = dump(viewclient, ['a', 'a'])[3:]
+    assert a1.getUniqueId() != a2.getUniqueId()
+    assert a1.getSubtreeHash() == a2.getSubtreeHash() == tree1[3].getSubtreeHash()
+    dump(viewclient, ['a', 'c'])
+    assert viewclient.getTreeHash() != hash1
+    assert viewclient.views[1].getSubtreeHash() == tree1[1].getSubtreeHash()
+    # hashes are invalidated when the tree changes
+    tree1[3].add(tree1[4].__class__(dict(tree1[4].map), None, context=tree1[4].context))
+    assert tree1[0].subtreeHash is None
+    assert tree1[0].getSubtreeHash() != hash1
+
+
+def test_tree_distance(viewclient):
+    tree1 = dump(viewclient, ['a', 'b'])
+    assert ViewClient.distance(tree1, dump(viewclient, ['a', 'b'])) == 0
+    assert tree_distance(tree1[0], dump(viewclient, ['a', 'x'])[0]) == 1
+    assert tree_distance(tree1[0], dump(viewclient, ['a', 'b', 'c'])[0]) == 1
+    assert tree_distance(tree1[0], dump(viewclient, ['b'])[0]) == 1
+    assert tree_distance(tree1[0], dump(viewclient, ['c'])[0]) == 2
+    assert tree_distance(tree1[0], dump(viewclient, ['a', 'b'], title='T')[0]) == 1
+    tree2 = dump(viewclient, ['x', 'y', 'z'], title='T')
+    assert ViewClient.distance(tree1, tree2) == 4 / 11.0
+    viewclient.setViewsFromUiAutomatorDump(hierarchy(3))
+    assert viewclient.distanceTo(tree1) == 1.0
+    assert ViewClient.distance([], []) == 0.0
+    assert ViewClient.distance(tree1, []) == 1.0
+
+
+def test_equal_trees_are_compared_by_hash(viewclient):
+    viewclient.setViewsFromUiAutomatorDump(hierarchy(3000))
+    tree1 = viewclient.views
+    viewclient.setViewsFromUiAutomatorDump(hierarchy(3000))
+    start = time.time()
+    assert viewclient.distanceTo(tree1) == 0
+    assert (time.time() - start) < 0.01
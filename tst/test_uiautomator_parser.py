@@ -0,0 +1,81 @@
+import pickle
+import time
+
+import pytest
+
+from com.dtmilano.android.viewclient import UiAutomator2AndroidViewClient, EditText
+
+from conftest import hierarchy
+
+
+def parser():
+    return UiAutomator2AndroidViewClient(None, 30, None)
+
+
+def test_parse_in_chunks_ignoring_prefix_and_trailing_junk():
+    xml = ('WARNING: linker: something\r\n' + hierarchy(50) + '\nKilled\n').encode('utf-8')
+    p = parser()
+    for i in range(0, len(xml), 7):
+        p.feed(xml[i:i + 7])
+    root = p.close()
+    assert p.complete
+    assert p.prefix == b'WARNING: linker: something\r\n'
+    assert len(p.views) == 51
+    assert len(root.children) == 50
+    assert p.views[3].getText() == 'Item 2 é'
+    assert p.views[3].getCoords() == ((0, 20), (1080, 30))
+
+
+def test_parse_str_as_before():
+    views = parser()
+    root = views.Parse(hierarchy(10))
+    assert [v.getUniqueId() for v in views.views][:2] == ['id/no_id/1', 'id/no_id/2']
+    assert root.getCoords() == ((0, 0), (1080, 1920))
+
+
+def test_parse_without_xml():
+    p = parser()
+    p.feed(b'ERROR: could not get idle state.\n')
+    assert p.prefix == b'ERROR: could not get idle state.\n'
+    with pytest.raises(ValueError):
+        p.close()
+
+
+def test_parse_truncated():
+    with pytest.raises(RuntimeError):
+        parser().Parse(hierarchy(10)[:-20])
+
+
+def test_benchmark_parse_3000_nodes():
+    xml = hierarchy(3000).encode('utf-8')
+    chunks = [xml[i:i + 64 * 1024] for i in range(0, len(xml), 64 * 1024)]
+    start = time.perf_counter()
+    p = parser()
+    p.Parse(chunks)
+    elapsed = time.perf_counter() - start
+    assert len(p.views) == 3001
+    print('\n3000 nodes parsed in %.1f ms' % (elapsed * 1e3))
+
+
+def test_views_share_the_context_and_have_no_dict():
+    p = parser()
+    p.Parse(hierarchy(3))
+    (root, view) = (p.views[0], p.views[2])
+    assert not hasattr(view, '__dict__')
+    assert view.context is root.context
+    assert view.version == 30 and view.build['ro.build.version.sdk'] == 30
+    assert view.textProperty == 'text'
+    assert view.getText() == 'Item 1 é'
+    assert view.getResourceId() == 'com.example:id/item'
+    assert view.isClickable() is True
+    assert view.parent is root and view.windows == {}
+    assert EditText.clone(view).getClass() == 'android.widget.EditText'
+    copied = pickle.loads(pickle.dumps(view))
+    assert copied.getText() == view.getText() and copied.version == 30
+
+
+def test_dump_is_received_with_exec_out(adbserver, viewclient):
+    from test_dump_settle import DUMP
+    adbserver.shell[DUMP % '--compressed'] = hierarchy(5)
+    assert len(viewclient.dump(sleep=0)) == 6
+    assert [r for r in adbserver.requests if r.startswith(('exec:', 'shell'))][-1] == 'exec:' + DUMP % '--compressed'
@@ -0,0 +1,59 @@
+import re
+
+import pytest
+
+XML = '''<?xml version='1.0' encoding='UTF-8' standalone='yes' ?><hierarchy rotation="0">
+<node index="0" text="" resource-id="" class="android.widget.FrameLayout" content-desc="" bounds="[0,0][1080,1920]">
+  <node index="0" text="" resource-id="com.example:id/list" class="android.widget.LinearLayout" content-desc=""
+        bounds="[0,0][1080,1000]">
+    <node index="0" text="OK" resource-id="com.example:id/button" class="android.widget.Button" content-desc="ok"
+          bounds="[0,0][100,100]" />
+    <node index="1" text="Cancel" resource-id="com.example:id/button" class="android.widget.Button"
+          content-desc="" bounds="[100,0][200,100]" />
+  </node>
+  <node index="1" text="" resource-id="com.example:id/footer" class="android.widget.LinearLayout" content-desc=""
+        bounds="[0,1000][1080,1920]">
+    <node index="0" text="OK" resource-id="com.example:id/button" class="android.widget.Button" content-desc=""
+          bounds="[0,1000][100,1100]" />
+  </node>
+</node>
+</hierarchy>'''
+
+
+@pytest.fixture
+def vc(viewclient):
+    viewclient.setViewsFromUiAutomatorDump(XML)
+    return viewclient
+
+
+def test_find_exact(vc):
+    ok = vc.findViewWithText('OK')
+    assert ok.getUniqueId() == 'id/no_id/3'
+    assert vc.findViewWithContentDescription('ok') is ok
+    assert vc.findViewWithText('Nothing') is None
+    assert [v.getText() for v in vc.findViewsWithAttribute('class', 'android.widget.Button')] == ['OK', 'Cancel', 'OK']
+    footer = vc.findViewById('com.example:id/footer')
+    assert vc.findViewWithText('OK', root=footer).getUniqueId() == 'id/no_id/6'
+    assert vc.findViewWithText('Cancel', root=footer) is None
+    assert vc.findViewsWithAttribute('resource-id', 'com.example:id/button', root=footer) == [footer.children[0]]
+
+
+def test_find_by_id(vc):
+    assert vc.findViewById('com.example:id/button').getText() == 'OK'
+    assert vc.findViewById('com.example:id/button', viewFilter=lambda v: v.getText() == 'Cancel').getText() == 'Cancel'
+    assert vc.findViewById('id/no_id/4').getText() == 'Cancel'
+    assert vc.findViewById('com.example:id/nothing') is None
+
+
+def test_find_regex(vc):
+    assert vc.findViewWithText(re.compile('^Can')).getUniqueId() == 'id/no_id/4'
+    footer = vc.findViewById('com.example:id/footer')
+    assert vc.findViewWithAttributeThatMatches('text', re.compile('^Can'), footer) is None
+    assert len(vc.findViewsWithAttributeThatMatches('resource-id', re.compile('button$'))) == 3
+
+
+def test_index_is_rebuilt_after_dump(vc):
+    assert vc.findViewWithText('Cancel')
+    vc.setViewsFromUiAutomatorDump(XML.replace('Cancel', 'Dismiss'))
+    assert vc.findViewWithText('Cancel') is None
+    assert vc.findViewWithText('Dismiss').getUniqueId() == 'id/no_id/4'
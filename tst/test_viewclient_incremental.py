@@ -0,0 +1,65 @@
+from conftest import hierarchy
+
+HEADER = "<?xml version='1.0' encoding='UTF-8' standalone='yes' ?><hierarchy rotation=\"0\">"
+
+
+def node(cls, rid='', text='', children=''):
+    return '<node index="0" text="%s" resource-id="%s" class="%s" bounds="[0,0][10,10]">%s</node>' % (
+        text, rid, cls, children)
+
+
+def dump(items, title='Title'):
+    return HEADER + node('android.widget.FrameLayout', children=(
+        node('android.widget.TextView', rid='com.example:id/title', text=title) +
+        node('android.widget.LinearLayout', rid='com.example:id/list', children=''.join(
+            node('android.widget.TextView', text=item) for item in items)))) + '</hierarchy>'
+
+
+def test_views_keep_their_identity(viewclient):
+    viewclient.incremental = True
+    viewclient.setViewsFromUiAutomatorDump(dump(['a', 'b']))
+    assert len(viewclient.changes.added) == 5
+    title = viewclient.findViewById('com.example:id/title')
+    lst = viewclient.findViewById('com.example:id/list')
+    (a, b) = lst.children
+
+    viewclient.setViewsFromUiAutomatorDump(dump(['a', 'b']))
+    assert not viewclient.changes
+    assert viewclient.findViewById('com.example:id/title') is title
+
+    viewclient.setViewsFromUiAutomatorDump(dump(['a', 'x', 'c'], title='New title'))
+    changes = viewclient.changes
+    assert viewclient.findViewById('com.example:id/title') is title
+    assert title.getText() == 'New title'
+    assert lst.children[:2] == [a, b]
+    assert b.getText() == 'x'
+    assert [v.getText() for v in changes.added] == ['c']
+    assert changes.removed == []
+    assert changes.modified == [title, b]
+    assert viewclient.views == [viewclient.root, title, lst, a, b, lst.children[2]]
+    assert all(v.parent is lst for v in lst.children)
+    # the index is rebuilt for the merged tree
+    assert viewclient.findViewWithText('c') is lst.children[2]
+
+    viewclient.setViewsFromUiAutomatorDump(dump(['a']))
+    assert viewclient.changes.removed == [b] + [v for v in viewclient.changes.removed if v.getText() == 'c']
+    assert len(viewclient.changes.removed) == 2
+    assert viewclient.findViewWithText('x') is None
+
+
+def test_unrelated_tree_is_replaced(viewclient):
+    viewclient.incremental = True
+    viewclient.setViewsFromUiAutomatorDump(dump(['a']))
+    previous = viewclient.views
+    viewclient.setViewsFromUiAutomatorDump(hierarchy(3))
+    assert viewclient.changes.removed == previous
+    assert viewclient.changes.added == viewclient.views
+    assert viewclient.root is not previous[0]
+
+
+def test_not_incremental(viewclient):
+    viewclient.setViewsFromUiAutomatorDump(dump(['a']))
+    title = viewclient.findViewById('com.example:id/title')
+    viewclient.setViewsFromUiAutomatorDump(dump(['a']))
+    assert viewclient.changes is None
+    assert viewclient.findViewById('com.example:id/title') is not title
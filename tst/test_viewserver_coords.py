@@ -0,0 +1,147 @@
+import pytest
+
+from conftest import hierarchy
+
+DUMPSYS_WINDOW_WINDOWS = '''WINDOW MANAGER WINDOWS (dumpsys window windows)
+  Window #1 Window{4d3c2b1 u0 StatusBar}:
+    mViewVisibility=0x0 mHaveFrame=true
+    Frames: containing=[0,0][1080,63] parent=[0,0][1080,63]
+        display=[0,0][1080,63]
+        content=[0,0][1080,63] visible=[0,0][1080,63]
+    mPolicyVisibility=true mAppOpVisibility=true
+  Window #0 Window{abc123 u0 com.example/com.example.Main}:
+    mViewVisibility=0x0 mHaveFrame=true
+    Frames: containing=[0,0][1080,1920] parent=[0,0][1080,1920]
+        display=[0,0][1080,1920]
+        content=[0,63][1080,1920] visible=[0,63][1080,1920]
+    mPolicyVisibility=true mAppOpVisibility=true
+
+  mCurrentFocus=Window{abc123 u0 com.example/com.example.Main}
+'''
+
+
+def line(depth, cls, oid, left, top, width, height):
+    attrs = {'getVisibility()': 'VISIBLE', 'layout:mLeft': str(left), 'layout:mTop': str(top),
+             'layout:getWidth()': str(width), 'layout:getHeight()': str(height)}
+    return ' ' * depth + '%s@%x mID=5,NO_ID ' % (cls, oid) + ' '.join(
+        '%s=%d,%s' % (k, len(v), v) for k, v in attrs.items())
+
+
+def tree(n):
+    lines = [line(0, 'com.android.internal.policy.DecorView', 1, 0, 0, 1080, 1857),
+             line(1, 'android.widget.LinearLayout', 2, 0, 100, 1080, 1757)]
+    lines += [line(2, 'android.widget.TextView', 3 + i, 10, i * 10, 100, 10) for i in range(n)]
+    return '\n'.join(lines + ['DONE'])
+
+
+@pytest.fixture
+def vc(adbserver, viewclient):
+    adbserver.shell['dumpsys window windows'] = DUMPSYS_WINDOW_WINDOWS
+    viewclient.useUiAutomator = False
+    viewclient.forceViewServerUse = True
+    viewclient.setViews(tree(200))
+    return viewclient
+
+
+def dumpsysCount(adbserver):
+    return sum(1 for r in adbserver.requests if r.endswith('dumpsys window windows'))
+
+
+def test_window_geometry_obtained_once_per_dump(adbserver, vc):
+    coords = [v.getXY() for v in vc.views]
+    # the status bar offset is subtracted as its height is the top of the focused window
+    assert coords[0] == (0, 0)
+    assert coords[1] == (0, 100)
+    assert coords[5] == (10, 130)
+    assert dumpsysCount(adbserver) == 1
+    assert vc.views[5].currentFocus == 'abc123'
+    assert vc.views[5].windows['abc123'].wvy == 63
+    vc.setViews(tree(10))
+    vc.views[3].getXY()
+    vc.views[4].getCenter()
+    assert dumpsysCount(adbserver) == 2
+
+
+def test_window_geometry_invalidated_on_rotation(adbserver, vc):
+    vc.views[2].getXY()
+    vc.device.displayState.info = {'width': 1080, 'height': 1920, 'orientation': 0}
+    adbserver.shell['dumpsys input | grep SurfaceOrientation'] = '      SurfaceOrientation: 0\n'
+    vc.device.displayState.refreshOrientation()
+    vc.views[2].getXY()
+    assert dumpsysCount(adbserver) == 1
+    adbserver.shell['dumpsys input | grep SurfaceOrientation'] = '      SurfaceOrientation: 1\n'
+    vc.device.displayState.refreshOrientation()
+    vc.views[2].getXY()
+    assert dumpsysCount(adbserver) == 2
+
+
+def test_layout_positions_calculated_while_parsing(vc):
+    assert vc.views[0].layoutXY == (0, 0)
+    assert vc.views[1].layoutXY == (0, 100)
+    assert vc.views[5].layoutXY == (10, 130)
+    coords = [v.getCoords() for v in vc.views]
+    for v in vc.views:
+        v.layoutXY = None
+    assert [v.getCoords() for v in vc.views] == coords
+    assert vc.views[5].containsPoint((50, 135))
+    assert not vc.views[5].containsPoint((50, 145))
+    assert vc.findViewsContainingPoint((50, 135)) == vc.views[:2] + [vc.views[5]]
+
+
+def test_skipped_classes(monkeypatch, adbserver, viewclient):
+    from com.dtmilano.android import viewclient as module
+    monkeypatch.setattr(module, 'SKIP_CERTAIN_CLASSES_IN_GET_XY_ENABLED', True)
+    adbserver.shell['dumpsys window windows'] = DUMPSYS_WINDOW_WINDOWS
+    viewclient.useUiAutomator = False
+    viewclient.forceViewServerUse = True
+    viewclient.setViews('\n'.join([line(0, 'android.widget.FrameLayout', 1, 0, 5, 1080, 1857),
+                                   line(1, 'com.android.internal.widget.ActionBarView', 2, 0, 100, 1080, 100),
+                                   line(2, 'android.widget.TextView', 3, 10, 20, 100, 10), 'DONE']))
+    assert [v.layoutXY for v in viewclient.views] == [(0, 5), (0, 105), (10, 25)]
+    coords = [v.getXY() for v in viewclient.views]
+    for v in viewclient.views:
+        v.layoutXY = None
+    assert [v.getXY() for v in viewclient.views] == coords
+
+
+def rotate(adbserver, orientation):
+    adbserver.shell['dumpsys input | grep SurfaceOrientation'] = '      SurfaceOrientation: %d\n' % orientation
+    adbserver.shell['dumpsys display'] = (
+        '  mViewports=[DisplayViewport{type=INTERNAL, valid=true, isActive=true, displayId=0, orientation=%d, '
+        'logicalFrame=Rect(0, 0 - 1080, 1920), deviceWidth=1080, deviceHeight=1920}]\n' % orientation)
+
+
+def test_window_geometry_dropped_when_the_device_rotates(adbserver, vc):
+    vc.views[2].getXY()
+    assert vc.root.context.windowGeometry is not None
+    rotate(adbserver, 1)
+    vc.device.touch(10, 10, orientation=0)
+    assert vc.root.context.windowGeometry is None
+    vc.views[2].getXY()
+    assert dumpsysCount(adbserver) == 2
+
+
+def probes(adbserver):
+    return sum(1 for r in adbserver.requests if r.endswith('SurfaceOrientation'))
+
+
+def test_window_geometry_probes_the_orientation(adbserver, vc):
+    rotate(adbserver, 0)
+    vc.device.displayState.info = {'width': 1080, 'height': 1920, 'orientation': 0}
+    [v.getXY() for v in vc.views]
+    assert probes(adbserver) == 1
+    vc.setViews(tree(10))
+    rotate(adbserver, 1)
+    vc.views[3].getXY()
+    vc.views[4].getXY()
+    assert probes(adbserver) == 2 and vc.device.displayState.info['orientation'] == 1
+    assert dumpsysCount(adbserver) == 2
+
+
+def test_dump_does_not_probe_the_orientation(adbserver, viewclient):
+    from test_dump_settle import DUMP
+    adbserver.shell[DUMP % '--compressed'] = hierarchy(2)
+    rotate(adbserver, 1)
+    viewclient.dump(sleep=0)
+    viewclient.dump(sleep=0)
+    assert probes(adbserver) == 0
@@ -0,0 +1,56 @@
+import time
+
+from com.dtmilano.android.viewclient import ViewClient
+
+LINES = [
+    'com.android.internal.policy.DecorView@4052ba70 mID=5,NO_ID layout:mLeft=1,0 layout:mTop=1,0',
+    ' android.widget.FrameLayout@4052bb40 mID=18,android:id/content getTag()=4,null',
+    '  android.widget.TextView@4052bc10 mID=7,id/text text:mText=11,Hello  world layout:mLeft=2,10',
+    '  android.widget.TextView@4052bce0 mID=7,id/text text:mText=9,a=1,b id/ layout:mLeft=2,20',
+    '  android.widget.TextView@4052bdb0 mID=5,NO_ID text:mText=3,\U0001F600x mCount=1,3',
+    '  android.view.View@4052be80 mID=5,NO_ID mVisibility=7,VISIBLE\r',
+    'DONE',
+]
+
+
+def parse(viewclient, lines):
+    viewclient.useUiAutomator = False
+    viewclient.setViews('\n'.join(lines))
+    return viewclient.views
+
+
+def test_attributes_are_read_by_length(viewclient):
+    views = parse(viewclient, LINES)
+    assert len(views) == 6
+    assert views[0].map['class'] == 'com.android.internal.policy.DecorView'
+    assert views[0].map['oid'] == '4052ba70'
+    assert views[1].map['getTag()'] == 'null'
+    assert views[2].map['text:mText'] == 'Hello  world'
+    assert views[2].map['layout:mLeft'] == '10'
+    assert views[3].map['text:mText'] == 'a=1,b id/'
+    assert views[3].map['layout:mLeft'] == '20'
+    # the length counts UTF-16 code units
+    assert views[4].map['text:mText'] == '\U0001F600x'
+    assert views[4].map['mCount'] == '3'
+    assert views[5].map['mVisibility'] == 'VISIBLE'
+
+
+def test_unique_ids(viewclient):
+    views = parse(viewclient, LINES)
+    assert [v.map['uniqueId'] for v in views] == ['id/no_id/1', 'id/content', 'id/text', 'id/text/1', 'id/no_id/2',
+                                                 'id/no_id/3']
+    assert set(viewclient.viewsById) == {v.map['uniqueId'] for v in views}
+    # the counters start again with every tree
+    views = parse(viewclient, LINES[:3] + LINES[3:4] * 2)
+    assert [v.map['uniqueId'] for v in views][2:] == ['id/text', 'id/text/1', 'id/text/2']
+
+
+def test_parse_large_tree(viewclient):
+    lines = [LINES[0]] + [' android.widget.TextView@%x mID=5,NO_ID text:mText=%d,%s layout:mLeft=1,0' % (
+        i, len('Item %d' % i), 'Item %d' % i) for i in range(3000)]
+    start = time.time()
+    views = parse(viewclient, lines)
+    elapsed = time.time() - start
+    assert len(views) == 3001
+    assert views[-1].map['uniqueId'] == 'id/no_id/3001'
+    print('parsed %d views in %.1f ms' % (len(views), elapsed * 1000))
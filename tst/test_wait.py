@@ -0,0 +1,87 @@
+import itertools
+import time
+
+import pytest
+
+from com.dtmilano.android.wait import intervals, waitUntil, waitUntilStable
+
+from conftest import hierarchy
+from test_window_parser import WINDOWS, dumpsys
+
+
+def test_intervals():
+    assert list(itertools.islice(intervals(0.1, 2, 0.5), 5)) == [0.1, 0.2, 0.4, 0.5, 0.5]
+    with pytest.raises(ValueError):
+        next(intervals(0.1, 0.5))
+
+
+def test_wait_until():
+    values = iter([None, 0, 'done'])
+    slept = []
+    assert waitUntil(lambda: next(values), interval=0.01, sleep=slept.append) == 'done'
+    assert slept == [0.01, 0.02]
+
+
+def test_wait_until_timeout():
+    start = time.monotonic()
+    assert waitUntil(lambda: [], timeout=0.2, interval=0.01) == []
+    assert 0.2 <= time.monotonic() - start < 1
+
+
+def test_wait_until_stable():
+    values = iter([1, 2, 2, 3, 3, 3, 3])
+    slept = []
+    stability = waitUntilStable(lambda: next(values), count=3, interval=0.01, sleep=slept.append)
+    assert stability.stable and stability.value == 3 and stability.samples == 6
+    # the interval grows while the value is the same and starts again when it changes
+    assert slept == [0.01, 0.01, 0.02, 0.01, 0.02]
+
+
+def test_wait_until_stable_timeout():
+    counter = itertools.count()
+    stability = waitUntilStable(lambda: next(counter), timeout=0.2, interval=0.01)
+    assert not stability.stable and stability.samples > 2 and stability.elapsed >= 0.2
+
+
+def changing(outputs):
+    """
+    Returns the outputs in turn, repeating the last one.
+    """
+    outputs = list(outputs)
+    return lambda: outputs.pop(0) if len(outputs) > 1 else outputs[0]
+
+
+def test_wait_for_idle(adbserver, viewclient):
+    moving = [dumpsys([(1, 'ccc3', 'com.example/com.example.Main', top)], 'ccc3') for top in (500, 300, 100, 63)]
+    adbserver.shell['dumpsys window windows'] = changing(moving)
+    start = time.monotonic()
+    assert viewclient.waitForIdle()
+    assert time.monotonic() - start < 1
+    assert sum(1 for r in adbserver.requests if r.endswith('dumpsys window windows')) == 5
+
+
+def test_wait_for_idle_timeout(adbserver, viewclient):
+    counter = itertools.count()
+    adbserver.shell['dumpsys window windows'] = lambda: dumpsys(WINDOWS, 'ccc3%d' % next(counter))
+    assert not viewclient.waitForIdle(timeout=0.3)
+
+
+def test_dump_idle(adbserver, viewclient):
+    adbserver.shell['dumpsys window windows'] = dumpsys(WINDOWS, 'ccc3')
+    adbserver.shell[uiAutomatorDumpCommand(viewclient)] = hierarchy(3)
+    start = time.monotonic()
+    assert len(viewclient.dump(sleep='idle')) == 4
+    assert time.monotonic() - start < 1
+
+
+def uiAutomatorDumpCommand(vc):
+    return ('cp /dev/null /storage/self/primary/window_dump.xml && uiautomator dump %s '
+            '/storage/self/primary/window_dump.xml >/dev/null && cat /storage/self/primary/window_dump.xml' %
+            ('--compressed' if vc.compressedDump else ''))
+
+
+def test_wait_for_view(adbserver, viewclient):
+    adbserver.shell[uiAutomatorDumpCommand(viewclient)] = changing([hierarchy(1)] * 3 + [hierarchy(5)])
+    view = viewclient.waitForView('TextView[text="Item 4 é"]', timeout=5)
+    assert view is not None and view.getText() == 'Item 4 é'
+    assert viewclient.waitForView('TextView[text="Item 9 é"]', timeout=0.2) is None
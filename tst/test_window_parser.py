@@ -0,0 +1,86 @@
+import time
+
+import pytest
+
+from com.dtmilano.android.window import Windows, parseWindows
+
+from conftest import SERIALNO
+
+
+def window(num, winId, activity, top, visibility='0x0', policy='true', separator=2):
+    return ('  Window #%d Window{%s u0 %s}:\n' % (num, winId, activity) +
+            '    mViewVisibility=%s mHaveFrame=true\n' % visibility +
+            '    Frames: containing=[0,0][1080,1920] parent=[0,%d][1080,1920]\n' % top +
+            '        display=[0,0][1080,1920]\n' * (separator - 1) +
+            '        content=[0,%d][1080,1920] visible=[0,%d][1080,1920]\n' % (top, top) +
+            '    mPolicyVisibility=%s mAppOpVisibility=true\n' % policy)
+
+
+def dumpsys(windows, focus, separator=2):
+    return ('WINDOW MANAGER WINDOWS (dumpsys window windows)\n' +
+            ''.join(window(*w, separator=separator) for w in windows) +
+            '\n  mCurrentFocus=Window{%s u0 focused}\n' % focus)
+
+
+WINDOWS = [(3, 'aaa1', 'StatusBar', 0), (2, 'bbb2', 'com.example/com.example.Dialog', 500, '0x8'),
+           (1, 'ccc3', 'com.example/com.example.Main', 63), (0, 'ddd4', 'Wallpaper', 0, '0x0', 'false')]
+
+
+def test_parse_windows():
+    windows = parseWindows(dumpsys(WINDOWS, 'ccc3'), 30)
+    assert isinstance(windows, Windows)
+    assert list(windows) == ['aaa1', 'bbb2', 'ccc3', 'ddd4']
+    main = windows['ccc3']
+    assert (main.num, main.activity, main.wvx, main.wvy, main.wvw, main.wvh, main.py) == \
+           (1, 'com.example/com.example.Main', 0, 63, 1080, 1857, 63)
+    assert windows['bbb2'].visibility == 8
+    # mPolicyVisibility=false hides the window
+    assert windows['ddd4'].visibility == 8
+    assert windows.currentFocus == 'ccc3'
+    assert windows.getFocusedWindow() is main and main.focused
+    assert not windows['aaa1'].focused
+    assert windows.statusBarDimensions == (1080, 1920)
+    with pytest.raises(TypeError):
+        windows['eee5'] = main
+
+
+def test_parse_windows_invisible_focus():
+    windows = parseWindows(dumpsys(WINDOWS, 'bbb2'), 30)
+    assert windows.currentFocus == 'bbb2'
+    assert windows.getFocusedWindow() is None
+
+
+@pytest.mark.parametrize('sdk, separator', [(16, 1), (17, 2), (30, 2)])
+def test_parse_windows_content_offset_by_sdk(sdk, separator):
+    windows = parseWindows(dumpsys(WINDOWS, 'ccc3', separator=separator), sdk)
+    assert windows['ccc3'].wvy == 63
+    assert windows['bbb2'].wvy == 500
+
+
+def test_parse_windows_unsupported_sdk():
+    with pytest.warns(UserWarning, match='Unsupported Android version 12'):
+        windows = parseWindows(dumpsys(WINDOWS, 'ccc3'), 12)
+    assert windows['ccc3'].visibility == 0 and windows['ccc3'].wvy == 0
+
+
+def test_parse_windows_is_linear():
+    many = [(i, '%x' % (0x1000 + i), 'com.example/.W%d' % i, i) for i in range(4000)]
+    output = dumpsys(many, '1001')
+    start = time.time()
+    windows = parseWindows(output, 30)
+    elapsed = time.time() - start
+    assert len(windows) == 4000 and windows.getFocusedWindow().activity == 'com.example/.W1'
+    assert elapsed < 2
+
+
+def test_adbclient_get_windows(adbserver):
+    from com.dtmilano.android.adb.adbclient import AdbClient
+    adbserver.shell['dumpsys window windows'] = dumpsys(WINDOWS, 'ccc3')
+    device = AdbClient(SERIALNO, hostname='127.0.0.1', port=adbserver.port)
+    try:
+        windows = device.getWindows()
+        assert isinstance(windows, Windows) and len(windows) == 4
+        assert device.getFocusedWindow().winId == 'ccc3'
+        assert device.getFocusedWindowName() == 'com.example/com.example.Main'
+    finally:
+        device.close()